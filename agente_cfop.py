@@ -1,62 +1,139 @@
 import pandas as pd
-import os
+import numpy as np
+import asyncio
+import functools
+import contextlib
+import contextvars
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain.tools import Tool, StructuredTool
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema import SystemMessage
 from dotenv import load_dotenv
 import traceback
 import re
-from typing import Optional
+from typing import AsyncIterator, Callable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+from indices import (
+    COLUNAS_CHAVE_ACESSO, normalizar_chave_acesso, construir_indice_chaves, buscar_no_indice,
+    normalizar_numero_nota, normalizar_numeros_nota, construir_tabela_notas,
+    carregar_indices_compartilhados, IndiceCFOP, normalizar_cfop
+)
+from carregador_dados import (
+    carregar_csv, calcular_versao_dados, ler_csv_em_blocos, ler_colunas_csv, usar_streaming_itens,
+    ESQUEMA_CABECALHO, ESQUEMA_ITENS, ESQUEMA_CFOP, TAMANHO_BLOCO_ITENS, DADOS_COMPARTILHADOS
+)
+from validacao_cfop import (
+    preparar_cabecalho, validar_itens, resultados_por_item, ResumoValidacao,
+    STATUS_CHAVE_NAO_ENCONTRADA, PROCESSOS_VALIDACAO, MINIMO_ITENS_PARALELO,
+    particionar_por_nota, validar_em_paralelo, classificador_natureza
+)
+from validacao_incremental import VALIDACAO_INCREMENTAL, RepositorioValidacoes, validar_incremental
+from roteador_intencoes import ROTEADOR_ATIVO, ORDINAIS, rotear_pergunta, classificar_pergunta
+from cache_respostas import cache_respostas, memorizar_ferramenta
+from backends_llm import MODELO_LLM, obter_llm, modelo_para_tipo
+from formatacao_saida import (
+    FORMATO_SAIDA, FORMATO_DETALHADO, ContadorTokens, formatar_registro, formatar_tabela,
+    separar_colunas, medir_saida
+)
 
 load_dotenv()
 
+# Etapas da inicialização do agente (informadas a `ao_progredir`)
+ETAPA_CARREGANDO = "carregando"
+ETAPA_INDEXANDO = "indexando"
+ETAPA_VALIDANDO = "validando"
+
+# Tipos de evento gerados por `processar_pergunta_stream`
+EVENTO_FERRAMENTA = "ferramenta"
+EVENTO_RESULTADO_FERRAMENTA = "resultado_ferramenta"
+EVENTO_TOKEN = "token"
+EVENTO_RESPOSTA = "resposta"
+EVENTO_ERRO = "erro"
+
+
+class DadosAgente(NamedTuple):
+    """
+    Uma carga dos CSVs com os seus índices
+
+    O agente guarda uma única referência para a carga em uso e a troca numa
+    só atribuição: uma ferramenta nunca vê o cabeçalho de uma carga com os
+    índices de outra. Em `derivados` fica o que é calculado sob demanda a
+    partir desta mesma carga (total de itens no modo streaming, cabeçalho
+    preparado para a validação).
+    """
+    df_cabecalho: pd.DataFrame
+    itens_path: str
+    modo_streaming_itens: bool
+    df_itens: pd.DataFrame
+    df_cfop: pd.DataFrame
+    indice_cfop: IndiceCFOP
+    versao_dados: str
+    indice_chaves: Mapping[str, Tuple[int, str]]
+    ordem_cabecalho: np.ndarray
+    tabela_cabecalho_por_nota: Mapping[str, Tuple[int, int]]
+    ordem_itens: Optional[np.ndarray]
+    tabela_itens_por_nota: Optional[Mapping[str, Tuple[int, int]]]
+    derivados: dict
+
+
+# Carga fixada para a chamada em andamento nesta thread/tarefa: (agente, dados)
+_dados_fixados = contextvars.ContextVar('dados_fixados', default=None)
+
+
+def _campo_dados(nome: str) -> property:
+    """Atributo do agente lido da carga em uso (ver `AgenteValidadorCFOP.dados`)"""
+    return property(lambda self: getattr(self.dados, nome))
+
+
 class AgenteValidadorCFOP:
     """Agente inteligente para validação de CFOP em Notas Fiscais"""
     
-    def __init__(self, cabecalho_path: str, itens_path: str, cfop_path: str):
-        """Inicializa o agente com os dados dos CSVs"""
-        print("\n" + "="*70)
-        print("🔧 INICIALIZANDO AGENTE VALIDADOR CFOP")
-        print("="*70)
-        
-        # Carregar CSVs
-        print(f"📂 Carregando: {cabecalho_path}")
-        self.df_cabecalho = pd.read_csv(cabecalho_path)
-        print(f"   ✅ {len(self.df_cabecalho)} registros de cabeçalho")
-        
-        print(f"📂 Carregando: {itens_path}")
-        self.df_itens = pd.read_csv(itens_path)
-        print(f"   ✅ {len(self.df_itens)} itens")
+    # Prompt do agente: não depende dos dados, é o mesmo para todas as instâncias
+    _prompt_compilado = None
+    
+    # Dados da carga em uso, como atributos do agente
+    df_cabecalho = _campo_dados('df_cabecalho')
+    itens_path = _campo_dados('itens_path')
+    modo_streaming_itens = _campo_dados('modo_streaming_itens')
+    df_itens = _campo_dados('df_itens')
+    df_cfop = _campo_dados('df_cfop')
+    indice_cfop = _campo_dados('indice_cfop')
+    versao_dados = _campo_dados('versao_dados')
+    indice_chaves = _campo_dados('indice_chaves')
+    _ordem_cabecalho = _campo_dados('ordem_cabecalho')
+    tabela_cabecalho_por_nota = _campo_dados('tabela_cabecalho_por_nota')
+    _ordem_itens = _campo_dados('ordem_itens')
+    tabela_itens_por_nota = _campo_dados('tabela_itens_por_nota')
+    
+    def __init__(self, cabecalho_path: str, itens_path: str, cfop_path: str,
+                 modo_streaming_itens: Optional[bool] = None,
+                 ao_progredir: Optional[Callable[[str, int, str], None]] = None,
+                 repositorio_validacoes: Optional[RepositorioValidacoes] = None):
+        """Inicializa o agente com os dados dos CSVs
         
-        print(f"📂 Carregando: {cfop_path}")
-        self.df_cfop = pd.read_csv(cfop_path)
-        print(f"   ✅ {len(self.df_cfop)} códigos CFOP")
+        Com modo_streaming_itens=True (ou arquivo de itens acima do limite
+        configurado em CFOP_LIMITE_ITENS_STREAMING_MB), os itens não são
+        carregados na memória: são lidos em blocos a cada consulta/validação.
         
-        # Mostrar exemplos de CFOPs para debug
-        print(f"   📋 Exemplos de CFOPs no arquivo:")
-        for i, cfop in enumerate(self.df_cfop['CFOP'].head(5)):
-            print(f"      {i+1}. '{cfop}'")
+        `ao_progredir(etapa, percentual, descricao)` é chamada a cada passo
+        da inicialização (usada para informar o progresso no /status).
         
-        # Mostrar colunas disponíveis
-        print(f"   📋 Colunas do cabeçalho: {', '.join(self.df_cabecalho.columns.tolist()[:5])}...")
+        Com `repositorio_validacoes` (resultados gravados do dataset), as notas
+        são validadas já na carga, revalidando só as novas ou alteradas desde
+        o upload anterior (ver `validacao_incremental`).
+        """
+        print("\n" + "="*70)
+        print("🔧 INICIALIZANDO AGENTE VALIDADOR CFOP")
+        print("="*70)
         
-        # Verificar API Key
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("❌ OPENAI_API_KEY não encontrada no .env!")
-        print(f"🔑 API Key encontrada: {api_key[:8]}...{api_key[-4:]}")
+        progredir = ao_progredir or (lambda etapa, percentual, descricao: None)
+        self.aplicar_dados(self.carregar_dados(cabecalho_path, itens_path, cfop_path, modo_streaming_itens,
+                                               progredir, repositorio_validacoes))
         
-        # Configurar LLM
-        print("🤖 Configurando ChatOpenAI...")
+        # Configurar LLM (backend e modelo em CFOP_BACKEND_LLM / CFOP_MODELO_LLM)
+        progredir(ETAPA_INDEXANDO, 90, "Configurando LLM e ferramentas")
+        self.modelo_llm = MODELO_LLM
         try:
-            self.llm = ChatOpenAI(
-                model="gpt-4",
-                temperature=0,
-                openai_api_key=api_key,
-                verbose=True
-            )
+            self.llm = obter_llm(self.modelo_llm)
             print("   ✅ LLM configurado com sucesso")
         except Exception as e:
             print(f"   ❌ Erro ao configurar LLM: {e}")
@@ -65,6 +142,7 @@ class AgenteValidadorCFOP:
         # Criar ferramentas
         print("🛠️ Criando ferramentas...")
         self.tools = self._criar_ferramentas()
+        self._ferramentas = {ferramenta.name: ferramenta for ferramenta in self.tools}
         print(f"   ✅ {len(self.tools)} ferramentas criadas")
         
         # Criar prompt
@@ -75,15 +153,10 @@ class AgenteValidadorCFOP:
         # Criar agente
         print("🤖 Criando agente executor...")
         try:
-            self.agent = create_openai_functions_agent(self.llm, self.tools, self.prompt)
-            self.agent_executor = AgentExecutor(
-                agent=self.agent,
-                tools=self.tools,
-                verbose=True,
-                max_iterations=10,
-                return_intermediate_steps=True,
-                handle_parsing_errors=True
-            )
+            self.agent_executor = self._criar_executor(self.llm)
+            self.agent = self.agent_executor.agent
+            # Executores dos modelos de outros tipos de pergunta (CFOP_MODELOS_POR_TIPO), criados sob demanda
+            self._executores_por_modelo = {}
             print("   ✅ Agente criado com sucesso!")
         except Exception as e:
             print(f"   ❌ Erro ao criar agente: {e}")
@@ -94,6 +167,184 @@ class AgenteValidadorCFOP:
         print("✅ AGENTE INICIALIZADO E PRONTO PARA USO!")
         print("="*70 + "\n")
     
+    def carregar_dados(self, cabecalho_path: str, itens_path: str, cfop_path: str,
+                       modo_streaming_itens: Optional[bool] = None,
+                       ao_progredir: Optional[Callable[[str, int, str], None]] = None,
+                       repositorio_validacoes: Optional[RepositorioValidacoes] = None) -> DadosAgente:
+        """
+        Carrega os CSVs e monta os índices, sem alterar os dados em uso
+        
+        O resultado é aplicado com `aplicar_dados`: numa recarga, o agente
+        continua respondendo com os dados anteriores enquanto os novos são
+        carregados, e mantém LLM, prompt, ferramentas e executor.
+        
+        Args:
+            cabecalho_path, itens_path, cfop_path: Caminhos dos CSVs
+            modo_streaming_itens: Ver `__init__`
+            ao_progredir: Ver `__init__`
+            repositorio_validacoes: Ver `__init__`
+        
+        Returns:
+            Nova carga, ainda não usada pelo agente
+        """
+        progredir = ao_progredir or (lambda etapa, percentual, descricao: None)
+        
+        progredir(ETAPA_CARREGANDO, 5, "Carregando cabeçalho")
+        # Carregar CSVs com esquema de tipos declarado (categorias, chaves como texto)
+        # e cache colunar quando o conteúdo não mudou
+        print(f"📂 Carregando: {cabecalho_path}")
+        df_cabecalho = carregar_csv(cabecalho_path, esquema=ESQUEMA_CABECALHO)
+        print(f"   ✅ {len(df_cabecalho)} registros de cabeçalho")
+        
+        progredir(ETAPA_CARREGANDO, 25, "Carregando itens")
+        if modo_streaming_itens is None:
+            modo_streaming_itens = usar_streaming_itens(itens_path)
+        total_itens = None
+        if modo_streaming_itens:
+            # Só as colunas ficam em memória; os itens são lidos em blocos sob demanda
+            print(f"📂 Itens em modo streaming (blocos de {TAMANHO_BLOCO_ITENS:,} linhas): {itens_path}")
+            df_itens = ler_colunas_csv(itens_path, esquema=ESQUEMA_ITENS)
+        else:
+            print(f"📂 Carregando: {itens_path}")
+            df_itens = carregar_csv(itens_path, esquema=ESQUEMA_ITENS)
+            total_itens = len(df_itens)
+            print(f"   ✅ {len(df_itens)} itens")
+        
+        progredir(ETAPA_CARREGANDO, 55, "Carregando tabela CFOP")
+        print(f"📂 Carregando: {cfop_path}")
+        df_cfop = carregar_csv(cfop_path, esquema=ESQUEMA_CFOP)
+        print(f"   ✅ {len(df_cfop)} códigos CFOP")
+        
+        # Versão dos dados: chave do cache de respostas (muda a cada novo conjunto de CSVs)
+        versao_dados = calcular_versao_dados(cabecalho_path, itens_path, cfop_path)
+        print(f"   🔑 Versão dos dados: {versao_dados}")
+        
+        # Mostrar exemplos de CFOPs para debug
+        print(f"   📋 Exemplos de CFOPs no arquivo:")
+        for i, cfop in enumerate(df_cfop['CFOP'].head(5)):
+            print(f"      {i+1}. '{cfop}'")
+        
+        # Mostrar colunas disponíveis
+        print(f"   📋 Colunas do cabeçalho: {', '.join(df_cabecalho.columns.tolist()[:5])}...")
+        
+        progredir(ETAPA_INDEXANDO, 65, "Indexando chaves de acesso e notas")
+        construir = lambda: self._construir_indices(df_cabecalho, df_itens, modo_streaming_itens)
+        if DADOS_COMPARTILHADOS:
+            # Índices gravados no cache e mapeados em memória: um worker constrói, os demais reaproveitam
+            identificacao = f"{versao_dados}_{'streaming' if modo_streaming_itens else 'memoria'}"
+            indices = carregar_indices_compartilhados(identificacao, construir)
+        else:
+            indices = construir()
+        
+        dados = DadosAgente(
+            df_cabecalho=df_cabecalho,
+            itens_path=itens_path,
+            modo_streaming_itens=modo_streaming_itens,
+            df_itens=df_itens,
+            df_cfop=df_cfop,
+            indice_cfop=IndiceCFOP(df_cfop['CFOP']),
+            versao_dados=versao_dados,
+            indice_chaves=indices['indice_chaves'],
+            ordem_cabecalho=indices['ordem_cabecalho'],
+            tabela_cabecalho_por_nota=indices['tabela_cabecalho_por_nota'],
+            ordem_itens=indices['ordem_itens'],
+            tabela_itens_por_nota=indices['tabela_itens_por_nota'],
+            # Total de itens (streaming: contado na primeira passada) e cabeçalho de validação
+            derivados={} if total_itens is None else {'total_itens': total_itens},
+        )
+        
+        if repositorio_validacoes is not None and VALIDACAO_INCREMENTAL and not modo_streaming_itens:
+            # Só notas novas/alteradas desde o upload anterior passam pelo motor de validação
+            progredir(ETAPA_VALIDANDO, 80, "Validando notas novas ou alteradas")
+            print("✅ Validando notas novas ou alteradas...")
+            with self.fixar_dados(dados):
+                dados.derivados['resumo_validacao'] = validar_incremental(
+                    df_cabecalho, df_itens, dados.ordem_itens, dados.tabela_itens_por_nota,
+                    self._obter_cabecalho_validacao(), repositorio_validacoes
+                )
+        return dados
+    
+    def aplicar_dados(self, dados: DadosAgente):
+        """
+        Passa a responder com os dados de `carregar_dados`
+        
+        A troca é uma única atribuição: chamadas de ferramenta já em andamento
+        terminam com a carga anterior (ver `fixar_dados`) e as seguintes usam
+        a nova. As ferramentas continuam as mesmas; os resultados memorizados
+        sobre os dados anteriores são descartados.
+        """
+        self._dados = dados
+        if hasattr(self, '_ferramentas_memorizadas'):
+            self.limpar_memoria_ferramentas()
+    
+    @property
+    def dados(self) -> DadosAgente:
+        """Carga fixada para a chamada em andamento ou, fora de uma chamada, a carga em uso"""
+        fixados = _dados_fixados.get()
+        if fixados is not None and fixados[0] is self:
+            return fixados[1]
+        return self._dados
+    
+    @contextlib.contextmanager
+    def fixar_dados(self, dados: Optional[DadosAgente] = None):
+        """
+        Fixa uma carga (padrão: a atual) durante o bloco
+        
+        Tudo o que o bloco lê do agente vem da mesma carga, mesmo que uma
+        recarga troque os dados no meio. Blocos aninhados mantêm a carga já
+        fixada.
+        """
+        fixados = _dados_fixados.get()
+        if fixados is not None and fixados[0] is self:
+            yield fixados[1]
+            return
+        
+        dados = dados or self._dados
+        token = _dados_fixados.set((self, dados))
+        try:
+            yield dados
+        finally:
+            _dados_fixados.reset(token)
+    
+    def _com_dados_fixados(self, funcao):
+        """Envolve uma ferramenta para que cada chamada use uma única carga"""
+        @functools.wraps(funcao)
+        def fixada(*args, **kwargs):
+            with self.fixar_dados():
+                return funcao(*args, **kwargs)
+        return fixada
+    
+    def recarregar(self, cabecalho_path: str, itens_path: str, cfop_path: str,
+                   modo_streaming_itens: Optional[bool] = None,
+                   ao_progredir: Optional[Callable[[str, int, str], None]] = None,
+                   repositorio_validacoes: Optional[RepositorioValidacoes] = None):
+        """Troca os dados do agente pelos de novos CSVs (ver `carregar_dados`)"""
+        self.aplicar_dados(self.carregar_dados(cabecalho_path, itens_path, cfop_path, modo_streaming_itens,
+                                               ao_progredir, repositorio_validacoes))
+    
+    def _criar_executor(self, llm) -> AgentExecutor:
+        """Agente executor com as ferramentas e o prompt deste agente sobre o LLM informado"""
+        return AgentExecutor(
+            agent=create_openai_functions_agent(llm, self.tools, self.prompt),
+            tools=self.tools,
+            verbose=True,
+            max_iterations=10,
+            return_intermediate_steps=True,
+            handle_parsing_errors=True
+        )
+    
+    def _executor_para(self, pergunta: str) -> AgentExecutor:
+        """Agente executor do modelo configurado para o tipo da pergunta"""
+        tipo = classificar_pergunta(pergunta)
+        modelo = modelo_para_tipo(tipo)
+        if modelo == self.modelo_llm:
+            return self.agent_executor
+        
+        if modelo not in self._executores_por_modelo:
+            self._executores_por_modelo[modelo] = self._criar_executor(obter_llm(modelo))
+        print(f"🧭 Pergunta do tipo '{tipo}': modelo {modelo}")
+        return self._executores_por_modelo[modelo]
+    
     def _formatar_cfop_para_busca(self, cfop: str) -> str:
         """
         Formata o CFOP para o padrão usado no CSV.
@@ -126,7 +377,10 @@ class AgenteValidadorCFOP:
         return explicacoes.get(digito, 'Indefinido')
     
     def _criar_prompt(self):
-        """Cria o prompt para o agente"""
+        """Cria o prompt para o agente (montado uma vez e compartilhado por todos os agentes)"""
+        if AgenteValidadorCFOP._prompt_compilado is not None:
+            return AgenteValidadorCFOP._prompt_compilado
+        
         system_message = """Você é um especialista em análise e validação de CFOP (Código Fiscal de Operações e Prestações) de Notas Fiscais brasileiras.
 
 Sua missão é:
@@ -197,8 +451,35 @@ Seja objetivo, claro e mostre os dados de forma organizada."""
             MessagesPlaceholder(variable_name="agent_scratchpad")
         ])
         
+        AgenteValidadorCFOP._prompt_compilado = prompt
         return prompt
     
+    def _construir_indices(self, df_cabecalho: pd.DataFrame, df_itens: pd.DataFrame,
+                           modo_streaming_itens: bool) -> dict:
+        """Índice das chaves de acesso e agrupamento das linhas por número da nota"""
+        # Indexar chaves de acesso (busca O(1) nas ferramentas)
+        print("🗂️ Indexando chaves de acesso...")
+        indice_chaves = construir_indice_chaves(df_cabecalho)
+        print(f"   ✅ {len(indice_chaves)} chaves indexadas")
+        
+        # Agrupar itens e cabeçalhos por número da nota (busca vira uma fatia)
+        print("🗂️ Agrupando itens por nota...")
+        ordem_cabecalho, tabela_cabecalho_por_nota = construir_tabela_notas(df_cabecalho['NÚMERO'])
+        if modo_streaming_itens:
+            ordem_itens, tabela_itens_por_nota = None, None
+            print("   ⏭️ Itens em modo streaming: busca por nota feita em blocos")
+        else:
+            ordem_itens, tabela_itens_por_nota = construir_tabela_notas(df_itens['NÚMERO'])
+            print(f"   ✅ {len(tabela_itens_por_nota)} notas com itens")
+        
+        return {
+            'indice_chaves': indice_chaves,
+            'ordem_cabecalho': ordem_cabecalho,
+            'tabela_cabecalho_por_nota': tabela_cabecalho_por_nota,
+            'ordem_itens': ordem_itens,
+            'tabela_itens_por_nota': tabela_itens_por_nota
+        }
+    
     def _criar_ferramentas(self):
         """Cria as ferramentas para o agente"""
         
@@ -207,7 +488,7 @@ Seja objetivo, claro e mostre os dados de forma organizada."""
             print(f"   🔍 Tool: contar_notas()")
             
             total_cabecalho = len(self.df_cabecalho)
-            total_itens = len(self.df_itens)
+            total_itens = self._contar_itens()
             total_cfop = len(self.df_cfop)
             
             resultado = f"""📊 ESTATÍSTICAS DOS ARQUIVOS
@@ -269,8 +550,7 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 nota = self.df_cabecalho.iloc[idx]
                 
                 resultado = f"📋 NOTA REGISTRO {idx + 1} (ÍNDICE {idx})\n\n"
-                for col, valor in nota.items():
-                    resultado += f"{col}: {valor}\n"
+                resultado += formatar_registro(nota)
                 
                 print(f"   ✅ Nota no índice {idx} encontrada")
                 return resultado
@@ -287,15 +567,15 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
             print(f"   🔍 Tool: buscar_item_por_indice(indice={indice})")
             try:
                 idx = int(indice)
+                total_itens = self._contar_itens()
                 
-                if idx < 0 or idx >= len(self.df_itens):
-                    return f"❌ Índice {idx} fora do intervalo. O arquivo de itens tem {len(self.df_itens)} registros (índices 0 a {len(self.df_itens)-1})."
+                if idx < 0 or idx >= total_itens:
+                    return f"❌ Índice {idx} fora do intervalo. O arquivo de itens tem {total_itens} registros (índices 0 a {total_itens-1})."
                 
-                item = self.df_itens.iloc[idx]
+                item = self._item_por_posicao(idx)
                 
                 resultado = f"📦 ITEM REGISTRO {idx + 1} (ÍNDICE {idx})\n\n"
-                for col, valor in item.items():
-                    resultado += f"{col}: {valor}\n"
+                resultado += formatar_registro(item)
                 
                 # Destacar o CFOP
                 if 'CFOP' in item.index:
@@ -323,8 +603,7 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 cfop = self.df_cfop.iloc[idx]
                 
                 resultado = f"📖 CFOP REGISTRO {idx + 1} (ÍNDICE {idx})\n\n"
-                for col, valor in cfop.items():
-                    resultado += f"{col}: {valor}\n"
+                resultado += formatar_registro(cfop)
                 
                 print(f"   ✅ CFOP no índice {idx} encontrado")
                 return resultado
@@ -341,42 +620,26 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
             print(f"   🔍 Tool: buscar_nota_por_chave(chave_acesso={chave_acesso})")
             try:
                 # Limpar a chave de acesso (remover espaços, hífens, etc)
-                chave_limpa = str(chave_acesso).strip().replace(' ', '').replace('-', '').replace('.', '').replace("'", "")
+                chave_limpa = normalizar_chave_acesso(chave_acesso)
                 
                 print(f"      🔧 Chave de acesso limpa: {chave_limpa}")
                 print(f"      📏 Tamanho: {len(chave_limpa)} caracteres")
                 
-                # Tentar várias possíveis colunas onde a chave pode estar
-                possiveis_colunas = [
-                    'CHAVE DE ACESSO', 'CHAVE', 'CHAVE NF-E', 'CHAVE NFE',
-                    'CHAVE_ACESSO', 'NF-E CHAVE DE ACESSO', 'NFE_CHAVE', 'CHAVE_NFE'
-                ]
-                
-                # Verificar quais colunas existem no dataframe
                 colunas_disponiveis = self.df_cabecalho.columns.tolist()
-                print(f"      📋 Colunas disponíveis: {colunas_disponiveis}")
                 
                 nota_encontrada = None
                 coluna_encontrada = None
                 
-                # Tentar cada possível coluna
-                for coluna in possiveis_colunas:
-                    if coluna in colunas_disponiveis:
-                        print(f"      🔍 Tentando buscar na coluna: {coluna}")
-                        
-                        # Buscar com a chave limpa
-                        nota = self.df_cabecalho[
-                            self.df_cabecalho[coluna].astype(str).str.replace(' ', '').str.replace('-', '').str.replace('.', '').str.replace("'", "") == chave_limpa
-                        ]
-                        
-                        if not nota.empty:
-                            nota_encontrada = nota
-                            coluna_encontrada = coluna
-                            print(f"      ✅ Encontrada na coluna: {coluna}")
-                            break
-                
-                # Se não encontrou em colunas específicas, tentar em todas as colunas
+                # Consultar o índice de chaves (colunas de chave conhecidas)
+                encontrado = buscar_no_indice(self.indice_chaves, chave_limpa)
+                if encontrado is not None:
+                    posicao, coluna_encontrada = encontrado
+                    nota_encontrada = self.df_cabecalho.iloc[[posicao]]
+                    print(f"      ✅ Encontrada no índice (coluna: {coluna_encontrada})")
+                
+                # Se não estiver no índice, tentar em todas as colunas
                 if nota_encontrada is None:
+                    print(f"      📋 Colunas disponíveis: {colunas_disponiveis}")
                     print(f"      🔍 Buscando em todas as colunas...")
                     for coluna in colunas_disponiveis:
                         try:
@@ -403,7 +666,7 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                     
                     # Tentar mostrar alguns exemplos de chaves que existem
                     resultado += f"\n💡 Exemplos de valores nas colunas (primeiras 3 notas):\n"
-                    for coluna in possiveis_colunas:
+                    for coluna in COLUNAS_CHAVE_ACESSO:
                         if coluna in colunas_disponiveis:
                             exemplos = self.df_cabecalho[coluna].dropna().head(3)
                             if not exemplos.empty:
@@ -416,10 +679,7 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 
                 resultado = f"✅ NOTA FISCAL ENCONTRADA\n"
                 resultado += f"   (Chave encontrada na coluna: '{coluna_encontrada}')\n\n"
-                
-                for col in nota_encontrada.columns:
-                    valor = nota_encontrada.iloc[0][col]
-                    resultado += f"{col}: {valor}\n"
+                resultado += formatar_registro(nota_encontrada.iloc[0])
                 
                 print(f"   ✅ Nota encontrada pela chave de acesso")
                 return resultado
@@ -433,14 +693,15 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
             """Busca informações de cabeçalho de uma nota fiscal pelo número"""
             print(f"   🔍 Tool: buscar_nota_cabecalho(numero_nota={numero_nota})")
             try:
-                nota = self.df_cabecalho[self.df_cabecalho['NÚMERO'].astype(str) == str(numero_nota)]
-                if nota.empty:
+                faixa = self.tabela_cabecalho_por_nota.get(normalizar_numero_nota(numero_nota))
+                if faixa is None:
                     return f"❌ Nota {numero_nota} não encontrada no cabeçalho."
                 
+                # Primeiro registro com esse número
+                nota = self.df_cabecalho.iloc[[self._ordem_cabecalho[faixa[0]]]]
+                
                 resultado = f"📋 NOTA FISCAL Nº {numero_nota}\n\n"
-                for col in nota.columns:
-                    valor = nota.iloc[0][col]
-                    resultado += f"{col}: {valor}\n"
+                resultado += formatar_registro(nota.iloc[0])
                 
                 print(f"   ✅ Encontrada nota {numero_nota}")
                 return resultado
@@ -448,23 +709,21 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 print(f"   ❌ Erro: {e}")
                 return f"Erro ao buscar nota: {str(e)}"
         
-        def buscar_itens_nota(numero_nota: str) -> str:
-            """Busca todos os itens de uma nota fiscal pelo número"""
-            print(f"   🔍 Tool: buscar_itens_nota(numero_nota={numero_nota})")
+        def buscar_itens_nota(numero_nota: str, inicio: str = "0", colunas: str = "") -> str:
+            """Busca os itens de uma nota fiscal pelo número
+            
+            Nos formatos compactos (CFOP_FORMATO_SAIDA) os itens vêm paginados a
+            partir de `inicio` e só com as `colunas` pedidas (separadas por vírgula).
+            """
+            print(f"   🔍 Tool: buscar_itens_nota(numero_nota={numero_nota}, inicio={inicio}, colunas={colunas})")
             try:
-                itens = self.df_itens[self.df_itens['NÚMERO'].astype(str) == str(numero_nota)]
+                itens = self._itens_da_nota(numero_nota)
                 if itens.empty:
                     return f"❌ Nenhum item encontrado para nota {numero_nota}."
                 
                 resultado = f"🛒 ITENS DA NOTA {numero_nota}\n"
                 resultado += f"Total de itens: {len(itens)}\n\n"
-                
-                for idx, item in itens.iterrows():
-                    resultado += f"\n{'='*60}\n"
-                    resultado += f"ITEM {idx + 1}\n"
-                    resultado += f"{'='*60}\n"
-                    for col, valor in item.items():
-                        resultado += f"{col}: {valor}\n"
+                resultado += formatar_tabela(itens, "ITEM", separar_colunas(colunas), int(inicio or 0))
                 
                 print(f"   ✅ Encontrados {len(itens)} itens")
                 return resultado
@@ -481,35 +740,30 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 # Formatar o CFOP para o padrão do CSV
                 cfop_formatado = self._formatar_cfop_para_busca(codigo_cfop)
                 
-                # Buscar o CFOP formatado
-                cfop = self.df_cfop[self.df_cfop['CFOP'].astype(str) == cfop_formatado]
-                
-                if cfop.empty:
-                    # Tentar busca alternativa sem formatação
-                    cfop_limpo = str(codigo_cfop).strip().replace('.', '').replace(',', '').replace(' ', '')
-                    cfop = self.df_cfop[self.df_cfop['CFOP'].astype(str).str.replace('.', '').str.replace(',', '').str.replace(' ', '') == cfop_limpo]
-                    
-                    if cfop.empty:
-                        # Mostrar CFOPs disponíveis próximos
-                        primeiro_digito = cfop_limpo[0] if cfop_limpo else ''
-                        sugestoes = self.df_cfop[self.df_cfop['CFOP'].astype(str).str.startswith(primeiro_digito)].head(5)
-                        
-                        resultado = f"❌ CFOP {codigo_cfop} (formatado: {cfop_formatado}) não encontrado na tabela.\n\n"
-                        
-                        if not sugestoes.empty:
-                            resultado += f"💡 CFOPs que começam com '{primeiro_digito}':\n"
-                            for _, row in sugestoes.iterrows():
-                                resultado += f"   - {row['CFOP']}\n"
-                        
-                        return resultado
-                
+                # Buscar o CFOP formatado e, se não houver, sem formatação (índice O(1))
+                posicao = self.indice_cfop.buscar(codigo_cfop, formatado=cfop_formatado)
+
+                if posicao is None:
+                    # Mostrar CFOPs disponíveis próximos
+                    cfop_limpo = normalizar_cfop(codigo_cfop)
+                    primeiro_digito = cfop_limpo[0] if cfop_limpo else ''
+                    sugestoes = self.indice_cfop.sugerir(primeiro_digito)
+
+                    resultado = f"❌ CFOP {codigo_cfop} (formatado: {cfop_formatado}) não encontrado na tabela.\n\n"
+
+                    if sugestoes:
+                        resultado += f"💡 CFOPs que começam com '{primeiro_digito}':\n"
+                        for codigo in self.df_cfop['CFOP'].iloc[sugestoes]:
+                            resultado += f"   - {codigo}\n"
+
+                    return resultado
+
+                cfop = self.df_cfop.iloc[posicao]
                 resultado = f"📖 CFOP {codigo_cfop}\n"
-                resultado += f"   (Formato no sistema: {cfop.iloc[0]['CFOP']})\n\n"
-                
-                for col, valor in cfop.iloc[0].items():
-                    resultado += f"{col}: {valor}\n"
-                
-                print(f"   ✅ CFOP encontrado: {cfop.iloc[0]['CFOP']}")
+                resultado += f"   (Formato no sistema: {cfop['CFOP']})\n\n"
+                resultado += formatar_registro(cfop)
+
+                print(f"   ✅ CFOP encontrado: {cfop['CFOP']}")
                 return resultado
                 
             except Exception as e:
@@ -518,72 +772,27 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 return f"Erro ao buscar CFOP: {str(e)}"
         
         def validar_todas_notas() -> str:
-            """Valida CFOP de todas as notas e retorna um resumo"""
+            """Valida CFOP de todos os itens e retorna um resumo"""
             print(f"   🔍 Tool: validar_todas_notas()")
             try:
-                divergencias = []
-                total_itens = 0
-                
-                # Limitar a 100 para performance
-                itens_para_validar = self.df_itens.head(100)
-                
-                for _, item in itens_para_validar.iterrows():
-                    total_itens += 1
-                    numero_nota = str(item.get('NÚMERO', ''))
-                    cfop_item = str(item.get('CFOP', ''))
-                    
-                    cabecalho = self.df_cabecalho[
-                        self.df_cabecalho['NÚMERO'].astype(str) == numero_nota
-                    ]
-                    
-                    if not cabecalho.empty:
-                        natureza = str(cabecalho.iloc[0].get('NATUREZA DA OPERAÇÃO', ''))
-                        uf_emit = str(cabecalho.iloc[0].get('UF EMITENTE', ''))
-                        uf_dest = str(cabecalho.iloc[0].get('UF DESTINATÁRIO', ''))
-                        destino_op = str(cabecalho.iloc[0].get('DESTINO DA OPERAÇÃO', ''))
-                        
-                        primeiro_digito_esperado = self._inferir_primeiro_digito(
-                            natureza, uf_emit, uf_dest, destino_op
-                        )
-                        
-                        # Extrair primeiro dígito do CFOP (pode estar no formato X.YYY)
-                        cfop_limpo = cfop_item.replace('.', '').replace(',', '').replace(' ', '')
-                        primeiro_digito_atual = cfop_limpo[0] if cfop_limpo and len(cfop_limpo) > 0 else "?"
-                        
-                        if primeiro_digito_esperado != primeiro_digito_atual:
-                            divergencias.append({
-                                'nota': numero_nota,
-                                'cfop_atual': cfop_item,
-                                'esperado': f"{primeiro_digito_esperado}xxx",
-                                'natureza': natureza,
-                                'uf_emit': uf_emit,
-                                'uf_dest': uf_dest
-                            })
-                
-                resultado = f"✅ VALIDAÇÃO COMPLETA\n\n"
-                resultado += f"Total de itens analisados: {total_itens}\n"
-                resultado += f"Divergências encontradas: {len(divergencias)}\n"
-                
-                if total_itens > 0:
-                    taxa_conformidade = ((total_itens - len(divergencias)) / total_itens * 100)
-                    resultado += f"Taxa de conformidade: {taxa_conformidade:.1f}%\n\n"
-                
-                if divergencias:
-                    resultado += "❌ DIVERGÊNCIAS ENCONTRADAS:\n\n"
-                    for i, d in enumerate(divergencias[:10], 1):
-                        resultado += f"{i}. Nota {d['nota']}:\n"
-                        resultado += f"   CFOP atual: {d['cfop_atual']}\n"
-                        resultado += f"   CFOP esperado: {d['esperado']}\n"
-                        resultado += f"   Natureza: {d['natureza']}\n"
-                        resultado += f"   Rota: {d['uf_emit']} → {d['uf_dest']}\n\n"
-                    
-                    if len(divergencias) > 10:
-                        resultado += f"\n... e mais {len(divergencias) - 10} divergências.\n"
+                # Motor vetorizado: cabeçalho preparado uma vez, itens validados em
+                # blocos e acumulados no resumo (memória limitada pelo tamanho do bloco)
+                cabecalho = self._obter_cabecalho_validacao()
+                
+                resumo = self.dados.derivados.get('resumo_validacao')
+                if resumo is not None:
+                    # Validação feita na carga dos dados (incremental, ver `carregar_dados`)
+                    print("   ♻️ Resumo da validação feita na carga dos dados")
+                elif self._validar_em_paralelo():
+                    print(f"   ⚙️ Validação em {PROCESSOS_VALIDACAO} processos")
+                    resumo = validar_em_paralelo(self._particoes_validacao(), cabecalho, PROCESSOS_VALIDACAO)
                 else:
-                    resultado += "✅ Todos os CFOPs verificados estão corretos!\n"
+                    resumo = ResumoValidacao()
+                    for deslocamento, bloco in self._iterar_blocos_itens():
+                        resumo.acumular(validar_itens(bloco, cabecalho, deslocamento))
                 
-                print(f"   ✅ Validação concluída: {len(divergencias)} divergências")
-                return resultado
+                print(f"   ✅ Validação concluída: {resumo.total_itens} itens, {resumo.divergencias_primeiro_digito} divergências")
+                return resumo.formatar()
                 
             except Exception as e:
                 print(f"   ❌ Erro na validação: {e}")
@@ -606,7 +815,7 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
             
             try:
                 # Limpar chave de acesso
-                chave_limpa = str(chave_acesso).strip().replace(' ', '').replace('-', '').replace('.', '').replace("'", "")
+                chave_limpa = normalizar_chave_acesso(chave_acesso)
                 
                 # Converter número do item (pode vir como "1", "primeiro", "item 1", etc)
                 numero_item_str = str(numero_item).lower().strip()
@@ -617,39 +826,17 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                     item_numero = int(numeros[0])
                 else:
                     # Tentar palavras por extenso
-                    palavras_numericas = {
-                        'primeiro': 1, 'primeira': 1,
-                        'segundo': 2, 'segunda': 2,
-                        'terceiro': 3, 'terceira': 3,
-                        'quarto': 4, 'quarta': 4,
-                        'quinto': 5, 'quinta': 5,
-                        'sexto': 6, 'sexta': 6,
-                        'sétimo': 7, 'sétima': 7,
-                        'oitavo': 8, 'oitava': 8,
-                        'nono': 9, 'nona': 9,
-                        'décimo': 10, 'décima': 10
-                    }
-                    item_numero = palavras_numericas.get(numero_item_str, 1)
+                    item_numero = ORDINAIS.get(numero_item_str, 1)
                 
                 print(f"      🔢 Número do item: {item_numero}")
                 
                 # ==================================================================
                 # BUSCAR NOTA PELO CHAVE DE ACESSO
                 # ==================================================================
-                possiveis_colunas_chave = [
-                    'CHAVE DE ACESSO', 'CHAVE', 'CHAVE NF-E', 'CHAVE NFE',
-                    'CHAVE_ACESSO', 'NF-E CHAVE DE ACESSO', 'NFE_CHAVE', 'CHAVE_NFE'
-                ]
-                
                 nota_encontrada = None
-                for coluna in possiveis_colunas_chave:
-                    if coluna in self.df_cabecalho.columns:
-                        nota = self.df_cabecalho[
-                            self.df_cabecalho[coluna].astype(str).str.replace(' ', '').str.replace('-', '').str.replace('.', '').str.replace("'", "") == chave_limpa
-                        ]
-                        if not nota.empty:
-                            nota_encontrada = nota.iloc[0]
-                            break
+                encontrado = buscar_no_indice(self.indice_chaves, chave_limpa)
+                if encontrado is not None:
+                    nota_encontrada = self.df_cabecalho.iloc[encontrado[0]]
                 
                 if nota_encontrada is None:
                     return f"❌ Nota com chave {chave_acesso} não encontrada no arquivo de cabeçalho."
@@ -660,7 +847,7 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 # ==================================================================
                 # BUSCAR ITENS DA NOTA
                 # ==================================================================
-                itens_nota = self.df_itens[self.df_itens['NÚMERO'].astype(str) == numero_nota]
+                itens_nota = self._itens_da_nota(numero_nota)
                 
                 if itens_nota.empty:
                     return f"❌ Nenhum item encontrado para a nota {numero_nota}."
@@ -680,10 +867,10 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 # ==================================================================
                 natureza = str(nota_encontrada.get('NATUREZA DA OPERAÇÃO', '')).upper()
                 
-                is_entrada = any(palavra in natureza for palavra in 
-                                ['ENTRADA', 'COMPRA', 'DEVOLUÇÃO', 'DEV', 'AQUISIÇÃO'])
-                is_saida = any(palavra in natureza for palavra in 
-                              ['VENDA', 'REMESSA', 'RETORNO']) and 'DEV' not in natureza and 'DEVOLUÇÃO' not in natureza
+                # Regras de palavras-chave compiladas uma vez; cada natureza distinta
+                # é classificada uma única vez
+                classificacao = classificador_natureza.classificar(natureza)
+                is_entrada = classificacao.entrada_item
                 
                 tipo_operacao = "ENTRADA" if is_entrada else "SAÍDA"
                 
@@ -715,46 +902,12 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 indicador_ie = str(nota_encontrada.get('INDICADOR IE DESTINATÁRIO', '')).strip()
                 
                 # Determinar os últimos 3 dígitos baseado na natureza
-                ultimos_digitos = None
-                justificativa = ""
-                
-                # DEVOLUÇÕES
-                if any(palavra in natureza for palavra in ['DEV', 'DEVOLUÇÃO']):
-                    if 'REMESSA' in natureza:
-                        ultimos_digitos = '949'
-                        justificativa = "Devolução de remessa"
-                    else:
-                        ultimos_digitos = '202'
-                        justificativa = "Devolução de compra/venda"
-                
-                # VENDAS/COMPRAS
-                elif 'VENDA' in natureza or 'COMPRA' in natureza or 'AQUISIÇÃO' in natureza:
-                    if 'NÃO CONTRIBUINTE' in indicador_ie or 'CONSUMIDOR FINAL' in consumidor_final:
-                        ultimos_digitos = '102'
-                        justificativa = "Venda/Compra para não contribuinte ou consumidor final"
-                    else:
-                        ultimos_digitos = '102'
-                        justificativa = "Venda/Compra de mercadoria"
-                
-                # REMESSAS
-                elif 'REMESSA' in natureza:
-                    if 'DEMONSTRAÇÃO' in natureza:
-                        ultimos_digitos = '912'
-                        justificativa = "Remessa para demonstração"
-                    elif 'CONSERTO' in natureza or 'REPARO' in natureza:
-                        ultimos_digitos = '915'
-                        justificativa = "Remessa para conserto/reparo"
-                    elif 'COMODATO' in natureza:
-                        ultimos_digitos = '908'
-                        justificativa = "Remessa em comodato"
-                    else:
-                        ultimos_digitos = '949'
-                        justificativa = "Outra remessa"
-                
-                # OUTRAS OPERAÇÕES
-                else:
-                    ultimos_digitos = '949'
-                    justificativa = "Outra operação não especificada"
+                # (devolução, venda/compra, remessas específicas ou outras operações)
+                ultimos_digitos = classificacao.ultimos_digitos
+                justificativa = classificacao.justificativa
+                
+                if ultimos_digitos == '102' and ('NÃO CONTRIBUINTE' in indicador_ie or 'CONSUMIDOR FINAL' in consumidor_final):
+                    justificativa = "Venda/Compra para não contribuinte ou consumidor final"
                 
                 # ==================================================================
                 # PASSO 5: MONTAR CFOP INFERIDO
@@ -863,12 +1016,41 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 traceback.print_exc()
                 return f"Erro ao validar CFOP do item: {str(e)}"
         
+        # MEMORIZAÇÃO: o LLM repete as mesmas consultas (nota, itens, validação)
+        # dentro de uma execução e entre perguntas; o resultado de cada chamada
+        # é reaproveitado enquanto a versão dos dados for a mesma
+        self._ferramentas_memorizadas = [
+            memorizar_ferramenta(funcao, versao=lambda: self.versao_dados) for funcao in (
+                contar_notas, listar_notas_cabecalho, buscar_nota_por_chave,
+                buscar_nota_por_indice, buscar_item_por_indice, buscar_cfop_por_indice,
+                buscar_nota_cabecalho, buscar_itens_nota, buscar_cfop,
+                validar_todas_notas, validar_cfop_item_especifico
+            )
+        ]
+        
+        # TAMANHO DA SAÍDA: caracteres e tokens estimados que cada ferramenta devolve ao LLM
+        self.contador_tokens = ContadorTokens()
+        (contar_notas, listar_notas_cabecalho, buscar_nota_por_chave,
+         buscar_nota_por_indice, buscar_item_por_indice, buscar_cfop_por_indice,
+         buscar_nota_cabecalho, buscar_itens_nota, buscar_cfop,
+         validar_todas_notas, validar_cfop_item_especifico) = [
+            self._com_dados_fixados(medir_saida(funcao, self.contador_tokens))
+            for funcao in self._ferramentas_memorizadas
+        ]
+        
+        descricao_itens_nota = "Busca todos os itens de uma nota fiscal específica pelo NÚMERO da nota. Use quando quiser ver todos os produtos/serviços de uma nota específica."
+        if FORMATO_SAIDA != FORMATO_DETALHADO:
+            descricao_itens_nota += (
+                " Os itens vêm em páginas: se a saída indicar mais linhas, chame de novo com o 'inicio' informado."
+                " Use 'colunas' (ex.: 'CFOP, VALOR TOTAL') para trazer só as colunas necessárias."
+            )
+        
         # LISTA DE FERRAMENTAS
         # MUDANÇA CHAVE: Usar StructuredTool para a função com 2 parâmetros
         tools = [
-            Tool(
-                name="contar_notas",
+            StructuredTool.from_function(
                 func=contar_notas,
+                name="contar_notas",
                 description="Retorna estatísticas completas sobre os arquivos carregados (quantidade de notas, itens, CFOPs e todas as colunas disponíveis)."
             ),
             Tool(
@@ -901,20 +1083,20 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
                 func=buscar_nota_cabecalho,
                 description="Busca informações completas de cabeçalho de uma nota fiscal específica pelo NÚMERO da nota (não o índice, não a chave de acesso). Use quando souber o número curto da nota."
             ),
-            Tool(
-                name="buscar_itens_nota",
+            StructuredTool.from_function(
                 func=buscar_itens_nota,
-                description="Busca todos os itens de uma nota fiscal específica pelo NÚMERO da nota. Use quando quiser ver todos os produtos/serviços de uma nota específica."
+                name="buscar_itens_nota",
+                description=descricao_itens_nota
             ),
             Tool(
                 name="buscar_cfop",
                 func=buscar_cfop,
                 description="Busca informações detalhadas sobre um código CFOP específico. Aceita qualquer formato: 5102, 5.102, 5 102, etc. O sistema formata automaticamente para o padrão do CSV (X.YYY para 4 dígitos)."
             ),
-            Tool(
-                name="validar_todas_notas",
+            StructuredTool.from_function(
                 func=validar_todas_notas,
-                description="Valida o CFOP de todas as notas carregadas (até 100 primeiras) e retorna um resumo completo com divergências encontradas. Use para análise geral de conformidade."
+                name="validar_todas_notas",
+                description="Valida o CFOP de todos os itens de todas as notas carregadas e retorna um resumo completo com divergências encontradas. Use para análise geral de conformidade."
             ),
             # MUDANÇA CHAVE: Usar StructuredTool ao invés de Tool com args_schema
             StructuredTool.from_function(
@@ -926,15 +1108,173 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
         
         return tools
     
+    def limpar_memoria_ferramentas(self):
+        """Descarta os resultados memorizados das ferramentas (ex.: ao recarregar os dados)"""
+        for ferramenta in self._ferramentas_memorizadas:
+            ferramenta.limpar()
+        print("🧹 Memória das ferramentas limpa")
+    
+    def estatisticas_ferramentas(self) -> dict:
+        """Uso da memorização de cada ferramenta"""
+        return {
+            ferramenta.__name__: {
+                **ferramenta.estatisticas(),
+                'saida': self.contador_tokens.estatisticas(ferramenta.__name__)
+            }
+            for ferramenta in self._ferramentas_memorizadas
+        }
+    
+    def _iterar_blocos_itens(self, tamanho_bloco: int = TAMANHO_BLOCO_ITENS):
+        """Percorre os itens em blocos, gerando (posição do primeiro item, bloco)"""
+        dados = self.dados
+        if dados.modo_streaming_itens:
+            deslocamento = 0
+            for bloco in ler_csv_em_blocos(dados.itens_path, esquema=ESQUEMA_ITENS, tamanho_bloco=tamanho_bloco):
+                yield deslocamento, bloco
+                deslocamento += len(bloco)
+            dados.derivados['total_itens'] = deslocamento
+        else:
+            for inicio in range(0, len(dados.df_itens), tamanho_bloco):
+                yield inicio, dados.df_itens.iloc[inicio:inicio + tamanho_bloco]
+    
+    def _contar_itens(self) -> int:
+        """Total de itens (no modo streaming, contado em uma passada pelo arquivo)"""
+        dados = self.dados
+        if 'total_itens' not in dados.derivados:
+            with self.fixar_dados(dados):
+                for _ in self._iterar_blocos_itens():
+                    pass
+        return dados.derivados['total_itens']
+    
+    def _item_por_posicao(self, posicao: int) -> pd.Series:
+        """Item na posição informada do arquivo de itens"""
+        if not self.modo_streaming_itens:
+            return self.df_itens.iloc[posicao]
+        
+        for deslocamento, bloco in self._iterar_blocos_itens():
+            if posicao < deslocamento + len(bloco):
+                return bloco.iloc[posicao - deslocamento]
+        raise IndexError(f"Item {posicao} fora do arquivo de itens")
+    
+    def _itens_da_nota(self, numero_nota) -> pd.DataFrame:
+        """Itens de uma nota, na ordem original, via tabela de faixas por nota"""
+        if self.modo_streaming_itens:
+            # Sem itens em memória: filtra a nota bloco a bloco
+            alvo = normalizar_numero_nota(numero_nota)
+            partes = [
+                bloco[(normalizar_numeros_nota(bloco['NÚMERO']) == alvo).to_numpy()]
+                for _, bloco in self._iterar_blocos_itens()
+            ]
+            partes = [parte for parte in partes if not parte.empty]
+            return pd.concat(partes) if partes else self.df_itens
+        
+        faixa = self.tabela_itens_por_nota.get(normalizar_numero_nota(numero_nota))
+        if faixa is None:
+            return self.df_itens.iloc[0:0]
+        
+        inicio, fim = faixa
+        return self.df_itens.iloc[self._ordem_itens[inicio:fim]]
+    
+    def _validar_em_paralelo(self) -> bool:
+        """Usa o pool de processos se configurado e se o volume de itens compensa"""
+        if PROCESSOS_VALIDACAO <= 1:
+            return False
+        # No modo streaming o total só é conhecido após uma passada; arquivos
+        # grandes o bastante para streaming já justificam o paralelismo
+        return self.modo_streaming_itens or self._contar_itens() >= MINIMO_ITENS_PARALELO
+    
+    def _particoes_validacao(self):
+        """Partições de itens para a validação paralela, gerando (posições, itens)"""
+        if self.modo_streaming_itens:
+            # Cada bloco lido vira uma tarefa (os itens de uma nota podem cair em
+            # blocos diferentes, o que não altera as contagens por item)
+            for deslocamento, bloco in self._iterar_blocos_itens():
+                yield np.arange(deslocamento, deslocamento + len(bloco)), bloco
+            return
+        
+        for posicoes in particionar_por_nota(self.df_itens['NÚMERO'], PROCESSOS_VALIDACAO):
+            if len(posicoes):
+                yield posicoes, self.df_itens.iloc[posicoes]
+    
+    def _blocos_itens_das_notas(self, notas, tamanho_bloco: int = TAMANHO_BLOCO_ITENS):
+        """Percorre só os itens das notas informadas, gerando (posições, bloco)"""
+        if self.modo_streaming_itens:
+            for deslocamento, bloco in self._iterar_blocos_itens(tamanho_bloco):
+                mascara = normalizar_numeros_nota(bloco['NÚMERO']).isin(notas).to_numpy()
+                if mascara.any():
+                    yield deslocamento + np.flatnonzero(mascara), bloco[mascara]
+            return
+        
+        faixas = [self.tabela_itens_por_nota[nota] for nota in notas if nota in self.tabela_itens_por_nota]
+        if not faixas:
+            return
+        
+        # Posições em ordem de arquivo, como na validação completa
+        posicoes = np.sort(np.concatenate([self._ordem_itens[inicio:fim] for inicio, fim in faixas]))
+        for inicio in range(0, len(posicoes), tamanho_bloco):
+            parte = posicoes[inicio:inicio + tamanho_bloco]
+            yield parte, self.df_itens.iloc[parte]
+    
+    def validar_lote(self, chaves: Optional[List[str]] = None,
+                     tamanho_bloco: int = TAMANHO_BLOCO_ITENS) -> Iterator[pd.DataFrame]:
+        """
+        Valida o CFOP item a item sem passar pelo LLM, em blocos
+        
+        Args:
+            chaves: Chaves de acesso das notas a validar (None = todos os itens)
+            tamanho_bloco: Quantidade de itens por bloco
+        
+        Yields:
+            DataFrame de resultados por item (ver `resultados_por_item`); chaves
+            não encontradas geram linhas com status 'chave_nao_encontrada'
+        """
+        # Todos os blocos vêm da mesma carga, mesmo que os dados sejam recarregados
+        # enquanto a resposta é enviada (cada passo é fixado à parte: o consumidor
+        # pode avançar o gerador de threads diferentes)
+        dados = self.dados
+        blocos = self._validar_lote(chaves, tamanho_bloco)
+        while True:
+            with self.fixar_dados(dados):
+                bloco = next(blocos, None)
+            if bloco is None:
+                return
+            yield bloco
+    
+    def _validar_lote(self, chaves: Optional[List[str]], tamanho_bloco: int) -> Iterator[pd.DataFrame]:
+        """Corpo de `validar_lote`, executado com a carga fixada"""
+        cabecalho = self._obter_cabecalho_validacao()
+        
+        if chaves is None:
+            for deslocamento, bloco in self._iterar_blocos_itens(tamanho_bloco):
+                yield resultados_por_item(bloco, validar_itens(bloco, cabecalho, deslocamento))
+            return
+        
+        notas = set()
+        nao_encontradas = []
+        for chave in chaves:
+            encontrado = buscar_no_indice(self.indice_chaves, chave)
+            if encontrado is None:
+                nao_encontradas.append(normalizar_chave_acesso(chave))
+            else:
+                notas.add(normalizar_numero_nota(self.df_cabecalho.iloc[encontrado[0]]['NÚMERO']))
+        
+        if nao_encontradas:
+            yield pd.DataFrame({'chave_acesso': nao_encontradas, 'status': STATUS_CHAVE_NAO_ENCONTRADA})
+        
+        for posicoes, bloco in self._blocos_itens_das_notas(notas, tamanho_bloco):
+            yield resultados_por_item(bloco, validar_itens(bloco, cabecalho, posicoes_itens=posicoes))
+    
+    def _obter_cabecalho_validacao(self):
+        """Cabeçalho preparado para o motor vetorizado (calculado uma única vez por carga)"""
+        dados = self.dados
+        if 'cabecalho_validacao' not in dados.derivados:
+            dados.derivados['cabecalho_validacao'] = preparar_cabecalho(dados.df_cabecalho)
+        return dados.derivados['cabecalho_validacao']
+    
     def _inferir_primeiro_digito(self, natureza: str, uf_emit: str, 
                                   uf_dest: str, destino_op: str) -> str:
         """Infere o primeiro dígito do CFOP baseado nas regras"""
-        natureza = natureza.upper()
-        
-        is_entrada = any(palavra in natureza for palavra in 
-                        ['ENTRADA', 'COMPRA', 'DEVOLUÇÃO', 'DEV'])
-        is_saida = any(palavra in natureza for palavra in 
-                      ['VENDA', 'REMESSA']) and 'DEV' not in natureza
+        is_entrada = classificador_natureza.classificar(natureza).entrada
         
         if '1 - OPERAÇÃO INTERNA' in destino_op or uf_emit == uf_dest:
             return '1' if is_entrada else '5'
@@ -945,34 +1285,180 @@ Colunas do CFOP ({len(self.df_cfop.columns)}):
         
         return '?'
     
-    def processar_pergunta(self, pergunta: str) -> str:
-        """Processa uma pergunta usando o agente"""
+    def _responder_sem_llm(self, pergunta: str) -> Optional[str]:
+        """
+        Responde perguntas estruturadas executando a ferramenta diretamente
+        
+        Args:
+            pergunta: Pergunta do usuário
+        
+        Returns:
+            Saída da ferramenta ou None se a pergunta deve ir para o agente
+        """
+        if not ROTEADOR_ATIVO:
+            return None
+        
+        rota = rotear_pergunta(pergunta)
+        if rota is None or rota[0] not in self._ferramentas:
+            return None
+        
+        nome, argumentos = rota
+        print(f"⚡ Resposta determinística: {nome}({argumentos})")
+        return self._ferramentas[nome].func(**argumentos)
+    
+    def _registrar_pergunta(self, pergunta: str):
+        """Log de entrada de uma pergunta"""
         print("\n" + "="*70)
         print("📥 NOVA PERGUNTA RECEBIDA")
         print("="*70)
         print(f"Pergunta: {pergunta}")
         print("="*70 + "\n")
+    
+    def _registrar_resposta(self, resultado: dict) -> str:
+        """Log da resposta gerada pelo agente executor"""
+        print("\n" + "="*70)
+        print("✅ RESPOSTA GERADA")
+        print("="*70)
+        print(f"Output: {resultado['output'][:200]}...")
+        print("="*70 + "\n")
+        
+        return resultado["output"]
+    
+    def _resposta_em_cache(self, versao_dados: str, pergunta: str) -> Optional[str]:
+        """Resposta já dada a esta pergunta sobre os mesmos dados, se houver"""
+        resposta = cache_respostas.obter(versao_dados, pergunta)
+        if resposta is not None:
+            print("💾 Resposta obtida do cache (mesma pergunta, mesmos dados)")
+        return resposta
+    
+    def _mensagem_erro(self, e: Exception) -> str:
+        """Log de erro e mensagem devolvida ao usuário"""
+        print("\n" + "="*70)
+        print("❌ ERRO AO PROCESSAR PERGUNTA")
+        print("="*70)
+        print(f"Tipo do erro: {type(e).__name__}")
+        print(f"Mensagem: {str(e)}")
+        print("\nStack trace completo:")
+        traceback.print_exc()
+        print("="*70 + "\n")
+        
+        return f"❌ Erro ao processar pergunta: {str(e)}\n\nPor favor, tente novamente ou reformule sua pergunta."
+    
+    def processar_pergunta(self, pergunta: str) -> str:
+        """Processa uma pergunta usando o agente"""
+        self._registrar_pergunta(pergunta)
+        
+        versao_dados = self.versao_dados
+        resposta = self._resposta_em_cache(versao_dados, pergunta)
+        if resposta is not None:
+            return resposta
         
         try:
-            print("🤖 Enviando para o agente executor...")
-            resultado = self.agent_executor.invoke({"input": pergunta})
+            # Perguntas estruturadas são respondidas direto pela ferramenta
+            resposta = self._responder_sem_llm(pergunta)
+            if resposta is None:
+                print("🤖 Enviando para o agente executor...")
+                resultado = self._executor_para(pergunta).invoke({"input": pergunta})
+                resposta = self._registrar_resposta(resultado)
+            
+            # Só respostas bem-sucedidas entram no cache (com a versão dos dados do início)
+            cache_respostas.guardar(versao_dados, pergunta, resposta)
+            return resposta
             
-            print("\n" + "="*70)
-            print("✅ RESPOSTA GERADA")
-            print("="*70)
-            print(f"Output: {resultado['output'][:200]}...")
-            print("="*70 + "\n")
+        except Exception as e:
+            return self._mensagem_erro(e)
+    
+    async def processar_pergunta_async(self, pergunta: str) -> str:
+        """
+        Versão assíncrona de `processar_pergunta`
+        
+        O agente roda com `ainvoke` (as chamadas ao LLM não bloqueiam o event
+        loop) e as ferramentas síncronas, inclusive no atalho sem LLM, rodam
+        em threads.
+        """
+        self._registrar_pergunta(pergunta)
+        
+        versao_dados = self.versao_dados
+        resposta = self._resposta_em_cache(versao_dados, pergunta)
+        if resposta is not None:
+            return resposta
+        
+        try:
+            resposta = await asyncio.to_thread(self._responder_sem_llm, pergunta)
+            if resposta is None:
+                print("🤖 Enviando para o agente executor (async)...")
+                resultado = await self._executor_para(pergunta).ainvoke({"input": pergunta})
+                resposta = self._registrar_resposta(resultado)
             
-            return resultado["output"]
+            cache_respostas.guardar(versao_dados, pergunta, resposta)
+            return resposta
             
         except Exception as e:
-            print("\n" + "="*70)
-            print("❌ ERRO AO PROCESSAR PERGUNTA")
-            print("="*70)
-            print(f"Tipo do erro: {type(e).__name__}")
-            print(f"Mensagem: {str(e)}")
-            print("\nStack trace completo:")
-            traceback.print_exc()
-            print("="*70 + "\n")
+            return self._mensagem_erro(e)
+    
+    async def processar_pergunta_stream(self, pergunta: str) -> AsyncIterator[dict]:
+        """
+        Versão de `processar_pergunta_async` que gera eventos durante a execução
+        
+        Os eventos vêm de `astream_events` do agente executor e são dicionários
+        com o campo `tipo`:
+        - EVENTO_FERRAMENTA: o agente chamou uma ferramenta (`nome`, `entrada`)
+        - EVENTO_RESULTADO_FERRAMENTA: a ferramenta terminou (`nome`, `caracteres`)
+        - EVENTO_TOKEN: trecho da resposta gerado pelo LLM (`texto`)
+        - EVENTO_RESPOSTA: resposta completa (`texto`, `origem`), sempre o último
+          evento em caso de sucesso
+        - EVENTO_ERRO: a execução falhou (`mensagem`)
+        
+        Args:
+            pergunta: Pergunta do usuário
+        
+        Yields:
+            Eventos na ordem em que acontecem
+        """
+        self._registrar_pergunta(pergunta)
+        
+        versao_dados = self.versao_dados
+        resposta = self._resposta_em_cache(versao_dados, pergunta)
+        if resposta is not None:
+            yield {"tipo": EVENTO_RESPOSTA, "texto": resposta, "origem": "cache"}
+            return
+        
+        try:
+            rota = rotear_pergunta(pergunta) if ROTEADOR_ATIVO else None
+            if rota is not None and rota[0] in self._ferramentas:
+                yield {"tipo": EVENTO_FERRAMENTA, "nome": rota[0], "entrada": rota[1]}
+            resposta = await asyncio.to_thread(self._responder_sem_llm, pergunta)
             
-            return f"❌ Erro ao processar pergunta: {str(e)}\n\nPor favor, tente novamente ou reformule sua pergunta."
+            if resposta is not None:
+                origem = "ferramenta"
+            else:
+                print("🤖 Enviando para o agente executor (streaming)...")
+                origem = "agente"
+                resultado = None
+                executor = self._executor_para(pergunta)
+                async for evento in executor.astream_events({"input": pergunta}, version="v2"):
+                    tipo = evento["event"]
+                    if tipo == "on_chat_model_stream":
+                        # Chamadas de função chegam com conteúdo vazio: só o texto vai ao cliente
+                        texto = evento["data"]["chunk"].content
+                        if texto:
+                            yield {"tipo": EVENTO_TOKEN, "texto": texto}
+                    elif tipo == "on_tool_start":
+                        yield {"tipo": EVENTO_FERRAMENTA, "nome": evento["name"],
+                               "entrada": evento["data"].get("input")}
+                    elif tipo == "on_tool_end":
+                        saida = evento["data"].get("output")
+                        yield {"tipo": EVENTO_RESULTADO_FERRAMENTA, "nome": evento["name"],
+                               "caracteres": len(str(saida))}
+                    elif tipo == "on_chain_end" and not evento["parent_ids"]:
+                        resultado = evento["data"]["output"]
+                
+                if resultado is None:
+                    raise RuntimeError("O agente terminou sem resposta")
+                resposta = self._registrar_resposta(resultado)
+            
+            cache_respostas.guardar(versao_dados, pergunta, resposta)
+            yield {"tipo": EVENTO_RESPOSTA, "texto": resposta, "origem": origem}
+            
+        except Exception as e:
+            yield {"tipo": EVENTO_ERRO, "mensagem": self._mensagem_erro(e)}
@@ -0,0 +1,217 @@
+"""
+Backends de LLM do agente
+
+O agente recebe o modelo de chat daqui, em vez de instanciar o ChatOpenAI
+diretamente. Backends disponíveis (CFOP_BACKEND_LLM):
+
+- "openai": ChatOpenAI (requer OPENAI_API_KEY);
+- "roteiro": modelo local determinístico, sem rede nem chave, que repete
+  decisões de chamada de ferramenta. Serve para testes de carga e
+  benchmarks de ponta a ponta medindo tudo menos a ida ao LLM.
+
+Cada tipo de pergunta (ver `roteador_intencoes.classificar_pergunta`) pode usar um modelo
+diferente, por exemplo um modelo mais barato/rápido para consultas simples.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, FunctionMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from roteador_intencoes import TIPOS_PERGUNTA, rotear_pergunta
+
+# Backends disponíveis
+BACKEND_OPENAI = "openai"
+BACKEND_ROTEIRO = "roteiro"
+BACKENDS_LLM = (BACKEND_OPENAI, BACKEND_ROTEIRO)
+
+BACKEND_LLM = os.getenv("CFOP_BACKEND_LLM", BACKEND_OPENAI).lower()
+
+# Modelo padrão do agente
+MODELO_LLM = os.getenv("CFOP_MODELO_LLM", "gpt-4")
+
+# Modelo por tipo de pergunta, ex.: "consulta=gpt-4o-mini,analise=gpt-4"
+# (tipos sem modelo definido usam MODELO_LLM)
+MODELOS_POR_TIPO = {
+    tipo.strip(): modelo.strip()
+    for tipo, _, modelo in (
+        par.partition('=') for par in os.getenv("CFOP_MODELOS_POR_TIPO", "").split(',') if '=' in par
+    )
+    if tipo.strip() in TIPOS_PERGUNTA and modelo.strip()
+}
+
+# Backend "roteiro": arquivo JSON com os passos a repetir e atraso simulado por chamada
+ARQUIVO_ROTEIRO_LLM = os.getenv("CFOP_ROTEIRO_LLM", "")
+ATRASO_ROTEIRO_LLM = float(os.getenv("CFOP_ATRASO_ROTEIRO_LLM", "0"))
+
+# Ferramenta usada pelo roteiro padrão quando a pergunta não é reconhecida
+FERRAMENTA_PADRAO_ROTEIRO = "contar_notas"
+
+# Caracteres do resultado da ferramenta repetidos na resposta final do roteiro padrão
+MAXIMO_CARACTERES_RESPOSTA_ROTEIRO = 500
+
+
+def modelo_para_tipo(tipo: str) -> str:
+    """Modelo configurado para um tipo de pergunta (MODELO_LLM se não houver)"""
+    return MODELOS_POR_TIPO.get(tipo, MODELO_LLM)
+
+
+class ModeloRoteirizado(BaseChatModel):
+    """
+    Modelo de chat local que decide as chamadas de ferramenta de forma determinística
+
+    Sem `passos`, cada pergunta faz uma chamada de ferramenta - a indicada
+    pelo roteador de intenções ou `FERRAMENTA_PADRAO_ROTEIRO` - e a resposta
+    final repete o início do resultado. Com `passos` (lista de
+    `{"ferramenta": nome, "argumentos": {...}}` e, por último,
+    `{"resposta": texto}`), o passo de cada chamada é o número de resultados
+    de ferramenta já presentes na conversa: a mesma pergunta gera sempre a
+    mesma sequência, inclusive com várias execuções em paralelo.
+    """
+
+    passos: Optional[List[Dict[str, Any]]] = None
+    atraso: float = 0.0
+    nome_modelo: str = "roteiro"
+
+    @property
+    def _llm_type(self) -> str:
+        return "roteiro-cfop"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"nome_modelo": self.nome_modelo}
+
+    def _decidir(self, messages: List[BaseMessage], functions: List[dict]) -> AIMessage:
+        """Próxima mensagem do modelo para a conversa"""
+        resultados = [m for m in messages if isinstance(m, FunctionMessage)]
+        pergunta = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        parametros = {f['name']: list(f.get('parameters', {}).get('properties', {})) for f in functions}
+
+        if self.passos is not None:
+            passo = self.passos[min(len(resultados), len(self.passos) - 1)]
+            if 'ferramenta' in passo:
+                return self._chamada(passo['ferramenta'], passo.get('argumentos', {}), parametros)
+            return AIMessage(content=passo.get('resposta', ''))
+
+        if resultados:
+            return AIMessage(content=f"Resultado da consulta:\n{resultados[-1].content[:MAXIMO_CARACTERES_RESPOSTA_ROTEIRO]}")
+
+        rota = rotear_pergunta(pergunta)
+        if rota is not None and rota[0] in parametros:
+            return self._chamada(rota[0], rota[1], parametros)
+        return self._chamada(FERRAMENTA_PADRAO_ROTEIRO, {}, parametros)
+
+    @staticmethod
+    def _chamada(ferramenta: str, argumentos: dict, parametros: Dict[str, List[str]]) -> AIMessage:
+        """Mensagem de chamada de função no formato do OpenAI"""
+        # Ferramentas de uma entrada (Tool) recebem o valor em "__arg1"
+        if argumentos and parametros.get(ferramenta) == ['__arg1']:
+            argumentos = {'__arg1': str(next(iter(argumentos.values()), ''))}
+        chamada = {'name': ferramenta, 'arguments': json.dumps(argumentos, ensure_ascii=False)}
+        return AIMessage(content='', additional_kwargs={'function_call': chamada})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.atraso:
+            time.sleep(self.atraso)
+        mensagem = self._decidir(messages, kwargs.get('functions') or [])
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.atraso:
+            time.sleep(self.atraso)
+        mensagem = self._decidir(messages, kwargs.get('functions') or [])
+        if not mensagem.content:
+            yield ChatGenerationChunk(message=AIMessageChunk(content='', additional_kwargs=mensagem.additional_kwargs))
+            return
+
+        # Resposta de texto em trechos (palavra a palavra), como o streaming do OpenAI
+        palavras = mensagem.content.split(' ')
+        for i, palavra in enumerate(palavras):
+            texto = palavra if i == len(palavras) - 1 else palavra + ' '
+            yield ChatGenerationChunk(message=AIMessageChunk(content=texto))
+
+
+def carregar_roteiro(arquivo: str) -> Optional[List[Dict[str, Any]]]:
+    """Passos do roteiro gravados em JSON (None sem arquivo: roteiro padrão)"""
+    if not arquivo:
+        return None
+    with open(arquivo, encoding='utf-8') as f:
+        passos = json.load(f)
+    if not isinstance(passos, list) or not passos:
+        raise ValueError(f"❌ Roteiro do LLM inválido em {arquivo}: esperada uma lista de passos")
+    return passos
+
+
+def criar_llm(modelo: str = None, backend: str = None) -> BaseChatModel:
+    """
+    Cria o modelo de chat do agente
+
+    Args:
+        modelo: Nome do modelo (padrão: MODELO_LLM)
+        backend: Um de BACKENDS_LLM (padrão: CFOP_BACKEND_LLM)
+
+    Returns:
+        Modelo de chat com suporte a chamadas de função
+    """
+    modelo = modelo or MODELO_LLM
+    backend = backend or BACKEND_LLM
+
+    if backend == BACKEND_ROTEIRO:
+        print(f"🎭 LLM local roteirizado ({ARQUIVO_ROTEIRO_LLM or 'roteiro padrão'}, atraso {ATRASO_ROTEIRO_LLM}s)")
+        return ModeloRoteirizado(
+            passos=carregar_roteiro(ARQUIVO_ROTEIRO_LLM), atraso=ATRASO_ROTEIRO_LLM, nome_modelo=modelo
+        )
+
+    if backend != BACKEND_OPENAI:
+        raise ValueError(f"❌ CFOP_BACKEND_LLM inválido: {backend} (use {', '.join(BACKENDS_LLM)})")
+
+    from langchain_openai import ChatOpenAI
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("❌ OPENAI_API_KEY não encontrada no .env!")
+    print(f"🔑 API Key encontrada: {api_key[:8]}...{api_key[-4:]}")
+
+    print(f"🤖 Configurando ChatOpenAI ({modelo})...")
+    return ChatOpenAI(
+        model=modelo,
+        temperature=0,
+        openai_api_key=api_key,
+        verbose=True
+    )
+
+
+# Modelos já criados, por (backend, modelo): compartilhados por todos os agentes
+_llms = {}
+_lock_llms = threading.Lock()
+
+
+def obter_llm(modelo: str = None, backend: str = None) -> BaseChatModel:
+    """
+    Modelo de chat compartilhado (criado na primeira chamada com `criar_llm`)
+
+    O cliente e o pool de conexões HTTP do modelo duram o processo inteiro:
+    novos agentes e recargas de dados reaproveitam as conexões já abertas
+    com o endpoint do modelo.
+
+    Args:
+        modelo: Nome do modelo (padrão: MODELO_LLM)
+        backend: Um de BACKENDS_LLM (padrão: CFOP_BACKEND_LLM)
+
+    Returns:
+        Modelo de chat com suporte a chamadas de função
+    """
+    chave = (backend or BACKEND_LLM, modelo or MODELO_LLM)
+    with _lock_llms:
+        if chave not in _llms:
+            _llms[chave] = criar_llm(chave[1], chave[0])
+        else:
+            print(f"♻️ Reaproveitando o LLM já configurado ({chave[1]})")
+        return _llms[chave]
@@ -0,0 +1,462 @@
+"""
+Benchmark do carregamento, das consultas e da validação de CFOP
+
+Gera CSVs sintéticos (cabeçalho, itens e tabela CFOP com as colunas da NF-e)
+nos tamanhos pedidos e mede, para cada tamanho, num processo separado:
+
+- carga do AgenteValidadorCFOP sem cache (parse dos CSVs) e com o cache colunar;
+- latência de cada ferramenta do agente (sem a memorização de resultados);
+- validação completa de todos os itens (`validar_todas_notas`);
+- execução do agente com o LLM local roteirizado (tudo menos a ida ao LLM);
+- pico de memória (RSS) do processo.
+
+Os resultados (vazão, percentis de latência e pico de RSS) vão para um
+arquivo JSON. Com --referencia, compara com um resultado anterior e
+termina com código 1 se alguma métrica piorar além da tolerância.
+
+Execute:
+    python benchmark_cfop.py --tamanhos 10k,1m,10m
+    python benchmark_cfop.py --tamanhos 10k --referencia benchmark_base.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: sem pico de RSS
+    resource = None
+
+# Quantidade de itens por nome de tamanho
+TAMANHOS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Média de itens por nota nos dados sintéticos
+ITENS_POR_NOTA = 4
+
+# Linhas geradas e gravadas por vez (limita a memória da geração de 10 milhões de itens)
+LINHAS_POR_LOTE = 1_000_000
+
+# Naturezas da operação: (texto, é entrada, últimos dígitos do CFOP correto)
+NATUREZAS = [
+    ('VENDA DE MERCADORIA', False, '102'),
+    ('COMPRA PARA COMERCIALIZAÇÃO', True, '102'),
+    ('DEVOLUÇÃO DE VENDA', True, '202'),
+    ('Outras Entradas - Dev Remessa Escola', True, '949'),
+    ('REMESSA PARA DEMONSTRAÇÃO', False, '912'),
+    ('REMESSA PARA CONSERTO', False, '915'),
+    ('REMESSA EM COMODATO', False, '908'),
+    ('OUTRAS SAÍDAS', False, '949'),
+]
+UFS = ['SP', 'RJ', 'MG', 'PR', 'RS', 'SC', 'BA', 'PE', 'CE', 'PA', 'GO', 'DF']
+CODIGOS_UF = {'SP': 35, 'RJ': 33, 'MG': 31, 'PR': 41, 'RS': 43, 'SC': 42,
+              'BA': 29, 'PE': 26, 'CE': 23, 'PA': 15, 'GO': 52, 'DF': 53}
+DESTINOS = ['1 - OPERAÇÃO INTERNA', '2 - OPERAÇÃO INTERESTADUAL', '3 - OPERAÇÃO COM EXTERIOR']
+PRODUTOS = [
+    ('COLECAO SPE EF1 4ANO VOL 1 AL', '49011000', 'LIVROS'),
+    ('NOTEBOOK 14 POL 8GB 256GB', '84713012', 'MAQUINAS'),
+    ('CADEIRA ESCRITORIO GIRATORIA', '94013000', 'MOVEIS'),
+    ('PAPEL A4 75G RESMA 500FL', '48025610', 'PAPEL'),
+    ('CABO DE REDE CAT6 305M', '85444900', 'CONDUTORES'),
+    ('TONER IMPRESSORA LASER', '84439933', 'PARTES'),
+]
+
+# Proporção de itens com CFOP divergente do inferido
+PROPORCAO_DIVERGENTES = 0.1
+
+# Métricas comparadas com a referência: menor é melhor
+METRICAS_COMPARADAS = ('carga_sem_cache_s', 'carga_com_cache_s', 'validacao_s')
+
+
+# ============================================================================
+# GERAÇÃO DOS DADOS SINTÉTICOS
+# ============================================================================
+
+def _texto_com_zeros(valores: np.ndarray, largura: int) -> pd.Series:
+    return pd.Series(valores).astype(str).str.zfill(largura)
+
+
+def _gravar_csv(df: pd.DataFrame, caminho: str, cabecalho: bool):
+    """Acrescenta um lote ao CSV (cria o arquivo com o cabeçalho no primeiro lote)"""
+    df.to_csv(caminho, mode='w' if cabecalho else 'a', header=cabecalho, index=False)
+
+
+def gerar_dados(diretorio: str, total_itens: int, semente: int = 42) -> dict:
+    """
+    Gera os três CSVs sintéticos com `total_itens` itens
+
+    Os arquivos são reaproveitados se já existirem com o mesmo tamanho e semente.
+
+    Args:
+        diretorio: Onde gravar os CSVs
+        total_itens: Quantidade de linhas do arquivo de itens
+        semente: Semente do gerador (mesmos dados a cada execução)
+
+    Returns:
+        Caminhos dos CSVs (cabecalho, itens, cfop)
+    """
+    caminhos = {
+        'cabecalho': os.path.join(diretorio, '202401_NFs_Cabecalho.csv'),
+        'itens': os.path.join(diretorio, '202401_NFs_Itens.csv'),
+        'cfop': os.path.join(diretorio, 'CFOP.csv'),
+    }
+    marcador = os.path.join(diretorio, 'gerado.json')
+    identificacao = {'total_itens': total_itens, 'semente': semente}
+    if os.path.exists(marcador):
+        with open(marcador) as f:
+            if json.load(f) == identificacao and all(os.path.exists(c) for c in caminhos.values()):
+                print(f"♻️ Dados sintéticos já gerados em {diretorio}")
+                return caminhos
+
+    os.makedirs(diretorio, exist_ok=True)
+    print(f"🏭 Gerando {total_itens:,} itens em {diretorio}...")
+    inicio = time.perf_counter()
+    rng = np.random.default_rng(semente)
+    total_notas = max(total_itens // ITENS_POR_NOTA, 1)
+
+    # Tabela CFOP: todas as combinações de primeiro dígito e últimos dígitos usados
+    sufixos = sorted({digitos for _, _, digitos in NATUREZAS} | {'910'})
+    codigos = [f"{p}.{s}" for p in '123567' for s in sufixos]
+    pd.DataFrame({
+        'CFOP': codigos,
+        'DESCRIÇÃO': [f"Operação {c}" for c in codigos],
+        'APLICAÇÃO': [f"Classificam-se neste código as operações {c}" for c in codigos],
+    }).to_csv(caminhos['cfop'], index=False)
+
+    # Cabeçalho: uma linha por nota, em lotes
+    natureza_nota = np.empty(total_notas, dtype=np.int64)
+    primeiro_digito_nota = np.empty(total_notas, dtype=np.int64)
+    chaves_nota = np.empty(total_notas, dtype=object)
+    for lote in range(0, total_notas, LINHAS_POR_LOTE):
+        n = min(LINHAS_POR_LOTE, total_notas - lote)
+        numeros = np.arange(lote, lote + n) + 1
+        naturezas = rng.integers(0, len(NATUREZAS), n)
+        uf_emit = rng.integers(0, len(UFS), n)
+        uf_dest = np.where(rng.random(n) < 0.6, uf_emit, rng.integers(0, len(UFS), n))
+        exterior = rng.random(n) < 0.02
+        destino = np.where(exterior, 2, np.where(uf_emit == uf_dest, 0, 1))
+        entrada = np.array([NATUREZAS[i][1] for i in range(len(NATUREZAS))])[naturezas]
+        cnpj_emit = rng.integers(10**13, 10**14 - 1, n)
+
+        siglas_emit = np.array(UFS)[uf_emit]
+        chaves = (
+            _texto_com_zeros(np.vectorize(CODIGOS_UF.get)(siglas_emit), 2) + '2401'
+            + _texto_com_zeros(cnpj_emit, 14) + '55' + '001' + _texto_com_zeros(numeros, 9)
+            + '1' + _texto_com_zeros(rng.integers(0, 10**8, n), 8) + _texto_com_zeros(numeros % 10, 1)
+        )
+        chaves_nota[lote:lote + n] = chaves.to_numpy()
+        natureza_nota[lote:lote + n] = naturezas
+        primeiro_digito_nota[lote:lote + n] = np.where(entrada, 1, 5) + destino
+
+        _gravar_csv(pd.DataFrame({
+            'CHAVE DE ACESSO': chaves,
+            'MODELO': 55,
+            'SÉRIE': 1,
+            'NÚMERO': numeros,
+            'NATUREZA DA OPERAÇÃO': np.array([t for t, _, _ in NATUREZAS])[naturezas],
+            'DATA EMISSÃO': '2024-01-15 10:30:00',
+            'CPF/CNPJ Emitente': _texto_com_zeros(cnpj_emit, 14),
+            'NOME EMITENTE': pd.Series(numeros % 5000).map(lambda i: f"EMPRESA EMITENTE {i} LTDA"),
+            'INSCRIÇÃO ESTADUAL EMITENTE': _texto_com_zeros(rng.integers(0, 10**12, n), 12),
+            'UF EMITENTE': siglas_emit,
+            'MUNICÍPIO EMITENTE': np.char.add('MUNICIPIO ', siglas_emit.astype(str)),
+            'CNPJ DESTINATÁRIO': _texto_com_zeros(rng.integers(10**13, 10**14 - 1, n), 14),
+            'NOME DESTINATÁRIO': pd.Series(numeros % 20000).map(lambda i: f"CLIENTE {i}"),
+            'UF DESTINATÁRIO': np.array(UFS)[uf_dest],
+            'INDICADOR IE DESTINATÁRIO': np.where(rng.random(n) < 0.7, '1 - CONTRIBUINTE ICMS', '9 - NÃO CONTRIBUINTE'),
+            'DESTINO DA OPERAÇÃO': np.array(DESTINOS)[destino],
+            'CONSUMIDOR FINAL': np.where(rng.random(n) < 0.3, '1 - CONSUMIDOR FINAL', '0 - NORMAL'),
+            'PRESENÇA DO COMPRADOR': '9 - OPERAÇÃO NÃO PRESENCIAL, OUTROS',
+            'EVENTO MAIS RECENTE': 'AUTORIZAÇÃO DE USO',
+            'VALOR NOTA FISCAL': np.round(rng.random(n) * 10000, 2),
+        }), caminhos['cabecalho'], cabecalho=lote == 0)
+
+    # Itens: cada item pertence a uma nota (ordenados por nota), em lotes
+    nota_do_item = np.sort(rng.integers(0, total_notas, total_itens))
+    primeiros_da_nota = np.searchsorted(nota_do_item, np.arange(total_notas))
+    for lote in range(0, total_itens, LINHAS_POR_LOTE):
+        n = min(LINHAS_POR_LOTE, total_itens - lote)
+        notas = nota_do_item[lote:lote + n]
+        produtos = rng.integers(0, len(PRODUTOS), n)
+        quantidades = rng.integers(1, 50, n).astype(float)
+        unitarios = np.round(rng.random(n) * 500 + 1, 2)
+
+        # CFOP correto (primeiro dígito da nota + últimos dígitos da natureza), com uma parte divergente
+        sufixos_item = np.array([d for _, _, d in NATUREZAS])[natureza_nota[notas]]
+        primeiros = primeiro_digito_nota[notas]
+        divergentes = rng.random(n) < PROPORCAO_DIVERGENTES
+        primeiros = np.where(divergentes, rng.choice([1, 2, 5, 6], n), primeiros)
+        cfops = np.char.add(primeiros.astype(str), sufixos_item.astype(str))
+
+        _gravar_csv(pd.DataFrame({
+            'CHAVE DE ACESSO': chaves_nota[notas],
+            'MODELO': 55,
+            'SÉRIE': 1,
+            'NÚMERO': notas + 1,
+            'NATUREZA DA OPERAÇÃO': np.array([t for t, _, _ in NATUREZAS])[natureza_nota[notas]],
+            'NÚMERO PRODUTO': np.arange(lote, lote + n) - primeiros_da_nota[notas] + 1,
+            'DESCRIÇÃO DO PRODUTO/SERVIÇO': np.array([p[0] for p in PRODUTOS])[produtos],
+            'CÓDIGO NCM/SH': np.array([p[1] for p in PRODUTOS])[produtos],
+            'NCM/SH (TIPO DE PRODUTO)': np.array([p[2] for p in PRODUTOS])[produtos],
+            'CFOP': cfops,
+            'QUANTIDADE': quantidades,
+            'UNIDADE': 'UN',
+            'VALOR UNITÁRIO': unitarios,
+            'VALOR TOTAL': np.round(quantidades * unitarios, 2),
+        }), caminhos['itens'], cabecalho=lote == 0)
+        print(f"   📝 {min(lote + n, total_itens):,}/{total_itens:,} itens")
+
+    with open(marcador, 'w') as f:
+        json.dump(identificacao, f)
+    print(f"   ✅ Dados gerados em {time.perf_counter() - inicio:.1f}s")
+    return caminhos
+
+
+# ============================================================================
+# MEDIÇÕES
+# ============================================================================
+
+def pico_rss_mb() -> float:
+    """Pico de memória residente do processo em MB (0 se indisponível)"""
+    if resource is None:
+        return 0.0
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def resumir_latencias(tempos: list) -> dict:
+    """Média, percentis (ms) e vazão (chamadas por segundo) de uma série de tempos em segundos"""
+    ms = np.array(tempos) * 1000
+    return {
+        'chamadas': len(tempos),
+        'media_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+        'vazao_por_s': round(len(tempos) / max(float(ms.sum()) / 1000, 1e-9), 1),
+    }
+
+
+def _medir(funcao, *args):
+    """Executa sem a saída das ferramentas no terminal e retorna (segundos, resultado)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        return time.perf_counter() - inicio, resultado
+
+
+def _argumentos_ferramentas(agente, rng: random.Random, repeticoes: int) -> dict:
+    """Argumentos variados (posições, notas, chaves e CFOPs sorteados) para cada ferramenta"""
+    total_notas = len(agente.df_cabecalho)
+    total_itens = agente._contar_itens()
+    posicoes_notas = [rng.randrange(total_notas) for _ in range(repeticoes)]
+    numeros = agente.df_cabecalho['NÚMERO'].iloc[posicoes_notas].astype(str).tolist()
+    chaves = agente.df_cabecalho['CHAVE DE ACESSO'].iloc[posicoes_notas].astype(str).tolist()
+    codigos_cfop = agente.df_cfop['CFOP'].astype(str).str.replace('.', '', regex=False).tolist() + ['9999']
+
+    return {
+        'contar_notas': [()] * repeticoes,
+        'listar_notas_cabecalho': [("10",)] * repeticoes,
+        'buscar_nota_por_indice': [(str(p),) for p in posicoes_notas],
+        'buscar_item_por_indice': [(str(rng.randrange(total_itens)),) for _ in range(repeticoes)],
+        'buscar_cfop_por_indice': [(str(rng.randrange(len(agente.df_cfop))),) for _ in range(repeticoes)],
+        'buscar_nota_por_chave': [(c,) for c in chaves],
+        'buscar_nota_cabecalho': [(n,) for n in numeros],
+        'buscar_itens_nota': [(n,) for n in numeros],
+        'buscar_cfop': [(rng.choice(codigos_cfop),) for _ in range(repeticoes)],
+        'validar_cfop_item_especifico': [(c, "1") for c in chaves],
+    }
+
+
+def executar_tamanho(nome: str, caminhos: dict, repeticoes: int, repeticoes_agente: int,
+                     repeticoes_validacao: int, diretorio_cache: str) -> dict:
+    """
+    Mede um tamanho de dados (executado num processo próprio, ver `main`)
+
+    Returns:
+        Métricas do tamanho
+    """
+    from agente_cfop import AgenteValidadorCFOP
+
+    print(f"\n{'='*70}\n⏱️ BENCHMARK {nome}\n{'='*70}")
+    resultado = {'tamanho': nome}
+
+    # Carga sem cache (parse dos CSVs) e com o cache colunar gravado na primeira
+    shutil.rmtree(diretorio_cache, ignore_errors=True)
+    tempo, agente = _medir(AgenteValidadorCFOP, caminhos['cabecalho'], caminhos['itens'], caminhos['cfop'])
+    resultado['carga_sem_cache_s'] = round(tempo, 3)
+    del agente
+    gc.collect()
+    tempo, agente = _medir(AgenteValidadorCFOP, caminhos['cabecalho'], caminhos['itens'], caminhos['cfop'])
+    resultado['carga_com_cache_s'] = round(tempo, 3)
+    print(f"   📂 Carga: {resultado['carga_sem_cache_s']}s sem cache, {resultado['carga_com_cache_s']}s com cache")
+
+    total_itens = agente._contar_itens()
+    resultado.update({
+        'itens': total_itens,
+        'notas': len(agente.df_cabecalho),
+        'modo_streaming_itens': agente.modo_streaming_itens,
+        'carga_itens_por_s': round(total_itens / max(resultado['carga_sem_cache_s'], 1e-9)),
+    })
+
+    # Ferramentas (a memorização está desligada: cada chamada faz a consulta de verdade)
+    rng = random.Random(7)
+    resultado['ferramentas'] = {}
+    for nome_ferramenta, argumentos in _argumentos_ferramentas(agente, rng, repeticoes).items():
+        funcao = agente._ferramentas[nome_ferramenta].func
+        tempos = [_medir(funcao, *args)[0] for args in argumentos]
+        resultado['ferramentas'][nome_ferramenta] = resumir_latencias(tempos)
+        print(f"   🔧 {nome_ferramenta}: p50 {resultado['ferramentas'][nome_ferramenta]['p50_ms']}ms")
+
+    # Validação completa
+    tempos = [_medir(agente._ferramentas['validar_todas_notas'].func)[0] for _ in range(repeticoes_validacao)]
+    resultado['validacao_s'] = round(min(tempos), 3)
+    resultado['validacao_itens_por_s'] = round(total_itens / max(min(tempos), 1e-9))
+    print(f"   ✅ Validação: {resultado['validacao_s']}s ({resultado['validacao_itens_por_s']:,} itens/s)")
+
+    # Agente executor com o LLM roteirizado (sem cache de respostas nem roteador)
+    chave = agente.df_cabecalho['CHAVE DE ACESSO'].iloc[0]
+    perguntas = [
+        "Quantas notas e itens existem nos arquivos carregados?",
+        "Explique o CFOP 5102",
+        f"Qual o CFOP do item 1 da nota {chave}? Está correto?",
+        f"Mostre a nota {chave}",
+    ]
+    tempos = []
+    for i in range(repeticoes_agente):
+        pergunta = perguntas[i % len(perguntas)]
+        tempos.append(_medir(lambda p: agente._executor_para(p).invoke({"input": p}), pergunta)[0])
+    resultado['agente'] = resumir_latencias(tempos)
+    print(f"   🤖 Agente (LLM roteirizado): p50 {resultado['agente']['p50_ms']}ms")
+
+    resultado['pico_rss_mb'] = pico_rss_mb()
+    print(f"   📈 Pico de RSS: {resultado['pico_rss_mb']} MB")
+    return resultado
+
+
+def _executar_no_processo(fila, *args):
+    try:
+        fila.put(executar_tamanho(*args))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        fila.put({'tamanho': args[0], 'erro': str(e)})
+
+
+# ============================================================================
+# COMPARAÇÃO COM A REFERÊNCIA
+# ============================================================================
+
+def comparar(atual: dict, referencia: dict, tolerancia: float) -> list:
+    """
+    Métricas que pioraram além da tolerância em relação à referência
+
+    São comparados os tempos de carga e de validação, o p50 de cada
+    ferramenta e do agente e o pico de RSS, nos tamanhos presentes nos dois.
+
+    Returns:
+        Lista de (tamanho, métrica, referência, atual)
+    """
+    regressoes = []
+    for nome, medicao in atual['resultados'].items():
+        base = referencia.get('resultados', {}).get(nome)
+        if not base or 'erro' in medicao or 'erro' in base:
+            continue
+        pares = [(m, base.get(m), medicao.get(m)) for m in (*METRICAS_COMPARADAS, 'pico_rss_mb')]
+        pares += [(f"ferramentas.{f}.p50_ms", base['ferramentas'].get(f, {}).get('p50_ms'), v['p50_ms'])
+                  for f, v in medicao['ferramentas'].items()]
+        pares.append(('agente.p50_ms', base['agente']['p50_ms'], medicao['agente']['p50_ms']))
+        for metrica, valor_base, valor in pares:
+            if valor_base and valor is not None and valor > valor_base * (1 + tolerancia):
+                regressoes.append((nome, metrica, valor_base, valor))
+    return regressoes
+
+
+# ============================================================================
+# EXECUÇÃO
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do validador de CFOP")
+    parser.add_argument('--tamanhos', default='10k,1m,10m',
+                        help=f"Tamanhos (itens) separados por vírgula: {', '.join(TAMANHOS)} ou um número")
+    parser.add_argument('--diretorio', default='benchmark_dados', help="Onde gerar os CSVs sintéticos e o cache")
+    parser.add_argument('--saida', default='benchmark_resultados.json', help="Arquivo JSON com os resultados")
+    parser.add_argument('--repeticoes', type=int, default=200, help="Chamadas de cada ferramenta")
+    parser.add_argument('--repeticoes-agente', type=int, default=20, help="Execuções do agente com o LLM roteirizado")
+    parser.add_argument('--repeticoes-validacao', type=int, default=3, help="Validações completas (vale a mais rápida)")
+    parser.add_argument('--referencia', help="Resultado anterior para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.25, help="Piora aceita em relação à referência (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    # Configuração dos processos de medição: LLM local, sem memorização nem cache de respostas
+    diretorio = os.path.abspath(args.diretorio)
+    diretorio_cache = os.path.join(diretorio, 'cache')
+    os.environ.setdefault('CFOP_BACKEND_LLM', 'roteiro')
+    os.environ['CFOP_MEMORIA_FERRAMENTAS_MAX'] = '0'
+    os.environ['CFOP_CACHE_RESPOSTAS_MAX'] = '0'
+    os.environ['CFOP_DIRETORIO_CACHE'] = diretorio_cache
+
+    resultados = {
+        'gerado_em': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'backend_llm': os.environ['CFOP_BACKEND_LLM'],
+        'resultados': {},
+    }
+
+    # Cada tamanho num processo novo: o pico de RSS de um não contamina o outro
+    contexto = multiprocessing.get_context('spawn')
+    for nome in [t.strip().lower() for t in args.tamanhos.split(',') if t.strip()]:
+        total_itens = TAMANHOS.get(nome) or int(nome)
+        caminhos = gerar_dados(os.path.join(diretorio, nome), total_itens)
+
+        fila = contexto.Queue()
+        processo = contexto.Process(target=_executar_no_processo, args=(
+            fila, nome, caminhos, args.repeticoes, args.repeticoes_agente,
+            args.repeticoes_validacao, diretorio_cache
+        ))
+        processo.start()
+        resultados['resultados'][nome] = fila.get()
+        processo.join()
+
+        # Grava a cada tamanho: os já medidos não se perdem se um maior falhar
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados gravados em {args.saida}")
+
+    if any('erro' in r for r in resultados['resultados'].values()):
+        print("❌ Houve erro em algum tamanho")
+        sys.exit(1)
+
+    if args.referencia:
+        with open(args.referencia, encoding='utf-8') as f:
+            referencia = json.load(f)
+        regressoes = comparar(resultados, referencia, args.tolerancia)
+        if regressoes:
+            print(f"\n❌ {len(regressoes)} métricas pioraram mais de {args.tolerancia:.0%}:")
+            for nome, metrica, valor_base, valor in regressoes:
+                print(f"   - {nome} {metrica}: {valor_base} -> {valor}")
+            sys.exit(1)
+        print(f"\n✅ Nenhuma regressão acima de {args.tolerancia:.0%} em relação a {args.referencia}")
+
+
+if __name__ == "__main__":
+    main()
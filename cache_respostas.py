@@ -0,0 +1,203 @@
+"""
+Cache das respostas do agente
+
+Guarda a resposta de cada pergunta já feita sobre a mesma versão dos dados
+(impressão digital dos três CSVs), evitando repetir a execução do agente.
+As entradas expiram pelo tempo (TTL) e, quando o cache enche, sai a menos
+usada recentemente (LRU).
+
+Também memoriza o resultado das ferramentas do agente, que são chamadas
+repetidamente com os mesmos argumentos dentro de uma execução e entre
+perguntas.
+"""
+
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Quantidade máxima de respostas guardadas (0 desativa o cache)
+MAXIMO_RESPOSTAS_CACHE = int(os.getenv("CFOP_CACHE_RESPOSTAS_MAX", "256"))
+
+# Tempo de vida de cada resposta em segundos
+TTL_RESPOSTAS_CACHE = float(os.getenv("CFOP_CACHE_RESPOSTAS_TTL", "3600"))
+
+# Resultados memorizados por ferramenta do agente (0 desativa)
+MAXIMO_RESULTADOS_FERRAMENTA = int(os.getenv("CFOP_MEMORIA_FERRAMENTAS_MAX", "128"))
+
+# Início das mensagens de erro devolvidas pelas ferramentas (não são memorizadas)
+PREFIXOS_ERRO_FERRAMENTA = ("Erro", "❌ Erro")
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """
+    Normaliza uma pergunta para comparação no cache
+
+    Ignora maiúsculas/minúsculas, acentos, espaços repetidos e a pontuação
+    final ("Quantas notas?" e "quantas  notas" são a mesma pergunta).
+
+    Args:
+        pergunta: Pergunta do usuário
+
+    Returns:
+        Pergunta normalizada
+    """
+    texto = unicodedata.normalize('NFKD', pergunta.casefold())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\s+', ' ', texto).strip()
+    return texto.rstrip('?!. ')
+
+
+class CacheRespostas:
+    """Cache LRU com TTL das respostas do agente, seguro para várias threads"""
+
+    def __init__(self, maximo: int = MAXIMO_RESPOSTAS_CACHE, ttl: float = TTL_RESPOSTAS_CACHE):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._respostas = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def _chave(self, versao_dados: str, pergunta: str) -> tuple:
+        return versao_dados, normalizar_pergunta(pergunta)
+
+    def obter(self, versao_dados: str, pergunta: str) -> Optional[str]:
+        """
+        Busca a resposta de uma pergunta para a versão dos dados
+
+        Args:
+            versao_dados: Impressão digital dos CSVs carregados
+            pergunta: Pergunta do usuário
+
+        Returns:
+            Resposta guardada ou None se não houver (ou tiver expirado)
+        """
+        if self.maximo <= 0:
+            return None
+
+        chave = self._chave(versao_dados, pergunta)
+        with self._lock:
+            entrada = self._respostas.get(chave)
+            if entrada is not None and time.monotonic() - entrada[0] > self.ttl:
+                del self._respostas[chave]
+                entrada = None
+
+            if entrada is None:
+                self.falhas += 1
+                return None
+
+            self._respostas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[1]
+
+    def guardar(self, versao_dados: str, pergunta: str, resposta: str):
+        """Guarda a resposta, removendo a menos usada se o cache estiver cheio"""
+        if self.maximo <= 0:
+            return
+
+        chave = self._chave(versao_dados, pergunta)
+        with self._lock:
+            self._respostas[chave] = (time.monotonic(), resposta)
+            self._respostas.move_to_end(chave)
+            while len(self._respostas) > self.maximo:
+                self._respostas.popitem(last=False)
+
+    def limpar(self):
+        """Remove todas as respostas (ex.: após um novo upload)"""
+        with self._lock:
+            self._respostas.clear()
+
+    def estatisticas(self) -> dict:
+        """Contadores de uso do cache para o endpoint /status"""
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "ativo": self.maximo > 0,
+                "entradas": len(self._respostas),
+                "maximo": self.maximo,
+                "ttl_segundos": self.ttl,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / consultas, 3) if consultas else 0.0
+            }
+
+
+def _resultado_de_erro(resultado) -> bool:
+    """Indica se a saída de uma ferramenta é uma mensagem de erro (ex.: falha temporária)"""
+    return isinstance(resultado, str) and resultado.lstrip().startswith(PREFIXOS_ERRO_FERRAMENTA)
+
+
+def memorizar_ferramenta(funcao, versao: Optional[Callable[[], str]] = None,
+                         maximo: int = MAXIMO_RESULTADOS_FERRAMENTA):
+    """
+    Envolve uma ferramenta do agente com memorização LRU dos resultados
+
+    Os argumentos são associados aos parâmetros da função antes de formar a
+    chave, então `f("5")` e `f(indice="5")` compartilham o mesmo resultado.
+    A chave inclui a versão dos dados lida no início da chamada: uma chamada
+    iniciada antes de uma recarga e concluída depois não deixa o resultado
+    sobre os dados anteriores valendo para os novos. Mensagens de erro não
+    são memorizadas. A função retornada tem os métodos `limpar()` e
+    `estatisticas()`.
+
+    Args:
+        funcao: Função da ferramenta (closure criada em `_criar_ferramentas`)
+        versao: Retorna a versão dos dados usada pela chamada (ex.: `versao_dados` do agente)
+        maximo: Quantidade máxima de resultados guardados
+
+    Returns:
+        Função com a mesma assinatura da original
+    """
+    assinatura = inspect.signature(funcao)
+    resultados = OrderedDict()
+    lock = threading.Lock()
+    contadores = {'acertos': 0, 'falhas': 0}
+
+    @functools.wraps(funcao)
+    def memorizada(*args, **kwargs):
+        if maximo <= 0:
+            return funcao(*args, **kwargs)
+
+        argumentos = assinatura.bind(*args, **kwargs)
+        argumentos.apply_defaults()
+        chave = (versao() if versao else None, *argumentos.arguments.items())
+
+        with lock:
+            if chave in resultados:
+                resultados.move_to_end(chave)
+                contadores['acertos'] += 1
+                print(f"   💾 Tool: {funcao.__name__} - resultado em memória")
+                return resultados[chave]
+            contadores['falhas'] += 1
+
+        resultado = funcao(*args, **kwargs)
+        if _resultado_de_erro(resultado):
+            return resultado
+
+        with lock:
+            resultados[chave] = resultado
+            while len(resultados) > maximo:
+                resultados.popitem(last=False)
+        return resultado
+
+    def limpar():
+        with lock:
+            resultados.clear()
+
+    def estatisticas():
+        with lock:
+            return {'entradas': len(resultados), **contadores}
+
+    memorizada.limpar = limpar
+    memorizada.estatisticas = estatisticas
+    return memorizada
+
+
+# Cache compartilhado por todas as instâncias do agente
+cache_respostas = CacheRespostas()
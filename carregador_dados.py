@@ -0,0 +1,546 @@
+"""
+Carregamento dos CSVs de notas fiscais com cache colunar
+
+O primeiro carregamento de cada CSV grava uma cópia já tipada em formato
+Arrow IPC (Feather v2, sem compressão) no diretório de cache, identificada
+pelo hash do conteúdo do arquivo. Nos carregamentos seguintes o cache é
+mapeado em memória e o parse do CSV é evitado.
+
+Os CSVs podem ser lidos direto de dentro do ZIP enviado, com caminhos no
+formato "arquivo.zip::membro.csv".
+
+No modo de dados compartilhados (vários workers do uvicorn), só um processo
+faz o parse de cada CSV e todos usam o mesmo arquivo de cache mapeado em
+memória, sem cópias: os dados ocupam a RAM uma vez, no cache de páginas do
+sistema operacional.
+"""
+
+import contextlib
+import hashlib
+import os
+import struct
+import zipfile
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    PYARROW_DISPONIVEL = True
+except ImportError:
+    PYARROW_DISPONIVEL = False
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Diretório do cache: fora do código-fonte e dos diretórios de dados (substituídos a cada upload)
+DIRETORIO_CACHE = os.getenv(
+    "CFOP_DIRETORIO_CACHE",
+    os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "validador_cfop")
+)
+
+# "1": workers compartilham os dados mapeados em memória (um só parse, sem cópias)
+DADOS_COMPARTILHADOS = os.getenv("CFOP_DADOS_COMPARTILHADOS", "0") == "1"
+
+# Quantidade máxima de arquivos mantidos no cache (os mais antigos saem primeiro)
+MAXIMO_ARQUIVOS_CACHE = int(os.getenv("CFOP_CACHE_MAX_ARQUIVOS", "12"))
+
+# Incrementar quando o formato dos dados gravados no cache mudar
+VERSAO_CACHE = "3"
+
+EXTENSAO_CACHE = ".arrow"
+
+# Modo streaming dos itens: "1" força, "0" desativa; vazio decide pelo tamanho
+MODO_STREAMING_ITENS = os.getenv("CFOP_MODO_STREAMING_ITENS", "")
+
+# Arquivos de itens acima deste tamanho (MB) são lidos em blocos (0 = nunca)
+LIMITE_ITENS_STREAMING_MB = float(os.getenv("CFOP_LIMITE_ITENS_STREAMING_MB", "0"))
+
+# Linhas por bloco na leitura/validação em blocos
+TAMANHO_BLOCO_ITENS = int(os.getenv("CFOP_TAMANHO_BLOCO_ITENS", "200000"))
+
+# Ler os CSVs direto do ZIP enviado ("0" volta a extrair os CSVs)
+LER_CSV_DO_ZIP = os.getenv("CFOP_LER_CSV_DO_ZIP", "1") != "0"
+
+# Caminho de um CSV dentro de um ZIP: "uploads/notas.zip::202401_NFs_Itens.csv"
+SEPARADOR_ZIP = "::"
+
+# ============================================================================
+# ESQUEMA DE TIPOS DAS COLUNAS
+# ============================================================================
+
+CATEGORIA = 'categoria'  # poucos valores distintos repetidos (UF, natureza...)
+TEXTO = 'texto'          # identificadores: nunca inferir número (chaves, CNPJ)
+NUMERO = 'numero'        # valores monetários e quantidades
+
+# Colunas presentes tanto no cabeçalho quanto nos itens
+_ESQUEMA_COMUM = {
+    'CHAVE DE ACESSO': TEXTO,
+    'CHAVE': TEXTO,
+    'CHAVE NF-E': TEXTO,
+    'CHAVE NFE': TEXTO,
+    'CHAVE_ACESSO': TEXTO,
+    'NF-E CHAVE DE ACESSO': TEXTO,
+    'NFE_CHAVE': TEXTO,
+    'CHAVE_NFE': TEXTO,
+    'NÚMERO': TEXTO,
+    'MODELO': CATEGORIA,
+    'SÉRIE': CATEGORIA,
+    'NATUREZA DA OPERAÇÃO': CATEGORIA,
+    'CPF/CNPJ Emitente': TEXTO,
+    'CNPJ DESTINATÁRIO': TEXTO,
+    'INSCRIÇÃO ESTADUAL EMITENTE': TEXTO,
+    'UF EMITENTE': CATEGORIA,
+    'MUNICÍPIO EMITENTE': CATEGORIA,
+    'UF DESTINATÁRIO': CATEGORIA,
+    'INDICADOR IE DESTINATÁRIO': CATEGORIA,
+    'DESTINO DA OPERAÇÃO': CATEGORIA,
+    'CONSUMIDOR FINAL': CATEGORIA,
+    'PRESENÇA DO COMPRADOR': CATEGORIA,
+}
+
+ESQUEMA_CABECALHO = {
+    **_ESQUEMA_COMUM,
+    'EVENTO MAIS RECENTE': CATEGORIA,
+    'VALOR NOTA FISCAL': NUMERO,
+    'VALOR TOTAL DA NF': NUMERO,
+}
+
+ESQUEMA_ITENS = {
+    **_ESQUEMA_COMUM,
+    'CFOP': CATEGORIA,
+    'CÓDIGO NCM/SH': CATEGORIA,
+    'NCM/SH (TIPO DE PRODUTO)': CATEGORIA,
+    'UNIDADE': CATEGORIA,
+    'QUANTIDADE': NUMERO,
+    'VALOR UNITÁRIO': NUMERO,
+    'VALOR TOTAL': NUMERO,
+}
+
+ESQUEMA_CFOP = {
+    'CFOP': TEXTO,
+}
+
+
+def _tipo_texto():
+    """Tipo pandas para texto: buffer Arrow contíguo quando disponível"""
+    if PYARROW_DISPONIVEL:
+        try:
+            return pd.StringDtype('pyarrow', na_value=np.nan)
+        except TypeError:
+            pass
+        try:
+            return pd.StringDtype('pyarrow_numpy')
+        except (TypeError, ValueError):
+            pass
+    return object
+
+
+def _tipos_leitura(esquema: dict) -> dict:
+    """Traduz o esquema para o parâmetro dtype do pd.read_csv"""
+    tipo_texto = _tipo_texto()
+    return {
+        coluna: 'category' if tipo == CATEGORIA else tipo_texto
+        for coluna, tipo in esquema.items()
+    }
+
+
+def _converter_numerico(serie: pd.Series) -> pd.Series:
+    """
+    Converte texto para float64 aceitando ponto ou vírgula decimal
+
+    Se a conversão perder valores (texto que não é número), a coluna é
+    mantida como texto.
+    """
+    preenchidos = int(serie.notna().sum())
+
+    convertida = pd.to_numeric(serie, errors='coerce')
+    if int(convertida.notna().sum()) == preenchidos:
+        return convertida.astype('float64')
+
+    if serie.str.contains(',', regex=False).any():
+        # Formato brasileiro: 1.234,56
+        texto = serie.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        convertida = pd.to_numeric(texto, errors='coerce')
+        if int(convertida.notna().sum()) == preenchidos:
+            return convertida.astype('float64')
+
+    return serie
+
+
+def _aplicar_esquema(df: pd.DataFrame, esquema: dict) -> pd.DataFrame:
+    """Converte as colunas numéricas do esquema (lidas como texto)"""
+    for coluna, tipo in esquema.items():
+        if tipo == NUMERO and coluna in df.columns:
+            df[coluna] = _converter_numerico(df[coluna])
+    return df
+
+
+# ============================================================================
+# LEITURA DIRETA DE MEMBROS DE ZIP
+# ============================================================================
+
+def caminho_membro_zip(arquivo_zip: str, membro: str) -> str:
+    """Monta o caminho de um membro do ZIP no formato aceito pelo carregador"""
+    return f"{arquivo_zip}{SEPARADOR_ZIP}{membro}"
+
+
+def separar_caminho_zip(caminho: str) -> Tuple[str, Optional[str]]:
+    """Separa "arquivo.zip::membro" em (arquivo.zip, membro); (caminho, None) se não for ZIP"""
+    if SEPARADOR_ZIP in caminho:
+        arquivo_zip, membro = caminho.split(SEPARADOR_ZIP, 1)
+        return arquivo_zip, membro
+    return caminho, None
+
+
+def listar_membros_zip(arquivo_zip: str) -> List[str]:
+    """
+    Lista os arquivos de um ZIP como caminhos "arquivo.zip::membro"
+
+    Diretórios e metadados do macOS (__MACOSX) são ignorados.
+    """
+    with zipfile.ZipFile(arquivo_zip) as zf:
+        return [
+            caminho_membro_zip(arquivo_zip, info.filename) for info in zf.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+        ]
+
+
+def _info_membro(arquivo_zip: str, membro: str) -> zipfile.ZipInfo:
+    with zipfile.ZipFile(arquivo_zip) as zf:
+        return zf.getinfo(membro)
+
+
+def tamanho_arquivo(caminho: str) -> int:
+    """Tamanho em bytes de um arquivo ou do conteúdo descompactado de um membro de ZIP"""
+    arquivo_zip, membro = separar_caminho_zip(caminho)
+    if membro is None:
+        return os.path.getsize(caminho)
+    return _info_membro(arquivo_zip, membro).file_size
+
+
+def _inicio_dados_membro(arquivo: str, info: zipfile.ZipInfo) -> int:
+    """Posição, no arquivo ZIP, do primeiro byte do conteúdo de um membro"""
+    with open(arquivo, 'rb') as f:
+        f.seek(info.header_offset)
+        cabecalho_local = f.read(30)
+    tamanho_nome, tamanho_extra = struct.unpack('<HH', cabecalho_local[26:30])
+    return info.header_offset + 30 + tamanho_nome + tamanho_extra
+
+
+@contextlib.contextmanager
+def abrir_arquivo(caminho: str):
+    """
+    Abre um CSV para leitura binária, direto do ZIP quando for um membro
+
+    Membros armazenados sem compressão são lidos como uma fatia do ZIP
+    mapeado em memória (sem cópia); os compactados são descompactados em
+    fluxo, sem passar pelo disco.
+    """
+    arquivo_zip, membro = separar_caminho_zip(caminho)
+    if membro is None:
+        with open(caminho, 'rb') as f:
+            yield f
+        return
+
+    with zipfile.ZipFile(arquivo_zip) as zf:
+        info = zf.getinfo(membro)
+        armazenado = info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1
+
+        if armazenado and PYARROW_DISPONIVEL:
+            mapa = pa.memory_map(arquivo_zip, 'r')
+            try:
+                mapa.seek(_inicio_dados_membro(arquivo_zip, info))
+                yield pa.BufferReader(mapa.read_buffer(info.file_size))
+            finally:
+                mapa.close()
+        else:
+            with zf.open(info) as f:
+                yield f
+
+
+# Hashes já calculados: (caminho, membro do ZIP, tamanho, data de modificação) -> hash
+_hashes_calculados = {}
+
+
+def calcular_hash_arquivo(caminho: str, tamanho_bloco: int = 8 * 1024 * 1024) -> str:
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo lendo-o em blocos
+
+    O resultado fica memorizado enquanto o arquivo não mudar de tamanho
+    nem de data de modificação. Membros de ZIP são lidos (descompactados
+    em fluxo) e têm o conteúdo descompactado calculado da mesma forma: o
+    CRC-32 gravado no ZIP não serve de identificação, já que colisões são
+    fáceis de produzir.
+
+    Args:
+        caminho: Caminho do arquivo (ou "arquivo.zip::membro.csv")
+        tamanho_bloco: Tamanho de cada leitura em bytes
+
+    Returns:
+        Hash hexadecimal do conteúdo
+    """
+    arquivo_zip, membro = separar_caminho_zip(caminho)
+    info = os.stat(arquivo_zip)
+    assinatura = (os.path.abspath(arquivo_zip), membro, info.st_size, info.st_mtime_ns)
+    if assinatura in _hashes_calculados:
+        return _hashes_calculados[assinatura]
+
+    sha = hashlib.sha256()
+    with abrir_arquivo(caminho) as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha.update(bloco)
+
+    _hashes_calculados[assinatura] = sha.hexdigest()
+    return _hashes_calculados[assinatura]
+
+
+def calcular_versao_dados(*caminhos: str) -> str:
+    """
+    Impressão digital de um conjunto de arquivos (muda se qualquer um mudar)
+
+    Args:
+        *caminhos: Caminhos dos arquivos (cabeçalho, itens, CFOP)
+
+    Returns:
+        Hash hexadecimal curto identificando a versão dos dados
+    """
+    hashes = '|'.join(calcular_hash_arquivo(caminho) for caminho in caminhos)
+    return hashlib.sha256(hashes.encode('utf-8')).hexdigest()[:16]
+
+
+def _chave_cache(hash_conteudo: str, opcoes_leitura: dict) -> str:
+    """Chave do cache: conteúdo do CSV + opções de leitura + versão do formato"""
+    assinatura = f"{VERSAO_CACHE}|{hash_conteudo}|{sorted(opcoes_leitura.items())!r}"
+    return hashlib.sha256(assinatura.encode('utf-8')).hexdigest()[:40]
+
+
+def _podar_cache(diretorio: str):
+    """Remove os arquivos de cache menos usados além do limite configurado"""
+    arquivos = [
+        os.path.join(diretorio, nome) for nome in os.listdir(diretorio)
+        if nome.endswith(EXTENSAO_CACHE)
+    ]
+    if len(arquivos) <= MAXIMO_ARQUIVOS_CACHE:
+        return
+
+    arquivos.sort(key=os.path.getmtime)
+    for arquivo in arquivos[:len(arquivos) - MAXIMO_ARQUIVOS_CACHE]:
+        # Mesma trava da leitura/gravação: um cache em uso por outro worker fica para a próxima poda
+        with tentar_bloqueio_exclusivo(arquivo + '.lock') as bloqueado:
+            if not bloqueado:
+                continue
+            try:
+                os.remove(arquivo)
+                remover_arquivo_lock(arquivo + '.lock')
+                print(f"   🧹 Cache removido: {os.path.basename(arquivo)}")
+            except OSError as e:
+                print(f"   ⚠️ Erro ao remover cache {arquivo}: {e}")
+
+
+@contextlib.contextmanager
+def bloqueio_exclusivo(caminho: str):
+    """
+    Trava entre processos (arquivo de lock): enquanto um worker prepara um
+    arquivo compartilhado, os demais esperam e depois só o leem
+    """
+    if fcntl is None:
+        yield
+        return
+
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    while True:
+        with open(caminho, 'a') as arquivo_lock:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+            try:
+                # A poda pode ter removido o arquivo de lock enquanto esperávamos
+                if not _lock_vigente(arquivo_lock, caminho):
+                    continue
+                yield
+                return
+            finally:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def tentar_bloqueio_exclusivo(caminho: str):
+    """
+    Como `bloqueio_exclusivo`, mas sem esperar: devolve False se outro
+    processo estiver com a trava (ex.: lendo ou gravando o arquivo)
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    with open(caminho, 'a') as arquivo_lock:
+        try:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield _lock_vigente(arquivo_lock, caminho)
+        finally:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+
+def remover_arquivo_lock(caminho: str):
+    """Remove um arquivo de lock (chamar com a trava obtida)"""
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def _lock_vigente(arquivo_lock, caminho: str) -> bool:
+    """A trava obtida ainda é a do arquivo de lock em disco (não foi removido e recriado)"""
+    try:
+        return os.fstat(arquivo_lock.fileno()).st_ino == os.stat(caminho).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def tabela_para_pandas(tabela) -> pd.DataFrame:
+    """
+    Converte uma tabela Arrow mapeada em memória para DataFrame sem copiar os dados
+
+    Colunas numéricas sem nulos viram arrays numpy somente leitura sobre o
+    próprio mapa e as de texto continuam no buffer Arrow; só os códigos das
+    categorias (1 byte por linha, em geral) são copiados.
+    """
+    colunas = {}
+    for nome, coluna in zip(tabela.column_names, tabela.columns):
+        numerica = pa.types.is_integer(coluna.type) or pa.types.is_floating(coluna.type)
+        if numerica and coluna.num_chunks == 1 and coluna.null_count == 0:
+            colunas[nome] = coluna.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            colunas[nome] = coluna.to_pandas()
+    return pd.DataFrame(colunas, copy=False)
+
+
+def _gravar_cache(df: pd.DataFrame, arquivo_cache: str):
+    """Grava o DataFrame no cache de forma atômica (arquivo temporário + rename)"""
+    os.makedirs(os.path.dirname(arquivo_cache) or '.', exist_ok=True)
+    temporario = f"{arquivo_cache}.{os.getpid()}.tmp"
+    try:
+        # Um único bloco por coluna: permite ler as colunas numéricas sem cópia
+        feather.write_feather(df, temporario, compression='uncompressed', chunksize=max(len(df), 1))
+        os.replace(temporario, arquivo_cache)
+        print(f"   💾 Cache colunar gravado: {os.path.basename(arquivo_cache)}")
+        _podar_cache(os.path.dirname(arquivo_cache) or '.')
+    except Exception as e:
+        # Colunas com tipos mistos não convertem para Arrow: segue sem cache
+        print(f"   ⚠️ Não foi possível gravar o cache colunar: {e}")
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def carregar_csv(caminho: str, esquema: dict = None, usar_cache: bool = True,
+                 diretorio_cache: str = None, **opcoes_leitura) -> pd.DataFrame:
+    """
+    Carrega um CSV usando o cache colunar quando disponível
+
+    Args:
+        caminho: Caminho do arquivo CSV (ou "arquivo.zip::membro.csv")
+        esquema: Tipos declarados das colunas ({coluna: CATEGORIA|TEXTO|NUMERO});
+            colunas fora do esquema usam a inferência padrão do pandas
+        usar_cache: Se False, sempre faz o parse do CSV
+        diretorio_cache: Diretório do cache (padrão: DIRETORIO_CACHE)
+        **opcoes_leitura: Opções repassadas para pd.read_csv
+
+    Returns:
+        DataFrame com os dados do CSV
+    """
+    esquema = esquema or {}
+
+    def ler_csv():
+        with abrir_arquivo(caminho) as f:
+            df = pd.read_csv(f, dtype=_tipos_leitura(esquema), **opcoes_leitura)
+        return _aplicar_esquema(df, esquema)
+
+    if not usar_cache or not PYARROW_DISPONIVEL:
+        return ler_csv()
+
+    diretorio_cache = diretorio_cache or DIRETORIO_CACHE
+    chave = _chave_cache(calcular_hash_arquivo(caminho), {**opcoes_leitura, 'esquema': esquema})
+    arquivo_cache = os.path.join(diretorio_cache, chave + EXTENSAO_CACHE)
+
+    if not DADOS_COMPARTILHADOS:
+        return _carregar_do_cache(arquivo_cache, ler_csv, compartilhado=False)
+
+    # Um worker faz o parse e grava o cache; os demais esperam e mapeiam o mesmo arquivo
+    with bloqueio_exclusivo(arquivo_cache + '.lock'):
+        return _carregar_do_cache(arquivo_cache, ler_csv, compartilhado=True)
+
+
+def _carregar_do_cache(arquivo_cache: str, ler_csv, compartilhado: bool) -> pd.DataFrame:
+    """Lê o cache colunar (ou faz o parse do CSV e grava o cache)"""
+    if os.path.exists(arquivo_cache):
+        try:
+            tabela = feather.read_table(arquivo_cache, memory_map=True)
+            df = tabela_para_pandas(tabela) if compartilhado else tabela.to_pandas()
+            os.utime(arquivo_cache)
+            print(f"   ⚡ Lido do cache colunar{' (compartilhado)' if compartilhado else ''}: "
+                  f"{os.path.basename(arquivo_cache)}")
+            return df
+        except Exception as e:
+            print(f"   ⚠️ Cache colunar inválido, refazendo parse do CSV: {e}")
+            try:
+                os.remove(arquivo_cache)
+            except OSError:
+                pass
+
+    df = ler_csv()
+    _gravar_cache(df, arquivo_cache)
+
+    # Modo compartilhado: descarta a cópia do parse e passa a usar o arquivo mapeado
+    if compartilhado and os.path.exists(arquivo_cache):
+        return tabela_para_pandas(feather.read_table(arquivo_cache, memory_map=True))
+    return df
+
+
+# ============================================================================
+# LEITURA EM BLOCOS (MODO STREAMING)
+# ============================================================================
+
+def usar_streaming_itens(caminho: str) -> bool:
+    """Decide se o arquivo de itens deve ser lido em blocos em vez de carregado inteiro"""
+    if MODO_STREAMING_ITENS in ("0", "1"):
+        return MODO_STREAMING_ITENS == "1"
+    if LIMITE_ITENS_STREAMING_MB <= 0:
+        return False
+    return tamanho_arquivo(caminho) > LIMITE_ITENS_STREAMING_MB * 1024 * 1024
+
+
+def ler_colunas_csv(caminho: str, esquema: dict = None) -> pd.DataFrame:
+    """DataFrame vazio com as colunas (e tipos do esquema) de um CSV"""
+    with abrir_arquivo(caminho) as f:
+        return pd.read_csv(f, nrows=0, dtype=_tipos_leitura(esquema or {}))
+
+
+def ler_csv_em_blocos(caminho: str, esquema: dict = None,
+                      tamanho_bloco: int = TAMANHO_BLOCO_ITENS, **opcoes_leitura):
+    """
+    Lê um CSV em blocos de linhas aplicando o esquema de tipos
+
+    O pico de memória depende do tamanho do bloco, não do tamanho do arquivo.
+    O índice de cada bloco continua o do bloco anterior (posição no arquivo).
+
+    Args:
+        caminho: Caminho do arquivo CSV
+        esquema: Tipos declarados das colunas
+        tamanho_bloco: Quantidade de linhas por bloco
+        **opcoes_leitura: Opções repassadas para pd.read_csv
+
+    Yields:
+        DataFrame de cada bloco
+    """
+    esquema = esquema or {}
+    with abrir_arquivo(caminho) as f, \
+            pd.read_csv(f, dtype=_tipos_leitura(esquema), chunksize=tamanho_bloco, **opcoes_leitura) as leitor:
+        for bloco in leitor:
+            yield _aplicar_esquema(bloco, esquema)
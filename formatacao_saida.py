@@ -0,0 +1,231 @@
+"""
+Formatação da saída das ferramentas do agente
+
+Tudo o que uma ferramenta retorna volta para o contexto do LLM. O formato
+detalhado (padrão) lista cada coluna de cada registro em uma linha; os
+formatos compactos reduzem o texto com:
+
+- projeção de colunas (a ferramenta recebe as colunas desejadas);
+- colunas com o mesmo valor em todas as linhas mostradas uma vez só;
+- valores longos truncados e valores vazios omitidos;
+- paginação: no máximo `LINHAS_POR_PAGINA` linhas, com o `inicio` da próxima página;
+- serialização em tabela ("compacto") ou JSON ("json").
+
+O tamanho de cada saída é estimado em tokens e acumulado por ferramenta.
+"""
+
+import functools
+import json
+import math
+import os
+import threading
+import pandas as pd
+from typing import List, Optional
+
+# Formatos da saída das ferramentas
+FORMATO_DETALHADO = "detalhado"
+FORMATO_COMPACTO = "compacto"
+FORMATO_JSON = "json"
+FORMATOS_SAIDA = (FORMATO_DETALHADO, FORMATO_COMPACTO, FORMATO_JSON)
+
+# "compacto" ou "json" reduzem os tokens enviados ao LLM; "detalhado" mantém
+# a saída completa, coluna por coluna
+FORMATO_SAIDA = os.getenv("CFOP_FORMATO_SAIDA", FORMATO_DETALHADO).lower()
+if FORMATO_SAIDA not in FORMATOS_SAIDA:
+    print(f"⚠️ CFOP_FORMATO_SAIDA inválido ({FORMATO_SAIDA}), usando '{FORMATO_DETALHADO}'")
+    FORMATO_SAIDA = FORMATO_DETALHADO
+
+# Linhas por página nas listagens dos formatos compactos
+LINHAS_POR_PAGINA = int(os.getenv("CFOP_LINHAS_POR_PAGINA", "20"))
+
+# Valores maiores que isso são truncados nos formatos compactos
+MAXIMO_CARACTERES_VALOR = int(os.getenv("CFOP_MAXIMO_CARACTERES_VALOR", "60"))
+
+# Média de caracteres por token usada na estimativa (texto em português com números)
+CARACTERES_POR_TOKEN = 4
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa do número de tokens de um texto (sem depender do tokenizador do modelo)"""
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def _vazio(valor) -> bool:
+    try:
+        return valor is None or bool(pd.isna(valor)) or valor == ''
+    except (TypeError, ValueError):
+        return False
+
+
+def _texto(valor) -> str:
+    """Valor como texto, truncado em `MAXIMO_CARACTERES_VALOR`"""
+    texto = '' if _vazio(valor) else str(valor)
+    if len(texto) > MAXIMO_CARACTERES_VALOR:
+        texto = texto[:MAXIMO_CARACTERES_VALOR - 1] + '…'
+    return texto
+
+
+def _valor_json(valor):
+    """Valor serializável em JSON (escalares numpy viram tipos Python, vazios viram null)"""
+    if _vazio(valor):
+        return None
+    if hasattr(valor, 'item'):
+        valor = valor.item()
+    if isinstance(valor, str):
+        return _texto(valor)
+    return valor
+
+
+def separar_colunas(colunas: str) -> List[str]:
+    """Converte o argumento `colunas` de uma ferramenta ('CFOP, VALOR TOTAL') em lista"""
+    return [coluna.strip() for coluna in str(colunas or '').split(',') if coluna.strip()]
+
+
+def formatar_registro(registro: pd.Series, formato: str = None) -> str:
+    """
+    Formata um registro (linha do cabeçalho, item ou CFOP)
+
+    Args:
+        registro: Linha do DataFrame
+        formato: Um de `FORMATOS_SAIDA` (padrão: `FORMATO_SAIDA`)
+
+    Returns:
+        Texto com uma linha "coluna: valor" por coluna (detalhado), só as
+        colunas preenchidas (compacto) ou um objeto JSON
+    """
+    formato = formato or FORMATO_SAIDA
+    if formato == FORMATO_DETALHADO:
+        return ''.join(f"{col}: {valor}\n" for col, valor in registro.items())
+
+    preenchidos = {col: valor for col, valor in registro.items() if not _vazio(valor)}
+    if formato == FORMATO_JSON:
+        dados = {col: _valor_json(valor) for col, valor in preenchidos.items()}
+        return json.dumps(dados, ensure_ascii=False, default=str) + "\n"
+    return ''.join(f"{col}: {_texto(valor)}\n" for col, valor in preenchidos.items())
+
+
+def formatar_tabela(df: pd.DataFrame, rotulo: str = "REGISTRO", colunas: Optional[List[str]] = None,
+                    inicio: int = 0, formato: str = None) -> str:
+    """
+    Formata as linhas de um DataFrame (ex.: os itens de uma nota)
+
+    No formato detalhado todas as linhas e colunas são listadas, cada linha
+    num bloco "{rotulo} {índice + 1}". Nos compactos a saída traz só
+    `colunas` (todas se vazio), uma página de `LINHAS_POR_PAGINA` linhas a
+    partir de `inicio` e, se houver mais, o `inicio` da próxima página.
+
+    Args:
+        df: Linhas a formatar (o índice é a posição no arquivo)
+        rotulo: Nome de cada linha no formato detalhado
+        colunas: Colunas a mostrar nos formatos compactos
+        inicio: Primeira linha da página nos formatos compactos
+        formato: Um de `FORMATOS_SAIDA` (padrão: `FORMATO_SAIDA`)
+
+    Returns:
+        Texto formatado
+    """
+    formato = formato or FORMATO_SAIDA
+    if formato == FORMATO_DETALHADO:
+        resultado = ""
+        for idx, linha in df.iterrows():
+            resultado += f"\n{'='*60}\n"
+            resultado += f"{rotulo} {idx + 1}\n"
+            resultado += f"{'='*60}\n"
+            resultado += formatar_registro(linha, formato)
+        return resultado
+
+    # Projeção: colunas pedidas que existem (ignora maiúsculas/minúsculas)
+    if colunas:
+        por_nome = {str(col).upper(): col for col in df.columns}
+        selecionadas = [por_nome[c.upper()] for c in colunas if c.upper() in por_nome]
+        df = df[selecionadas or list(df.columns)]
+
+    total = len(df)
+    inicio = min(max(int(inicio), 0), total)
+    fim = min(inicio + LINHAS_POR_PAGINA, total)
+    pagina = df.iloc[inicio:fim]
+
+    # Colunas com o mesmo valor em todas as linhas (ex.: chave e número da nota) saem uma vez só
+    comuns = {}
+    if total > 1:
+        for col in df.columns:
+            valores = df[col]
+            if valores.nunique(dropna=False) == 1:
+                comuns[col] = valores.iloc[0]
+    variaveis = [col for col in df.columns if col not in comuns]
+    proximo_inicio = fim if fim < total else None
+
+    if formato == FORMATO_JSON:
+        dados = {
+            'total': total,
+            'inicio': inicio,
+            'comuns': {col: _valor_json(valor) for col, valor in comuns.items() if not _vazio(valor)},
+            'colunas': ['ÍNDICE', *variaveis],
+            'linhas': [
+                [int(idx), *(_valor_json(valor) for valor in linha)]
+                for idx, linha in zip(pagina.index, pagina[variaveis].itertuples(index=False))
+            ],
+            'proximo_inicio': proximo_inicio,
+        }
+        return json.dumps(dados, ensure_ascii=False, default=str) + "\n"
+
+    resultado = ""
+    for col, valor in comuns.items():
+        if not _vazio(valor):
+            resultado += f"{col}: {_texto(valor)}\n"
+    resultado += f"Linhas {inicio + 1 if total else 0}-{fim} de {total}\n"
+    resultado += " | ".join(['ÍNDICE', *map(str, variaveis)]) + "\n"
+    for idx, linha in zip(pagina.index, pagina[variaveis].itertuples(index=False)):
+        resultado += " | ".join([str(idx), *map(_texto, linha)]) + "\n"
+    if proximo_inicio is not None:
+        resultado += f"➡️ Há mais linhas: chame novamente com inicio={proximo_inicio}\n"
+    return resultado
+
+
+class ContadorTokens:
+    """Tamanho acumulado (caracteres e tokens estimados) da saída de cada ferramenta"""
+
+    def __init__(self):
+        self._totais = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, ferramenta: str, texto: str):
+        caracteres = len(texto)
+        tokens = estimar_tokens(texto)
+        print(f"   📏 Saída de {ferramenta}: {caracteres:,} caracteres (~{tokens:,} tokens)")
+        with self._lock:
+            totais = self._totais.setdefault(ferramenta, {'chamadas': 0, 'caracteres': 0, 'tokens': 0})
+            totais['chamadas'] += 1
+            totais['caracteres'] += caracteres
+            totais['tokens'] += tokens
+
+    def estatisticas(self, ferramenta: str) -> dict:
+        """Totais de uma ferramenta (zerados se ainda não foi chamada)"""
+        with self._lock:
+            totais = dict(self._totais.get(ferramenta, {'chamadas': 0, 'caracteres': 0, 'tokens': 0}))
+        totais['tokens_por_chamada'] = round(totais['tokens'] / totais['chamadas'], 1) if totais['chamadas'] else 0.0
+        return totais
+
+    def limpar(self):
+        with self._lock:
+            self._totais.clear()
+
+
+def medir_saida(funcao, contador: ContadorTokens):
+    """
+    Envolve uma ferramenta registrando o tamanho de cada saída em `contador`
+
+    Args:
+        funcao: Função da ferramenta (já memorizada, se for o caso)
+        contador: Onde os totais são acumulados
+
+    Returns:
+        Função com a mesma assinatura da original
+    """
+    @functools.wraps(funcao)
+    def medida(*args, **kwargs):
+        resultado = funcao(*args, **kwargs)
+        if isinstance(resultado, str):
+            contador.registrar(funcao.__name__, resultado)
+        return resultado
+    return medida
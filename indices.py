@@ -0,0 +1,391 @@
+"""
+Índices em memória para consultas rápidas aos dados das notas fiscais
+
+No modo de dados compartilhados os índices são gravados no diretório de
+cache e mapeados em memória por todos os workers (ver `TabelaCompartilhada`).
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional, Tuple
+
+from carregador_dados import (DIRETORIO_CACHE, MAXIMO_ARQUIVOS_CACHE, PYARROW_DISPONIVEL, bloqueio_exclusivo,
+                              remover_arquivo_lock, tentar_bloqueio_exclusivo)
+
+if PYARROW_DISPONIVEL:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+# Colunas onde a chave de acesso pode estar no arquivo de cabeçalho
+COLUNAS_CHAVE_ACESSO = [
+    'CHAVE DE ACESSO', 'CHAVE', 'CHAVE NF-E', 'CHAVE NFE',
+    'CHAVE_ACESSO', 'NF-E CHAVE DE ACESSO', 'NFE_CHAVE', 'CHAVE_NFE'
+]
+
+# Caracteres removidos ao normalizar uma chave de acesso
+_PADRAO_SEPARADORES_CHAVE = r"[ \-.']"
+
+
+def normalizar_chave_acesso(chave) -> str:
+    """
+    Remove espaços, hífens, pontos e aspas de uma chave de acesso
+
+    Args:
+        chave: Chave de acesso em qualquer formato
+
+    Returns:
+        Chave normalizada (somente os dígitos/caracteres significativos)
+    """
+    return str(chave).strip().replace(' ', '').replace('-', '').replace('.', '').replace("'", "")
+
+
+def construir_indice_chaves(df: pd.DataFrame, colunas=COLUNAS_CHAVE_ACESSO) -> Dict[str, Tuple[int, str]]:
+    """
+    Monta um dicionário chave de acesso normalizada -> (posição da linha, coluna)
+
+    As colunas são percorridas na ordem de prioridade de `colunas` e, dentro
+    de cada coluna, vale a primeira ocorrência da chave - o mesmo resultado
+    da busca linear que pegava o primeiro registro encontrado.
+
+    Args:
+        df: DataFrame de cabeçalho
+        colunas: Colunas candidatas a conter a chave de acesso
+
+    Returns:
+        Dicionário para busca O(1) pela chave normalizada
+    """
+    indice = {}
+
+    for coluna in colunas:
+        if coluna not in df.columns:
+            continue
+
+        # reset_index: o rótulo de cada valor passa a ser a posição da linha
+        valores = df[coluna].reset_index(drop=True).dropna()
+        normalizados = valores.astype(str).str.replace(_PADRAO_SEPARADORES_CHAVE, '', regex=True)
+        normalizados = normalizados[~normalizados.duplicated()]
+
+        for chave, posicao in zip(normalizados.tolist(), normalizados.index.tolist()):
+            if chave not in indice:
+                indice[chave] = (posicao, coluna)
+
+    return indice
+
+
+def buscar_no_indice(indice: Dict[str, Tuple[int, str]], chave) -> Optional[Tuple[int, str]]:
+    """Retorna (posição, coluna) da chave de acesso ou None se não estiver indexada"""
+    return indice.get(normalizar_chave_acesso(chave))
+
+
+def normalizar_numero_nota(numero) -> str:
+    """
+    Normaliza um número de nota para comparação ('000123', '123.0' -> '123')
+
+    Args:
+        numero: Número da nota em qualquer formato
+
+    Returns:
+        Número como texto, sem zeros à esquerda
+    """
+    texto = re.sub(r'\.0+$', '', str(numero).strip())
+    return texto.lstrip('0') or ('0' if texto else '')
+
+
+def normalizar_numeros_nota(numeros: pd.Series) -> pd.Series:
+    """Versão vetorizada de `normalizar_numero_nota` para uma coluna NÚMERO"""
+    texto = numeros.astype(str).fillna('').str.strip().str.replace(r'\.0+$', '', regex=True)
+    sem_zeros = texto.str.lstrip('0')
+    return sem_zeros.where((sem_zeros != '') | (texto == ''), '0')
+
+
+def construir_tabela_notas(numeros: pd.Series) -> Tuple[np.ndarray, Dict[str, Tuple[int, int]]]:
+    """
+    Agrupa as linhas de um DataFrame por número de nota
+
+    As posições das linhas são ordenadas pelo número da nota (ordenação
+    estável, preservando a ordem original dentro de cada nota) e cada nota
+    recebe a faixa (início, fim) que ocupa nessa ordem.
+
+    Args:
+        numeros: Coluna NÚMERO do DataFrame (itens ou cabeçalho)
+
+    Returns:
+        Tupla (ordem, tabela): `ordem` é o array de posições ordenado por nota e
+        `tabela` mapeia o número normalizado da nota -> (início, fim) em `ordem`
+    """
+    codigos, notas = pd.factorize(normalizar_numeros_nota(numeros).to_numpy())
+    ordem = np.argsort(codigos, kind='stable')
+    fins = np.cumsum(np.bincount(codigos, minlength=len(notas)))
+    inicios = fins - np.bincount(codigos, minlength=len(notas))
+
+    tabela = dict(zip(notas.tolist(), zip(inicios.tolist(), fins.tolist())))
+    return ordem, tabela
+
+
+# ============================================================================
+# TABELA CFOP
+# ============================================================================
+
+# Quantidade de sugestões guardadas em cada prefixo da tabela CFOP
+MAXIMO_SUGESTOES_CFOP = 5
+
+
+def normalizar_cfop(cfop) -> str:
+    """Remove espaços, pontos e vírgulas de um código CFOP ('5.102', '5 102' -> '5102')"""
+    return str(cfop).strip().replace('.', '').replace(',', '').replace(' ', '')
+
+
+class IndiceCFOP:
+    """
+    Tabela CFOP compilada para consultas O(1)
+
+    Guarda a posição da primeira linha de cada código - tanto como está no
+    arquivo quanto normalizado - e uma árvore de prefixos (trie) com as
+    primeiras `MAXIMO_SUGESTOES_CFOP` posições de cada prefixo, na ordem do
+    arquivo, para as sugestões de códigos próximos.
+    """
+
+    def __init__(self, codigos: pd.Series):
+        """
+        Args:
+            codigos: Coluna CFOP da tabela oficial
+        """
+        self.por_codigo = {}
+        self.por_codigo_normalizado = {}
+        self._trie = {'posicoes': [], 'filhos': {}}
+
+        for posicao, codigo in enumerate(codigos.tolist()):
+            if pd.isna(codigo):
+                continue
+            codigo = str(codigo)
+            self.por_codigo.setdefault(codigo, posicao)
+            self.por_codigo_normalizado.setdefault(normalizar_cfop(codigo), posicao)
+
+            # A raiz (prefixo vazio) também guarda as primeiras posições
+            no = self._trie
+            for caractere in [None, *codigo]:
+                if caractere is not None:
+                    no = no['filhos'].setdefault(caractere, {'posicoes': [], 'filhos': {}})
+                if len(no['posicoes']) < MAXIMO_SUGESTOES_CFOP:
+                    no['posicoes'].append(posicao)
+
+    def __len__(self) -> int:
+        return len(self.por_codigo)
+
+    def __contains__(self, cfop) -> bool:
+        return self.buscar(cfop) is not None
+
+    def buscar(self, cfop, formatado: str = None) -> Optional[int]:
+        """
+        Posição da linha do CFOP na tabela
+
+        Args:
+            cfop: Código em qualquer formato (5102, 5.102, 5 102...)
+            formatado: Código já no formato do arquivo, tentado antes do normalizado
+
+        Returns:
+            Posição da primeira linha com o código ou None se não estiver na tabela
+        """
+        if formatado is not None and formatado in self.por_codigo:
+            return self.por_codigo[formatado]
+        return self.por_codigo_normalizado.get(normalizar_cfop(cfop))
+
+    def sugerir(self, prefixo: str) -> List[int]:
+        """Posições dos primeiros códigos (na ordem do arquivo) que começam com `prefixo`"""
+        no = self._trie
+        for caractere in prefixo:
+            no = no['filhos'].get(caractere)
+            if no is None:
+                return []
+        return no['posicoes']
+
+
+# ============================================================================
+# ÍNDICES COMPARTILHADOS (MAPEADOS EM MEMÓRIA)
+# ============================================================================
+
+# Incrementar quando a forma de construir ou gravar os índices mudar
+VERSAO_INDICES = "2"
+
+
+def hash_texto(texto: str) -> int:
+    """Hash de 64 bits de um texto, igual em todos os processos"""
+    return int.from_bytes(hashlib.blake2b(texto.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def hash_textos(textos) -> np.ndarray:
+    """`hash_texto` de cada texto"""
+    return np.fromiter((hash_texto(texto) for texto in textos), dtype=np.uint64, count=len(textos))
+
+
+class TabelaCompartilhada(Mapping):
+    """
+    Dicionário somente leitura texto -> tupla, guardado em arrays
+
+    Substitui os dicionários dos índices no modo de dados compartilhados: as
+    chaves ficam num array Arrow e os valores e hashes em arrays numpy, todos
+    mapeáveis em memória a partir do cache (e portanto compartilhados entre
+    workers). A busca é binária sobre os hashes ordenados.
+    """
+
+    def __init__(self, chaves, valores: np.ndarray, hashes: np.ndarray, posicoes: np.ndarray,
+                 rotulos: Optional[List[str]] = None):
+        self._chaves = chaves
+        self._valores = valores
+        self._hashes = hashes
+        self._posicoes = posicoes
+        # Se informados, o último valor de cada tupla é o índice de um rótulo
+        # (ex.: a coluna onde a chave de acesso foi encontrada)
+        self._rotulos = rotulos
+
+    @classmethod
+    def de_dicionario(cls, dicionario: dict) -> 'TabelaCompartilhada':
+        """Monta a tabela a partir de um dicionário texto -> tupla de inteiros (e rótulo final)"""
+        chaves = list(dicionario.keys())
+        valores = list(dicionario.values())
+
+        rotulos = None
+        if valores and isinstance(valores[0][-1], str):
+            rotulos = sorted({valor[-1] for valor in valores})
+            indice_rotulo = {rotulo: i for i, rotulo in enumerate(rotulos)}
+            valores = [(*valor[:-1], indice_rotulo[valor[-1]]) for valor in valores]
+
+        largura = len(valores[0]) if valores else 2
+        hashes = hash_textos(chaves)
+        posicoes = np.argsort(hashes, kind='stable')
+        return cls(
+            pa.array(chaves, type=pa.large_string()),
+            np.array(valores, dtype=np.int64).reshape(len(chaves), largura),
+            hashes[posicoes], posicoes, rotulos
+        )
+
+    def gravar(self, prefixo: str):
+        """Grava a tabela em `prefixo`_*.arrow/.npy"""
+        metadados = {'rotulos': json.dumps(self._rotulos)}
+        tabela = pa.table({'chave': self._chaves}).replace_schema_metadata(metadados)
+        feather.write_feather(tabela, f"{prefixo}_chaves.arrow", compression='uncompressed',
+                              chunksize=max(len(self._chaves), 1))
+        np.save(f"{prefixo}_valores.npy", self._valores)
+        np.save(f"{prefixo}_hashes.npy", self._hashes)
+        np.save(f"{prefixo}_posicoes.npy", self._posicoes)
+
+    @classmethod
+    def carregar(cls, prefixo: str) -> 'TabelaCompartilhada':
+        """Mapeia em memória uma tabela gravada com `gravar`"""
+        tabela = feather.read_table(f"{prefixo}_chaves.arrow", memory_map=True)
+        rotulos = json.loads(tabela.schema.metadata[b'rotulos'])
+        return cls(
+            tabela.column('chave').combine_chunks(),
+            np.load(f"{prefixo}_valores.npy", mmap_mode='r'),
+            np.load(f"{prefixo}_hashes.npy", mmap_mode='r'),
+            np.load(f"{prefixo}_posicoes.npy", mmap_mode='r'),
+            rotulos
+        )
+
+    def _valor(self, posicao: int) -> tuple:
+        valor = tuple(int(v) for v in self._valores[posicao])
+        if self._rotulos is not None:
+            valor = (*valor[:-1], self._rotulos[valor[-1]])
+        return valor
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            h = np.uint64(hash_texto(chave))
+            inicio = np.searchsorted(self._hashes, h, side='left')
+            fim = np.searchsorted(self._hashes, h, side='right')
+            for posicao in self._posicoes[inicio:fim]:
+                if self._chaves[int(posicao)].as_py() == chave:
+                    return self._valor(int(posicao))
+        raise KeyError(chave)
+
+    def __iter__(self):
+        return iter(self._chaves.to_pylist())
+
+    def __len__(self) -> int:
+        return len(self._chaves)
+
+    def keys(self) -> List[str]:
+        return self._chaves.to_pylist()
+
+    def values(self) -> List[tuple]:
+        return [self._valor(posicao) for posicao in range(len(self))]
+
+
+def _podar_indices(diretorio: str):
+    """Remove os índices gravados menos usados além do limite do cache"""
+    gravados = [os.path.join(diretorio, nome) for nome in os.listdir(diretorio)
+                if os.path.isdir(os.path.join(diretorio, nome)) and not nome.endswith('.tmp')]
+    gravados.sort(key=os.path.getmtime)
+    for antigo in gravados[:max(len(gravados) - MAXIMO_ARQUIVOS_CACHE, 0)]:
+        # Índices sendo construídos ou mapeados por outro worker ficam para a próxima poda
+        with tentar_bloqueio_exclusivo(antigo + '.lock') as bloqueado:
+            if bloqueado:
+                shutil.rmtree(antigo, ignore_errors=True)
+                remover_arquivo_lock(antigo + '.lock')
+
+
+def carregar_indices_compartilhados(identificacao: str, construir: Callable[[], dict],
+                                    diretorio_cache: str = None) -> dict:
+    """
+    Índices de um conjunto de dados gravados no cache e mapeados em memória
+
+    O primeiro worker constrói os índices e grava; os demais (e os próximos
+    carregamentos dos mesmos dados) só mapeiam os arquivos.
+
+    Args:
+        identificacao: Identifica os dados indexados (ex.: versão dos CSVs)
+        construir: Função que monta os índices: {nome: dicionário, array ou None}
+        diretorio_cache: Diretório do cache (padrão: DIRETORIO_CACHE)
+
+    Returns:
+        {nome: TabelaCompartilhada, array mapeado ou None}
+    """
+    diretorio = os.path.join(diretorio_cache or DIRETORIO_CACHE, 'indices')
+    destino = os.path.join(diretorio, f"{identificacao}_v{VERSAO_INDICES}")
+    descricao = os.path.join(destino, 'indices.json')
+
+    with bloqueio_exclusivo(destino + '.lock'):
+        if not os.path.exists(descricao):
+            indices = construir()
+            temporario = f"{destino}.{os.getpid()}.tmp"
+            shutil.rmtree(temporario, ignore_errors=True)
+            os.makedirs(temporario)
+
+            tipos = {}
+            for nome, indice in indices.items():
+                if isinstance(indice, dict):
+                    TabelaCompartilhada.de_dicionario(indice).gravar(os.path.join(temporario, nome))
+                    tipos[nome] = 'tabela'
+                elif indice is not None:
+                    np.save(os.path.join(temporario, f"{nome}.npy"), np.asarray(indice))
+                    tipos[nome] = 'array'
+                else:
+                    tipos[nome] = None
+            with open(os.path.join(temporario, 'indices.json'), 'w') as f:
+                json.dump(tipos, f)
+
+            shutil.rmtree(destino, ignore_errors=True)
+            os.replace(temporario, destino)
+            print(f"   💾 Índices compartilhados gravados: {os.path.basename(destino)}")
+            _podar_indices(diretorio)
+        else:
+            os.utime(destino)
+            print(f"   ⚡ Índices compartilhados lidos do cache: {os.path.basename(destino)}")
+
+        with open(descricao) as f:
+            tipos = json.load(f)
+
+    return {
+        nome: (
+            TabelaCompartilhada.carregar(os.path.join(destino, nome)) if tipo == 'tabela'
+            else np.load(os.path.join(destino, f"{nome}.npy"), mmap_mode='r') if tipo == 'array'
+            else None
+        )
+        for nome, tipo in tipos.items()
+    }
@@ -1,13 +1,20 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import List, Optional
 from datetime import datetime
 import os
+import json
+import asyncio
 import zipfile
-import shutil
+import aiofiles
 import traceback
 from agente_cfop import AgenteValidadorCFOP
+from cache_respostas import cache_respostas
+from carregador_dados import tamanho_arquivo
+from backends_llm import BACKEND_LLM, MODELO_LLM, MODELOS_POR_TIPO
+from registro_datasets import RegistroDatasets, Dataset, DATASET_PADRAO, nome_arquivo
 
 # ============================================================================
 # CONFIGURAÇÃO DA APLICAÇÃO
@@ -15,8 +22,16 @@ from agente_cfop import AgenteValidadorCFOP
 
 app = FastAPI(title="Sistema de Validação CFOP")
 
-# Variável global para o agente
-agente_validador = None
+# Datasets (um por empresa cliente), cada um com o seu agente
+registro = RegistroDatasets()
+
+# Quantidade máxima de perguntas processadas ao mesmo tempo (as demais aguardam)
+MAX_ANALISES_CONCORRENTES = int(os.getenv("CFOP_MAX_ANALISES_CONCORRENTES", "8"))
+semaforo_analises = asyncio.Semaphore(MAX_ANALISES_CONCORRENTES)
+analises_em_andamento = 0
+
+# Tamanho de cada leitura/gravação do ZIP recebido no upload
+TAMANHO_BLOCO_UPLOAD = 1024 * 1024
 
 # ============================================================================
 # MODELO DE DADOS
@@ -24,81 +39,53 @@ agente_validador = None
 
 class PerguntaRequest(BaseModel):
     pergunta: str
+    dataset_id: str = DATASET_PADRAO
+
+class ValidacaoLoteRequest(BaseModel):
+    chaves: Optional[List[str]] = None
+    dataset_id: str = DATASET_PADRAO
 
 # ============================================================================
-# FUNÇÃO PARA INICIALIZAR AGENTE
+# FUNÇÕES DE ACESSO AOS DATASETS
 # ============================================================================
 
-def inicializar_agente_se_possivel():
-    """Verifica se os CSVs existem e inicializa o agente"""
-    global agente_validador
-    
-    print("\n" + "="*70)
-    print("🔍 VERIFICANDO SE PODE INICIALIZAR AGENTE")
-    print("="*70)
-    
-    temp_dir = "temp_csvs"
-    
-    if not os.path.exists(temp_dir):
-        print("❌ Diretório temp_csvs não existe")
-        print("="*70 + "\n")
-        return False
-    
-    # Procurar os 3 CSVs necessários
-    csvs_encontrados = {
-        'cabecalho': None,
-        'itens': None,
-        'cfop': None
-    }
-    
-    arquivos_no_dir = os.listdir(temp_dir)
-    print(f"📂 Arquivos no diretório: {arquivos_no_dir}")
-    
-    for filename in arquivos_no_dir:
-        filepath = os.path.join(temp_dir, filename)
-        filename_lower = filename.lower()
-        
-        if 'cabecalho' in filename_lower or 'cabeçalho' in filename_lower:
-            csvs_encontrados['cabecalho'] = filepath
-            print(f"   ✅ Cabeçalho: {filename}")
-        elif 'itens' in filename_lower or 'item' in filename_lower:
-            csvs_encontrados['itens'] = filepath
-            print(f"   ✅ Itens: {filename}")
-        elif 'cfop' in filename_lower:
-            csvs_encontrados['cfop'] = filepath
-            print(f"   ✅ CFOP: {filename}")
-    
-    # Verificar se encontrou todos
-    missing = [k for k, v in csvs_encontrados.items() if v is None]
+def obter_dataset(dataset_id: str, criar: bool = False) -> Optional[Dataset]:
+    """Busca o dataset da requisição (400 se o identificador for inválido)"""
+    try:
+        return registro.obter(dataset_id, criar=criar)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def obter_agente_disponivel(dataset_id: str) -> AgenteValidadorCFOP:
+    """
+    Agente que deve atender a requisição
     
-    if missing:
-        print(f"❌ CSVs faltando: {', '.join(missing)}")
-        print("="*70 + "\n")
-        return False
+    Um dataset descarregado da memória (LRU) começa a ser carregado de novo
+    em segundo plano.
     
-    print("\n✅ Todos os CSVs encontrados:")
-    for tipo, path in csvs_encontrados.items():
-        tamanho = os.path.getsize(path)
-        print(f"   - {tipo}: {os.path.basename(path)} ({tamanho:,} bytes)")
+    Raises:
+        HTTPException: 503 enquanto o agente do dataset é inicializado,
+            400 se não houver agente
+    """
+    dataset = obter_dataset(dataset_id)
+    agente = registro.agente(dataset) if dataset else None
+    if agente is not None:
+        return agente
     
-    # Tentar criar o agente
-    try:
-        print("\n🤖 Criando AgenteValidadorCFOP...")
-        agente_validador = AgenteValidadorCFOP(
-            cabecalho_path=csvs_encontrados['cabecalho'],
-            itens_path=csvs_encontrados['itens'],
-            cfop_path=csvs_encontrados['cfop']
+    estado = registro.estado(dataset) if dataset else None
+    if dataset is not None and dataset.inicializando:
+        print(f"⏳ Agente do dataset '{dataset_id}' em inicialização ({estado['progresso']}%)")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Agente em inicialização ({estado['progresso']}% - {estado['etapa']}). Tente novamente em instantes.",
+            headers={"Retry-After": "2"}
         )
-        print("✅ AGENTE INICIALIZADO COM SUCESSO!")
-        print("="*70 + "\n")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Erro ao criar agente: {e}")
-        traceback.print_exc()
-        print("="*70 + "\n")
-        agente_validador = None
-        return False
+    
+    print(f"❌ Agente não inicializado (dataset '{dataset_id}')!")
+    raise HTTPException(
+        status_code=400,
+        detail="Agente não inicializado. Faça upload dos arquivos primeiro!"
+    )
 
 # ============================================================================
 # EVENTO DE STARTUP
@@ -115,12 +102,16 @@ async def startup_event():
     
     # Criar diretórios se não existirem
     os.makedirs("uploads", exist_ok=True)
-    os.makedirs("temp_csvs", exist_ok=True)
+    datasets = registro.descobrir()
     print("✅ Diretórios criados/verificados")
+    print(f"🗃️ Datasets encontrados: {', '.join(datasets) if datasets else 'nenhum'}")
     
-    # Tentar inicializar agente automaticamente
-    print("\n🔄 Tentando inicializar agente automaticamente...")
-    inicializar_agente_se_possivel()
+    # Tentar inicializar o dataset padrão (em segundo plano: o servidor já atende);
+    # os demais são carregados no primeiro acesso
+    dataset_padrao = registro.obter(DATASET_PADRAO)
+    if dataset_padrao is not None:
+        print("\n🔄 Tentando inicializar agente automaticamente...")
+        registro.iniciar_inicializacao(dataset_padrao)
 
 # ============================================================================
 # COMPONENTE DE NAVEGAÇÃO (para reusar em todas as páginas)
@@ -192,39 +183,61 @@ def home():
     """)
 
 @app.get("/status")
-def status():
-    """Status do sistema"""
-    temp_dir = "temp_csvs"
-    csvs_disponiveis = []
-    
-    if os.path.exists(temp_dir):
-        csvs_disponiveis = os.listdir(temp_dir)
+def status(dataset_id: str = Query(DATASET_PADRAO)):
+    """Status do sistema (e do dataset informado)"""
+    dataset = obter_dataset(dataset_id)
+    # Só informa o estado: a carga fica com /inicializar_agente/, /processar_upload/ e /analisar/
+    agente = dataset.agente if dataset else None
+    csvs_disponiveis = [nome_arquivo(arquivo) for arquivo in dataset.listar_arquivos()] if dataset else []
     
     return {
         "status": "online",
         "timestamp": datetime.now().isoformat(),
-        "agente_inicializado": agente_validador is not None,
+        "dataset_id": dataset_id,
+        "agente_inicializado": agente is not None,
+        "inicializacao": registro.estado(dataset) if dataset else None,
+        "datasets": registro.estatisticas(),
+        "analises": {
+            "em_andamento": analises_em_andamento,
+            "limite_concorrente": MAX_ANALISES_CONCORRENTES
+        },
+        "cache_respostas": cache_respostas.estatisticas(),
         "csvs_disponiveis": csvs_disponiveis,
         "diretorios": {
             "uploads": os.path.exists("uploads"),
-            "temp_csvs": os.path.exists("temp_csvs")
+            "datasets": os.path.exists(registro.diretorio)
         }
     }
 
+@app.get("/datasets")
+def listar_datasets():
+    """Datasets registrados, com o estado de cada agente"""
+    return {
+        **registro.estatisticas(),
+        "datasets": registro.listar()
+    }
+
 @app.get("/debug")
-def debug():
+def debug(dataset_id: str = Query(DATASET_PADRAO)):
     """Informações detalhadas para debug"""
+    dataset = obter_dataset(dataset_id)
+    agente = dataset.agente if dataset else None
     return {
         "agente": {
-            "inicializado": agente_validador is not None,
-            "tipo": str(type(agente_validador)) if agente_validador else None
+            "dataset_id": dataset_id,
+            "inicializado": agente is not None,
+            "tipo": str(type(agente)) if agente else None,
+            "memoria_ferramentas": agente.estatisticas_ferramentas() if agente else None
         },
         "arquivos": {
             "uploads": os.listdir("uploads") if os.path.exists("uploads") else [],
-            "temp_csvs": os.listdir("temp_csvs") if os.path.exists("temp_csvs") else []
+            "dataset": os.listdir(dataset.diretorio) if dataset and os.path.exists(dataset.diretorio) else []
         },
         "ambiente": {
             "openai_key_configurada": bool(os.getenv("OPENAI_API_KEY")),
+            "backend_llm": BACKEND_LLM,
+            "modelo_llm": MODELO_LLM,
+            "modelos_por_tipo": MODELOS_POR_TIPO,
             "cwd": os.getcwd()
         }
     }
@@ -234,24 +247,22 @@ def debug():
 # ============================================================================
 
 @app.post("/inicializar_agente/")
-def inicializar_agente():
-    """Força a reinicialização do agente"""
-    print("\n📍 Requisição para inicializar/reinicializar agente")
+def inicializar_agente(dataset_id: str = Query(DATASET_PADRAO)):
+    """Força a reinicialização do agente do dataset"""
+    print(f"\n📍 Requisição para inicializar/reinicializar agente (dataset '{dataset_id}')")
     
-    sucesso = inicializar_agente_se_possivel()
+    dataset = obter_dataset(dataset_id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' não encontrado. Faça upload dos arquivos primeiro!")
     
-    if sucesso:
-        return {
-            "status": "success",
-            "message": "Agente inicializado com sucesso!",
-            "agente_pronto": True
-        }
-    else:
-        return {
-            "status": "error",
-            "message": "Não foi possível inicializar o agente. Verifique se os 3 CSVs foram carregados.",
-            "agente_pronto": False
-        }
+    estado = registro.iniciar_inicializacao(dataset)
+    
+    return {
+        "status": "accepted",
+        "message": "Inicialização do agente iniciada. Acompanhe o progresso em /status.",
+        "agente_pronto": dataset.agente is not None,
+        "inicializacao": estado
+    }
 
 # ============================================================================
 # PÁGINA DE UPLOAD
@@ -350,6 +361,10 @@ def upload_page():
             
             <input type="file" id="fileInput" accept=".zip" style="display: none;" onchange="handleFileSelect(event)">
             
+            <p style="text-align: center; color: #666;">
+                Dataset (empresa): <input type="text" id="datasetInput" style="padding: 5px;">
+            </p>
+            
             <div id="fileSelected" class="file-selected" style="display: none;">
                 ✅ Arquivo selecionado: <strong id="selectedFileName"></strong>
             </div>
@@ -361,6 +376,8 @@ def upload_page():
 
         <script>
             let arquivoSelecionado = null;
+            const datasetInput = document.getElementById('datasetInput');
+            datasetInput.value = new URLSearchParams(location.search).get('dataset_id') || '{DATASET_PADRAO}';
 
             const uploadArea = document.getElementById('uploadArea');
             
@@ -409,7 +426,8 @@ def upload_page():
                 formData.append('file', arquivoSelecionado);
 
                 try {{
-                    const response = await fetch('/processar_upload/', {{
+                    const datasetId = encodeURIComponent(datasetInput.value.trim());
+                    const response = await fetch(`/processar_upload/?dataset_id=${{datasetId}}`, {{
                         method: 'POST',
                         body: formData
                     }});
@@ -417,15 +435,8 @@ def upload_page():
                     const data = await response.json();
 
                     if (response.ok) {{
-                        resultado.innerHTML = `
-                            ✅ ${{data.message}}<br>
-                            <strong>Agente inicializado:</strong> ${{data.agente_inicializado ? 'Sim' : 'Não'}}<br>
-                            <strong>Arquivos extraídos:</strong> ${{data.arquivos_extraidos.join(', ')}}<br><br>
-                            ${{data.agente_inicializado ? 
-                                '<a href="/analise" style="color: #667eea; font-weight: bold;">→ Ir para Análise Inteligente</a>' : 
-                                '⚠️ Agente não foi inicializado. Verifique se os 3 CSVs estão no ZIP.'}}
-                        `;
                         resultado.className = 'success';
+                        acompanharInicializacao(data);
                     }} else {{
                         resultado.innerHTML = `❌ Erro: ${{data.detail}}`;
                         resultado.className = 'error';
@@ -435,6 +446,37 @@ def upload_page():
                     resultado.className = 'error';
                 }}
             }}
+
+            // A inicialização do agente roda em segundo plano: consulta o /status até terminar
+            async function acompanharInicializacao(upload) {{
+                const resultado = document.getElementById('resultado');
+                let estado = upload.inicializacao;
+
+                while (true) {{
+                    const pronto = estado.estado === 'pronto';
+                    const falhou = estado.estado === 'falhou';
+                    resultado.innerHTML = `
+                        ✅ ${{upload.message}}<br>
+                        <strong>Arquivos extraídos:</strong> ${{upload.arquivos_extraidos.join(', ')}}<br>
+                        <strong>Agente:</strong> ${{pronto ? 'Pronto' : falhou ? 'Falhou' : `⏳ ${{estado.etapa || 'Inicializando'}} (${{estado.progresso}}%)`}}<br><br>
+                        ${{pronto ?
+                            `<a href="/analise?dataset_id=${{encodeURIComponent(upload.dataset_id)}}" style="color: #667eea; font-weight: bold;">→ Ir para Análise Inteligente</a>` :
+                            falhou ? `⚠️ Agente não foi inicializado: ${{estado.erro}}. Verifique se os 3 CSVs estão no ZIP.` : ''}}
+                    `;
+                    if (pronto || falhou) {{
+                        resultado.className = pronto ? 'success' : 'error';
+                        return;
+                    }}
+
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    try {{
+                        const response = await fetch(`/status?dataset_id=${{encodeURIComponent(upload.dataset_id)}}`);
+                        estado = (await response.json()).inicializacao;
+                    }} catch (error) {{
+                        console.error('Erro ao consultar status:', error);
+                    }}
+                }}
+            }}
         </script>
     </body>
     </html>
@@ -444,61 +486,82 @@ def upload_page():
 # ENDPOINT DE UPLOAD
 # ============================================================================
 
+def extrair_zip_e_inicializar(dataset_id: str, zip_path: str) -> dict:
+    """
+    Prepara os CSVs do ZIP e dispara a inicialização do agente do dataset em
+    segundo plano (síncrono, roda fora do event loop)
+    
+    Args:
+        dataset_id: Dataset que recebe os arquivos
+        zip_path: Caminho do ZIP já gravado em disco
+    
+    Returns:
+        Dicionário com dataset_id, inicializacao (estado) e arquivos_extraidos
+    """
+    dataset, arquivos = registro.preparar_upload(dataset_id, zip_path)
+    
+    arquivos_extraidos = [nome_arquivo(arquivo) for arquivo in arquivos]
+    print(f"✅ {len(arquivos_extraidos)} arquivos disponíveis:")
+    for arquivo in arquivos:
+        print(f"   - {nome_arquivo(arquivo)} ({tamanho_arquivo(arquivo):,} bytes)")
+    
+    # Inicializar agente em segundo plano: o agente atual segue respondendo até a troca
+    print("\n🤖 Iniciando inicialização do agente em segundo plano...")
+    estado = registro.iniciar_inicializacao(dataset)
+    
+    return {
+        "dataset_id": dataset.id,
+        "inicializacao": estado,
+        "arquivos_extraidos": arquivos_extraidos
+    }
+
 @app.post("/processar_upload/")
-async def processar_upload(file: UploadFile = File(...)):
-    """Processa o upload do arquivo ZIP com os CSVs"""
+async def processar_upload(file: UploadFile = File(...), dataset_id: str = Query(DATASET_PADRAO)):
+    """Processa o upload do arquivo ZIP com os CSVs do dataset"""
     print(f"\n{'='*70}")
-    print(f"📦 RECEBENDO UPLOAD: {file.filename}")
+    print(f"📦 RECEBENDO UPLOAD: {file.filename} (dataset '{dataset_id}')")
     print(f"{'='*70}\n")
     
+    zip_path = None
     try:
-        # Validar tipo de arquivo
+        # Validar tipo de arquivo e dataset
         if not file.filename.endswith('.zip'):
             raise HTTPException(status_code=400, detail="Apenas arquivos ZIP são aceitos")
+        obter_dataset(dataset_id)
         
-        # Salvar ZIP
-        zip_path = os.path.join("uploads", file.filename)
+        # Salvar ZIP em blocos: a memória usada não depende do tamanho do arquivo
+        # (nome único: uploads simultâneos não se sobrepõem)
+        os.makedirs("uploads", exist_ok=True)
+        zip_path = os.path.join("uploads", f"{dataset_id}_{datetime.now():%Y%m%d%H%M%S%f}.zip")
         print(f"💾 Salvando ZIP em: {zip_path}")
         
-        with open(zip_path, "wb") as f:
-            conteudo = await file.read()
-            f.write(conteudo)
+        total_bytes = 0
+        async with aiofiles.open(zip_path, "wb") as f:
+            while True:
+                bloco = await file.read(TAMANHO_BLOCO_UPLOAD)
+                if not bloco:
+                    break
+                await f.write(bloco)
+                total_bytes += len(bloco)
         
-        print(f"✅ ZIP salvo: {len(conteudo):,} bytes")
+        print(f"✅ ZIP salvo: {total_bytes:,} bytes")
         
-        # Preparar diretório de destino
-        temp_dir = "temp_csvs"
+        # Verificar o ZIP antes de substituir os arquivos do dataset
+        with zipfile.ZipFile(zip_path):
+            pass
         
-        # Limpar diretório anterior
-        if os.path.exists(temp_dir):
-            print(f"🧹 Limpando diretório anterior: {temp_dir}")
-            shutil.rmtree(temp_dir)
-        
-        os.makedirs(temp_dir)
-        print(f"📁 Diretório criado: {temp_dir}")
-        
-        # Extrair ZIP
-        print(f"📦 Extraindo arquivos...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        arquivos_extraidos = os.listdir(temp_dir)
-        print(f"✅ {len(arquivos_extraidos)} arquivos extraídos:")
-        for arquivo in arquivos_extraidos:
-            tamanho = os.path.getsize(os.path.join(temp_dir, arquivo))
-            print(f"   - {arquivo} ({tamanho:,} bytes)")
-        
-        # Tentar inicializar agente
-        print("\n🤖 Tentando inicializar agente...")
-        agente_ok = inicializar_agente_se_possivel()
+        # Leitura e carga dos CSVs são pesadas: rodam numa thread para não
+        # travar as demais requisições
+        resultado = await asyncio.to_thread(extrair_zip_e_inicializar, dataset_id, zip_path)
         
         return {
             "status": "success",
-            "message": "Upload concluído e arquivos extraídos!",
-            "agente_inicializado": agente_ok,
-            "arquivos_extraidos": arquivos_extraidos
+            "message": "Upload concluído! O agente está sendo inicializado.",
+            **resultado
         }
         
+    except HTTPException:
+        raise
     except zipfile.BadZipFile:
         print(f"❌ Arquivo ZIP inválido")
         raise HTTPException(status_code=400, detail="Arquivo ZIP inválido ou corrompido")
@@ -506,6 +569,10 @@ async def processar_upload(file: UploadFile = File(...)):
         print(f"\n❌ ERRO no upload: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # O ZIP é movido para o diretório do dataset; se sobrou aqui, a carga falhou
+        if zip_path and os.path.exists(zip_path):
+            os.remove(zip_path)
 
 # ============================================================================
 # PÁGINA DE ANÁLISE
@@ -679,25 +746,46 @@ def analise_page():
 
         <script>
             let agenteInicializado = false;
+            const datasetId = new URLSearchParams(location.search).get('dataset_id') || '{DATASET_PADRAO}';
 
             verificarStatus();
 
             async function verificarStatus() {{
                 try {{
-                    const response = await fetch('/status');
+                    const response = await fetch(`/status?dataset_id=${{encodeURIComponent(datasetId)}}`);
                     const data = await response.json();
                     
                     agenteInicializado = data.agente_inicializado;
+                    const inicializacao = data.inicializacao || {{ estado: 'ocioso' }};
+                    const carregando = !['ocioso', 'pronto', 'falhou'].includes(inicializacao.estado);
                     
                     const badge = document.getElementById('statusBadge');
-                    if (agenteInicializado) {{
-                        badge.innerHTML = '<span class="status-badge status-online">✅ Agente pronto</span>';
+                    if (carregando) {{
+                        // Novo agente em preparação: consulta de novo até a troca
+                        setTimeout(verificarStatus, 2000);
+                    }}
+                    
+                    if (agenteInicializado && carregando) {{
+                        badge.innerHTML = `<span class="status-badge status-online">✅ Agente pronto (atualizando dados: ${{inicializacao.progresso}}%)</span>`;
+                    }} else if (carregando) {{
+                        badge.innerHTML = `<span class="status-badge status-offline">⏳ Inicializando agente: ${{inicializacao.etapa}} (${{inicializacao.progresso}}%)</span>`;
                         document.getElementById('chatContainer').innerHTML = 
-                            '<div class="agent-message message">👋 Olá! Estou pronto para analisar suas notas fiscais. Faça uma pergunta!</div>';
+                            '<div class="agent-message message">⏳ O agente está sendo inicializado com os arquivos enviados. Aguarde alguns instantes...</div>';
+                        document.getElementById('enviarBtn').disabled = true;
+                        document.getElementById('perguntaInput').disabled = true;
+                    }} else if (agenteInicializado) {{
+                        badge.innerHTML = '<span class="status-badge status-online">✅ Agente pronto</span>';
+                        document.getElementById('enviarBtn').disabled = false;
+                        document.getElementById('perguntaInput').disabled = false;
+                        // Não apaga a conversa quando a troca do agente termina durante o uso
+                        if (!document.querySelector('.user-message')) {{
+                            document.getElementById('chatContainer').innerHTML = 
+                                '<div class="agent-message message">👋 Olá! Estou pronto para analisar suas notas fiscais. Faça uma pergunta!</div>';
+                        }}
                     }} else {{
                         badge.innerHTML = '<span class="status-badge status-offline">❌ Agente não inicializado</span>';
                         document.getElementById('chatContainer').innerHTML = 
-                            '<div class="agent-message message">⚠️ Agente não inicializado. Por favor, faça upload dos arquivos CSV primeiro.<br><a href="/upload">→ Ir para Upload</a></div>';
+                            `<div class="agent-message message">⚠️ Agente não inicializado. Por favor, faça upload dos arquivos CSV primeiro.<br><a href="/upload?dataset_id=${{encodeURIComponent(datasetId)}}">→ Ir para Upload</a></div>`;
                         document.getElementById('enviarBtn').disabled = true;
                         document.getElementById('perguntaInput').disabled = true;
                     }}
@@ -736,22 +824,64 @@ def analise_page():
                 scrollToBottom();
 
                 try {{
-                    const response = await fetch('/analisar/', {{
+                    // Resposta em Server-Sent Events: ferramentas e trechos da resposta chegam durante a análise
+                    const response = await fetch('/analisar/stream', {{
                         method: 'POST',
                         headers: {{
                             'Content-Type': 'application/json'
                         }},
-                        body: JSON.stringify({{ pergunta: pergunta }})
+                        body: JSON.stringify({{ pergunta: pergunta, dataset_id: datasetId }})
                     }});
 
-                    document.getElementById('loading')?.remove();
-
-                    if (response.ok) {{
-                        const data = await response.json();
-                        adicionarMensagem(data.resposta, 'agent');
-                    }} else {{
+                    if (!response.ok) {{
+                        document.getElementById('loading')?.remove();
                         const error = await response.json();
                         adicionarMensagem(`❌ Erro: ${{error.detail}}`, 'agent');
+                        return;
+                    }}
+
+                    const leitor = response.body.getReader();
+                    const decodificador = new TextDecoder();
+                    let pendente = '';
+                    let mensagem = null;
+                    let concluido = false;
+
+                    while (!concluido) {{
+                        const {{ value, done }} = await leitor.read();
+                        if (done) break;
+                        pendente += decodificador.decode(value, {{ stream: true }});
+
+                        // Eventos SSE terminam com uma linha em branco
+                        let fim;
+                        while ((fim = pendente.indexOf('\\n\\n')) >= 0) {{
+                            const bloco = pendente.slice(0, fim);
+                            pendente = pendente.slice(fim + 2);
+                            const linhaDados = bloco.split('\\n').find(linha => linha.startsWith('data: '));
+                            if (!linhaDados) continue;
+                            const evento = JSON.parse(linhaDados.slice(6));
+
+                            if (evento.tipo === 'ferramenta') {{
+                                const loading = document.getElementById('loading');
+                                if (loading) loading.innerHTML = `🔧 Consultando ${{evento.nome}}...`;
+                            }} else if (evento.tipo === 'token') {{
+                                document.getElementById('loading')?.remove();
+                                if (!mensagem) mensagem = adicionarMensagem('', 'agent');
+                                mensagem.textContent += evento.texto;
+                                scrollToBottom();
+                            }} else if (evento.tipo === 'resposta' || evento.tipo === 'erro') {{
+                                document.getElementById('loading')?.remove();
+                                const texto = evento.tipo === 'resposta' ? evento.texto : evento.mensagem;
+                                if (mensagem) mensagem.textContent = texto;
+                                else adicionarMensagem(texto, 'agent');
+                                scrollToBottom();
+                                concluido = true;
+                            }}
+                        }}
+                    }}
+
+                    if (!concluido) {{
+                        document.getElementById('loading')?.remove();
+                        adicionarMensagem('❌ A conexão foi encerrada antes da resposta.', 'agent');
                     }}
                 }} catch (error) {{
                     document.getElementById('loading')?.remove();
@@ -766,6 +896,7 @@ def analise_page():
                 messageDiv.textContent = texto;
                 chatContainer.appendChild(messageDiv);
                 scrollToBottom();
+                return messageDiv;
             }}
 
             function scrollToBottom() {{
@@ -784,26 +915,26 @@ def analise_page():
 @app.post("/analisar/")
 async def analisar(request: PerguntaRequest):
     """Processa perguntas através do agente IA"""
-    global agente_validador
+    global analises_em_andamento
     
     print(f"\n{'='*70}")
     print(f"📥 REQUEST: POST /analisar/")
-    print(f"Detalhes: Pergunta: {request.pergunta}")
+    print(f"Detalhes: Pergunta: {request.pergunta} (dataset '{request.dataset_id}')")
     print(f"{'='*70}\n")
     
     print(f"📨 Pergunta recebida: {request.pergunta}")
-    print(f"🤖 Agente inicializado: {agente_validador is not None}")
     
-    if agente_validador is None:
-        print("❌ Agente não inicializado!")
-        raise HTTPException(
-            status_code=400,
-            detail="Agente não inicializado. Faça upload dos arquivos primeiro!"
-        )
+    # Referência local: um novo upload pode trocar o agente do dataset durante a análise
+    agente = obter_agente_disponivel(request.dataset_id)
     
     try:
-        print("🔄 Processando pergunta com o agente...")
-        resposta = agente_validador.processar_pergunta(request.pergunta)
+        async with semaforo_analises:
+            analises_em_andamento += 1
+            try:
+                print(f"🔄 Processando pergunta com o agente ({analises_em_andamento}/{MAX_ANALISES_CONCORRENTES} em andamento)...")
+                resposta = await agente.processar_pergunta_async(request.pergunta)
+            finally:
+                analises_em_andamento -= 1
         print(f"✅ Resposta gerada ({len(resposta)} caracteres)")
         print(f"Prévia: {resposta[:200]}...")
         
@@ -814,6 +945,82 @@ async def analisar(request: PerguntaRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analisar/stream")
+async def analisar_stream(request: PerguntaRequest):
+    """
+    Processa a pergunta enviando o andamento como Server-Sent Events
+    
+    Cada evento de `processar_pergunta_stream` vira uma mensagem SSE
+    (`event: <tipo>` + `data: <json>`): chamadas de ferramentas, trechos da
+    resposta à medida que o LLM os gera e, por último, a resposta completa
+    (ou o erro).
+    """
+    print(f"\n{'='*70}")
+    print(f"📥 REQUEST: POST /analisar/stream")
+    print(f"Detalhes: Pergunta: {request.pergunta} (dataset '{request.dataset_id}')")
+    print(f"{'='*70}\n")
+    
+    agente = obter_agente_disponivel(request.dataset_id)
+    
+    async def gerar_eventos():
+        global analises_em_andamento
+        async with semaforo_analises:
+            analises_em_andamento += 1
+            try:
+                print(f"🔄 Processando pergunta com o agente em streaming ({analises_em_andamento}/{MAX_ANALISES_CONCORRENTES} em andamento)...")
+                async for evento in agente.processar_pergunta_stream(request.pergunta):
+                    dados = json.dumps(evento, ensure_ascii=False, default=str)
+                    yield f"event: {evento['tipo']}\ndata: {dados}\n\n"
+            finally:
+                analises_em_andamento -= 1
+    
+    return StreamingResponse(
+        gerar_eventos(),
+        media_type="text/event-stream",
+        # Sem cache nem buffer em proxies: cada evento chega ao navegador na hora
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============================================================================
+# ENDPOINT DE VALIDAÇÃO EM LOTE
+# ============================================================================
+
+@app.post("/validar/lote")
+def validar_lote(request: ValidacaoLoteRequest = None):
+    """
+    Valida o CFOP de todos os itens (ou das notas das chaves informadas) sem LLM
+    
+    A resposta é NDJSON (um objeto JSON por linha, um por item), gerada bloco
+    a bloco para que nem o servidor nem o cliente precisem guardar tudo.
+    """
+    chaves = request.chaves if request else None
+    dataset_id = request.dataset_id if request else DATASET_PADRAO
+    
+    print(f"\n{'='*70}")
+    print(f"📥 REQUEST: POST /validar/lote")
+    print(f"Detalhes: {'todas as notas' if chaves is None else f'{len(chaves)} chaves'} (dataset '{dataset_id}')")
+    print(f"{'='*70}\n")
+    
+    agente = obter_agente_disponivel(dataset_id)
+    
+    def gerar_linhas():
+        total = 0
+        try:
+            for resultados in agente.validar_lote(chaves):
+                if resultados.empty:
+                    continue
+                total += len(resultados)
+                linhas = resultados.to_json(orient='records', lines=True, force_ascii=False)
+                yield linhas if linhas.endswith('\n') else linhas + '\n'
+            print(f"✅ Validação em lote concluída: {total:,} linhas enviadas")
+        except Exception as e:
+            # O status HTTP já foi enviado: o erro vai como última linha
+            print(f"❌ Erro na validação em lote: {e}")
+            traceback.print_exc()
+            yield json.dumps({"erro": str(e)}, ensure_ascii=False) + '\n'
+    
+    return StreamingResponse(gerar_linhas(), media_type="application/x-ndjson")
+
 # ============================================================================
 # FIM DO ARQUIVO
 # ============================================================================
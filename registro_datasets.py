@@ -0,0 +1,494 @@
+"""
+Registro de datasets (um por empresa cliente)
+
+Cada dataset tem o seu diretório (ZIPs enviados ou CSVs extraídos) e o seu
+agente, com DataFrames e índices próprios. Os agentes ficam em memória
+enquanto são usados; quando há mais datasets carregados que o limite, o
+usado há mais tempo é descarregado e volta a ser carregado, em segundo
+plano, no próximo acesso.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from agente_cfop import AgenteValidadorCFOP, ETAPA_CARREGANDO
+from carregador_dados import LER_CSV_DO_ZIP, listar_membros_zip, separar_caminho_zip, tamanho_arquivo
+from validacao_incremental import RepositorioValidacoes
+
+# Diretório com uma pasta por dataset
+DIRETORIO_DATASETS = os.getenv("CFOP_DIRETORIO_DATASETS", "datasets")
+
+# Quantidade máxima de datasets com agente em memória ao mesmo tempo
+MAX_DATASETS_CARREGADOS = int(os.getenv("CFOP_MAX_DATASETS_CARREGADOS", "4"))
+
+# Dataset usado quando a requisição não informa um
+DATASET_PADRAO = "padrao"
+
+# Identificadores aceitos: também são nomes de diretório
+_PADRAO_ID_DATASET = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Uploads gravados no diretório do dataset: dados_{time_ns}.zip ou csvs_{time_ns}/ (extraído)
+_PADRAO_UPLOAD = re.compile(r"^(?:dados_(\d+)\.zip|csvs_(\d+)|csvs|.+\.zip)$")
+
+# Estados da inicialização (além das etapas do agente: carregando, indexando)
+ESTADO_OCIOSO = "ocioso"
+ESTADO_PRONTO = "pronto"
+ESTADO_FALHOU = "falhou"
+
+
+def validar_id_dataset(dataset_id: str) -> str:
+    """
+    Verifica o identificador de um dataset
+
+    Raises:
+        ValueError: Se tiver caracteres fora de [A-Za-z0-9_-] ou mais de 64
+    """
+    if not _PADRAO_ID_DATASET.match(dataset_id or ""):
+        raise ValueError(f"Identificador de dataset inválido: '{dataset_id}' "
+                         "(use letras, números, '-' ou '_', até 64 caracteres)")
+    return dataset_id
+
+
+def nome_arquivo(caminho: str) -> str:
+    """Nome do arquivo, sem diretório (para membros de ZIP, o nome do membro)"""
+    return os.path.basename(separar_caminho_zip(caminho)[1] or caminho)
+
+
+def localizar_csvs(arquivos: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Identifica os CSVs de cabeçalho, itens e CFOP pelo nome do arquivo
+
+    Args:
+        arquivos: Caminhos disponíveis (arquivos ou membros de ZIP)
+
+    Returns:
+        {'cabecalho': caminho, 'itens': caminho, 'cfop': caminho} (None se faltar)
+    """
+    csvs_encontrados = {
+        'cabecalho': None,
+        'itens': None,
+        'cfop': None
+    }
+
+    for filepath in arquivos:
+        filename = nome_arquivo(filepath)
+        filename_lower = filename.lower()
+
+        if 'cabecalho' in filename_lower or 'cabeçalho' in filename_lower:
+            csvs_encontrados['cabecalho'] = filepath
+            print(f"   ✅ Cabeçalho: {filename}")
+        elif 'itens' in filename_lower or 'item' in filename_lower:
+            csvs_encontrados['itens'] = filepath
+            print(f"   ✅ Itens: {filename}")
+        elif 'cfop' in filename_lower:
+            csvs_encontrados['cfop'] = filepath
+            print(f"   ✅ CFOP: {filename}")
+
+    return csvs_encontrados
+
+
+class Dataset:
+    """Arquivos, agente e estado da inicialização de um dataset"""
+
+    def __init__(self, dataset_id: str, diretorio: str):
+        self.id = dataset_id
+        self.diretorio = diretorio
+        self.agente: Optional[AgenteValidadorCFOP] = None
+        # Resultados da validação por nota deste dataset (revalidação incremental a cada upload)
+        self.repositorio_validacoes = RepositorioValidacoes(dataset_id)
+        self.ultimo_uso = time.monotonic()
+        # Incrementada a cada nova inicialização: só a mais recente pode trocar o agente
+        self.geracao = 0
+        # Arquivos usados na última inicialização (detecta uploads feitos por outro worker)
+        self.versao_arquivos: Optional[str] = None
+        self.inicializacao = {
+            "estado": ESTADO_OCIOSO,
+            "progresso": 0,
+            "etapa": None,
+            "erro": None,
+            "iniciada_em": None,
+            "concluida_em": None
+        }
+
+    def listar_uploads(self) -> List[str]:
+        """
+        Uploads gravados (ZIPs e diretórios de CSVs extraídos), do mais antigo ao mais recente
+
+        Cada upload tem um nome novo: o agente atual continua lendo o anterior
+        até a troca, e os antigos são apagados depois dela.
+        """
+        if not os.path.isdir(self.diretorio):
+            return []
+        uploads = []
+        for nome in os.listdir(self.diretorio):
+            correspondencia = _PADRAO_UPLOAD.match(nome)
+            caminho = os.path.join(self.diretorio, nome)
+            if correspondencia is None or (not nome.endswith('.zip') and not os.listdir(caminho)):
+                continue
+            instante = int(correspondencia.group(1) or correspondencia.group(2) or 0)
+            uploads.append((instante, nome, caminho))
+        return [caminho for _, _, caminho in sorted(uploads)]
+
+    @property
+    def upload_atual(self) -> Optional[str]:
+        """Upload mais recente: ZIP (os CSVs são lidos dele) ou diretório com os CSVs extraídos"""
+        uploads = self.listar_uploads()
+        return uploads[-1] if uploads else None
+
+    def listar_arquivos(self) -> List[str]:
+        """Caminhos disponíveis no upload mais recente: CSVs extraídos ou membros do ZIP"""
+        upload = self.upload_atual
+        if upload is None:
+            return []
+        if upload.endswith('.zip'):
+            return listar_membros_zip(upload)
+        return [os.path.join(upload, f) for f in sorted(os.listdir(upload))]
+
+    def versao_em_disco(self) -> Optional[str]:
+        """Identifica os arquivos atuais do dataset (muda a cada upload, em qualquer worker)"""
+        return self.upload_atual
+
+    @property
+    def inicializando(self) -> bool:
+        return self.inicializacao["estado"] not in (ESTADO_OCIOSO, ESTADO_PRONTO, ESTADO_FALHOU)
+
+
+class RegistroDatasets:
+    """Datasets por identificador, com os agentes em memória limitados por LRU"""
+
+    def __init__(self, diretorio: str = DIRETORIO_DATASETS, maximo_carregados: int = MAX_DATASETS_CARREGADOS):
+        self.diretorio = diretorio
+        self.maximo_carregados = maximo_carregados
+        # Ordem de uso: o primeiro é o usado há mais tempo
+        self._datasets: "OrderedDict[str, Dataset]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------------
+    # Cadastro
+    # ------------------------------------------------------------------------
+
+    def descobrir(self) -> List[str]:
+        """Registra os datasets já gravados em disco (sem carregá-los)"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        for dataset_id in sorted(os.listdir(self.diretorio)):
+            if os.path.isdir(os.path.join(self.diretorio, dataset_id)) and _PADRAO_ID_DATASET.match(dataset_id):
+                self.obter(dataset_id, criar=True)
+        return list(self._datasets)
+
+    def obter(self, dataset_id: str, criar: bool = False) -> Optional[Dataset]:
+        """
+        Busca um dataset pelo identificador
+
+        Args:
+            dataset_id: Identificador do dataset
+            criar: Registra o dataset se ainda não existir
+
+        Returns:
+            Dataset ou None se não existir (e criar=False)
+
+        Raises:
+            ValueError: Se o identificador for inválido
+        """
+        validar_id_dataset(dataset_id)
+        diretorio = os.path.join(self.diretorio, dataset_id)
+        with self._lock:
+            dataset = self._datasets.get(dataset_id)
+            # Com vários workers, o dataset pode ter sido criado por outro processo
+            if dataset is None and (criar or os.path.isdir(diretorio)):
+                dataset = Dataset(dataset_id, diretorio)
+                self._datasets[dataset_id] = dataset
+            return dataset
+
+    def preparar_upload(self, dataset_id: str, zip_recebido: str) -> Tuple[Dataset, List[str]]:
+        """
+        Move o ZIP recebido para o diretório do dataset
+
+        Por padrão os CSVs são lidos direto do ZIP, sem extração; com
+        CFOP_LER_CSV_DO_ZIP=0 o ZIP é extraído para um diretório novo
+        (csvs_{time_ns}) dentro do diretório do dataset.
+
+        Args:
+            dataset_id: Identificador do dataset
+            zip_recebido: ZIP já gravado em disco
+
+        Returns:
+            Tupla (dataset, caminhos dos arquivos disponíveis)
+        """
+        dataset = self.obter(dataset_id, criar=True)
+        os.makedirs(dataset.diretorio, exist_ok=True)
+
+        # Nome novo a cada upload (ZIP ou CSVs extraídos): o agente atual continua
+        # lendo os arquivos anteriores até a troca, que também apaga os antigos
+        instante = time.time_ns()
+        arquivo_zip = os.path.join(dataset.diretorio, f"dados_{instante}.zip")
+        shutil.move(zip_recebido, arquivo_zip)
+
+        if LER_CSV_DO_ZIP:
+            # Os CSVs são lidos do próprio ZIP: nada é extraído
+            print(f"📦 Lendo arquivos direto do ZIP...")
+        else:
+            # Extrair ZIP (cada membro é copiado em blocos para o disco); o diretório
+            # só aparece com o nome final, completo, para os outros workers
+            diretorio_csvs = os.path.join(dataset.diretorio, f"csvs_{instante}")
+            print(f"📦 Extraindo arquivos em {diretorio_csvs}...")
+            temporario = diretorio_csvs + '.tmp'
+            with zipfile.ZipFile(arquivo_zip, 'r') as zip_ref:
+                zip_ref.extractall(temporario)
+            os.rename(temporario, diretorio_csvs)
+            os.remove(arquivo_zip)
+
+        return dataset, dataset.listar_arquivos()
+
+    # ------------------------------------------------------------------------
+    # Inicialização em segundo plano
+    # ------------------------------------------------------------------------
+
+    def estado(self, dataset: Dataset) -> dict:
+        """Cópia do estado da inicialização do agente (para o /status)"""
+        with self._lock:
+            return dict(dataset.inicializacao)
+
+    def _atualizar(self, dataset: Dataset, geracao: int, **campos):
+        """Atualiza o estado, ignorando inicializações já substituídas por outra mais recente"""
+        with self._lock:
+            if geracao == dataset.geracao:
+                dataset.inicializacao.update(campos)
+
+    def iniciar_inicializacao(self, dataset: Dataset) -> dict:
+        """
+        Inicializa o agente do dataset numa thread em segundo plano
+
+        O agente atual continua respondendo até o novo ficar pronto; se outra
+        inicialização começar antes, a anterior é descartada ao terminar.
+
+        Returns:
+            Estado da inicialização recém-iniciada
+        """
+        versao_arquivos = dataset.versao_em_disco()
+        with self._lock:
+            dataset.geracao += 1
+            geracao = dataset.geracao
+            dataset.versao_arquivos = versao_arquivos
+            dataset.inicializacao.update(
+                estado=ETAPA_CARREGANDO, progresso=0, etapa="Localizando CSVs", erro=None,
+                iniciada_em=datetime.now().isoformat(), concluida_em=None
+            )
+
+        threading.Thread(
+            target=self.inicializar, args=(dataset, geracao),
+            name=f"inicializacao-{dataset.id}-{geracao}", daemon=True
+        ).start()
+        return self.estado(dataset)
+
+    def inicializar(self, dataset: Dataset, geracao: Optional[int] = None) -> bool:
+        """
+        Verifica se os CSVs do dataset existem e inicializa o agente
+
+        Args:
+            dataset: Dataset a inicializar
+            geracao: Identificação da inicialização em segundo plano (None
+                quando chamada diretamente, fora de `iniciar_inicializacao`)
+
+        Returns:
+            True se o agente (novo ou com os dados recarregados) passou a responder
+        """
+        if geracao is None:
+            with self._lock:
+                geracao = dataset.geracao
+
+        def falhar(erro: str) -> bool:
+            self._atualizar(dataset, geracao, estado=ESTADO_FALHOU, erro=erro,
+                            concluida_em=datetime.now().isoformat())
+            return False
+
+        print("\n" + "="*70)
+        print(f"🔍 VERIFICANDO SE PODE INICIALIZAR AGENTE (dataset '{dataset.id}')")
+        print("="*70)
+
+        arquivos_disponiveis = dataset.listar_arquivos()
+        if not arquivos_disponiveis:
+            print(f"❌ Nenhum arquivo em {dataset.diretorio}")
+            print("="*70 + "\n")
+            return falhar("Nenhum arquivo carregado. Faça upload do ZIP com os CSVs.")
+
+        print(f"📂 Arquivos: {[nome_arquivo(a) for a in arquivos_disponiveis]}")
+
+        # Procurar os 3 CSVs necessários
+        csvs_encontrados = localizar_csvs(arquivos_disponiveis)
+
+        # Verificar se encontrou todos
+        missing = [k for k, v in csvs_encontrados.items() if v is None]
+
+        if missing:
+            print(f"❌ CSVs faltando: {', '.join(missing)}")
+            print("="*70 + "\n")
+            return falhar(f"CSVs faltando: {', '.join(missing)}")
+
+        print("\n✅ Todos os CSVs encontrados:")
+        for tipo, path in csvs_encontrados.items():
+            tamanho = tamanho_arquivo(path)
+            print(f"   - {tipo}: {nome_arquivo(path)} ({tamanho:,} bytes)")
+
+        ao_progredir = lambda etapa, percentual, descricao: self._atualizar(
+            dataset, geracao, estado=etapa, progresso=percentual, etapa=descricao
+        )
+        with self._lock:
+            agente_atual = dataset.agente
+
+        # Com agente em memória só os dados são recarregados: LLM, prompt, ferramentas
+        # e executor continuam os mesmos (e o agente responde com os dados atuais até a troca)
+        novos_dados = None
+        try:
+            if agente_atual is not None:
+                print("\n♻️ Recarregando os dados do agente atual...")
+                novos_dados = agente_atual.carregar_dados(
+                    csvs_encontrados['cabecalho'], csvs_encontrados['itens'], csvs_encontrados['cfop'],
+                    ao_progredir=ao_progredir, repositorio_validacoes=dataset.repositorio_validacoes
+                )
+                novo_agente = agente_atual
+            else:
+                print("\n🤖 Criando AgenteValidadorCFOP...")
+                novo_agente = AgenteValidadorCFOP(
+                    cabecalho_path=csvs_encontrados['cabecalho'],
+                    itens_path=csvs_encontrados['itens'],
+                    cfop_path=csvs_encontrados['cfop'],
+                    ao_progredir=ao_progredir,
+                    repositorio_validacoes=dataset.repositorio_validacoes
+                )
+
+        except Exception as e:
+            print(f"❌ Erro ao criar agente: {e}")
+            traceback.print_exc()
+            print("="*70 + "\n")
+            return falhar(str(e))
+
+        # Troca atômica: o agente (ou os dados) anterior atende até aqui
+        with self._lock:
+            if geracao != dataset.geracao:
+                print("⏭️ Inicialização substituída por outra mais recente: agente descartado")
+                print("="*70 + "\n")
+                return False
+            if novos_dados is not None:
+                # Também limpa a memória das ferramentas (resultados sobre os dados anteriores)
+                novo_agente.aplicar_dados(novos_dados)
+            agente_anterior, dataset.agente = dataset.agente, novo_agente
+            dataset.ultimo_uso = time.monotonic()
+            dataset.inicializacao.update(estado=ESTADO_PRONTO, progresso=100, etapa="Agente pronto",
+                                         concluida_em=datetime.now().isoformat())
+            if dataset.id in self._datasets:
+                self._datasets.move_to_end(dataset.id)
+
+        # Resultados memorizados sobre os CSVs anteriores não valem mais
+        if agente_anterior is not None and agente_anterior is not novo_agente:
+            agente_anterior.limpar_memoria_ferramentas()
+        self._remover_uploads_antigos(dataset, csvs_encontrados)
+        self._descarregar_excedentes(manter=dataset.id)
+
+        print(f"✅ AGENTE INICIALIZADO COM SUCESSO! (dataset '{dataset.id}')")
+        print("="*70 + "\n")
+        return True
+
+    def _remover_uploads_antigos(self, dataset: Dataset, csvs_em_uso: Dict[str, str]):
+        """Apaga os ZIPs e CSVs extraídos de uploads anteriores ao que o agente novo usa"""
+        em_uso = [os.path.abspath(separar_caminho_zip(caminho)[0]) for caminho in csvs_em_uso.values()]
+
+        def usado(upload: str) -> bool:
+            upload = os.path.abspath(upload)
+            return any(caminho == upload or caminho.startswith(upload + os.sep) for caminho in em_uso)
+
+        uploads = dataset.listar_uploads()
+        posicoes_em_uso = [i for i, upload in enumerate(uploads) if usado(upload)]
+        if not posicoes_em_uso:
+            return
+        # Uploads mais novos pertencem a uma inicialização em andamento
+        for antigo in uploads[:min(posicoes_em_uso)]:
+            print(f"🧹 Removendo upload anterior: {antigo}")
+            if antigo.endswith('.zip'):
+                os.remove(antigo)
+            else:
+                shutil.rmtree(antigo, ignore_errors=True)
+
+    # ------------------------------------------------------------------------
+    # Acesso aos agentes (LRU)
+    # ------------------------------------------------------------------------
+
+    def agente(self, dataset: Dataset, carregar: bool = True) -> Optional[AgenteValidadorCFOP]:
+        """
+        Agente do dataset, marcando-o como usado agora
+
+        Args:
+            dataset: Dataset consultado
+            carregar: Inicia a carga em segundo plano se o agente não estiver
+                em memória (ex.: descarregado pelo LRU ou após reiniciar) ou
+                se os arquivos mudaram (upload recebido por outro worker)
+
+        Returns:
+            Agente ou None enquanto não estiver pronto
+        """
+        versao_em_disco = dataset.versao_em_disco() if carregar else None
+        with self._lock:
+            dataset.ultimo_uso = time.monotonic()
+            if dataset.id in self._datasets:
+                self._datasets.move_to_end(dataset.id)
+            agente = dataset.agente
+            arquivos_novos = versao_em_disco != dataset.versao_arquivos
+            precisa_carregar = carregar and not dataset.inicializando and (
+                arquivos_novos or (agente is None and dataset.inicializacao["estado"] != ESTADO_FALHOU)
+            )
+
+        if precisa_carregar and versao_em_disco is not None:
+            if agente is not None:
+                print(f"🔄 Arquivos do dataset '{dataset.id}' atualizados: recarregando em segundo plano...")
+            else:
+                print(f"🔄 Carregando dataset '{dataset.id}' sob demanda...")
+            self.iniciar_inicializacao(dataset)
+        return agente
+
+    def _descarregar_excedentes(self, manter: str):
+        """Descarrega os agentes usados há mais tempo acima do limite de datasets em memória"""
+        with self._lock:
+            carregados = [d for d in self._datasets.values() if d.agente is not None]
+            excedentes = len(carregados) - self.maximo_carregados
+            descarregados = []
+            for dataset in carregados:
+                if excedentes <= 0:
+                    break
+                if dataset.id == manter:
+                    continue
+                dataset.agente.limpar_memoria_ferramentas()
+                dataset.agente = None
+                dataset.inicializacao.update(estado=ESTADO_OCIOSO, progresso=0,
+                                             etapa="Descarregado da memória (sem uso recente)")
+                descarregados.append(dataset.id)
+                excedentes -= 1
+
+        for dataset_id in descarregados:
+            print(f"📤 Dataset '{dataset_id}' descarregado da memória (LRU)")
+
+    def listar(self) -> List[dict]:
+        """Resumo de cada dataset registrado (para o endpoint /datasets)"""
+        with self._lock:
+            datasets = list(self._datasets.values())
+        return [{
+            "dataset_id": dataset.id,
+            "carregado": dataset.agente is not None,
+            "inicializacao": self.estado(dataset),
+            "ocioso_segundos": round(time.monotonic() - dataset.ultimo_uso, 1)
+        } for dataset in datasets]
+
+    def estatisticas(self) -> dict:
+        """Contadores do registro para o endpoint /status"""
+        with self._lock:
+            return {
+                "registrados": len(self._datasets),
+                "carregados": sum(1 for d in self._datasets.values() if d.agente is not None),
+                "maximo_carregados": self.maximo_carregados
+            }
@@ -0,0 +1,180 @@
+"""
+Roteador de intenções determinísticas
+
+Reconhece perguntas estruturadas (chave de acesso + número do item, código
+CFOP, consultas por posição, contagem, validação geral) e indica qual
+ferramenta do agente responde a pergunta diretamente, sem passar pelo LLM.
+"""
+
+import os
+import re
+from typing import Optional, Tuple
+
+# Desative com CFOP_ROTEADOR_DETERMINISTICO=0 para mandar tudo ao agente
+ROTEADOR_ATIVO = os.getenv("CFOP_ROTEADOR_DETERMINISTICO", "1") != "0"
+
+# Números por extenso aceitos para itens/registros
+ORDINAIS = {
+    'primeiro': 1, 'primeira': 1,
+    'segundo': 2, 'segunda': 2,
+    'terceiro': 3, 'terceira': 3,
+    'quarto': 4, 'quarta': 4,
+    'quinto': 5, 'quinta': 5,
+    'sexto': 6, 'sexta': 6,
+    'sétimo': 7, 'sétima': 7, 'setimo': 7, 'setima': 7,
+    'oitavo': 8, 'oitava': 8,
+    'nono': 9, 'nona': 9,
+    'décimo': 10, 'décima': 10, 'decimo': 10, 'decima': 10
+}
+
+_ORDINAL = '|'.join(sorted(ORDINAIS, key=len, reverse=True))
+
+# Chave de acesso: 44 dígitos, opcionalmente separados por espaço, ponto ou hífen
+_PADRAO_CHAVE = re.compile(r"(?<!\d)\d(?:[ .\-]?\d){43}(?!\d)")
+
+# Número do item: "item 3", "item nº 3", "3º item", "terceiro item"
+_PADRAO_ITEM = re.compile(
+    rf"\bitem\s+(?:n[º°o.]?\s*)?(\d+)\b|\b(\d+)\s*[º°ª]?\s+item\b|\b({_ORDINAL})\s+item\b",
+    re.IGNORECASE
+)
+
+# Código CFOP: "CFOP 5102", "CFOP 5.102"
+_PADRAO_CFOP = re.compile(r"\bcfop\s*(?:n[º°o.]?\s*)?(\d[ .]?\d{3})\b", re.IGNORECASE)
+
+# Posição no arquivo: "índice 4", "registro 5", "5º registro", "quinta nota"
+_PADRAO_INDICE = re.compile(
+    r"\b(nota|registro|item)\s+(?:de\s+|com\s+)?[íi]ndice\s+(\d+)\b", re.IGNORECASE
+)
+_PADRAO_POSICAO = re.compile(
+    rf"\b(?:(\d+)\s*[º°ªo]|({_ORDINAL}))\s+(nota|registro|item)\b", re.IGNORECASE
+)
+
+# Perguntas inteiras (não apenas trechos) para contagem, validação geral e listagem
+_PADRAO_CONTAR = re.compile(
+    r"^\s*quant[oa]s\s+(?:notas(?:\s+fiscais)?|itens|registros)"
+    r"(?:\s+(?:foram\s+carregad[oa]s|est[ãa]o\s+carregad[oa]s|carregad[oa]s|existem|h[áa]|temos))?"
+    r"(?:\s+no\s+(?:sistema|arquivo))?\s*[?.!]?\s*$",
+    re.IGNORECASE
+)
+_PADRAO_VALIDAR_TODAS = re.compile(
+    r"^\s*valid(?:e|ar|a)\s+(?:o\s+cfop\s+de\s+)?tod[oa]s\s+(?:as\s+)?(?:notas|itens)(?:\s+fiscais)?"
+    r"(?:\s+e\s+me\s+d[êe]\s+um\s+resumo)?\s*[?.!]?\s*$",
+    re.IGNORECASE
+)
+_PADRAO_LISTAR = re.compile(
+    r"^\s*list(?:e|ar)\s+(?:as\s+)?(?:primeiras\s+)?(\d+)\s+(?:primeiras\s+)?notas"
+    r"(?:\s+do\s+cabe[çc]alho)?\s*[?.!]?\s*$",
+    re.IGNORECASE
+)
+
+# Palavras que indicam uma pergunta mais ampla que a consulta reconhecida
+_PADRAO_PERGUNTA_AMPLA = re.compile(r"\b(?:itens|valid\w*|compar\w*|quant[oa]s)\b", re.IGNORECASE)
+
+# Tipos de pergunta enviada ao agente (cada um pode usar um modelo de LLM, ver backends_llm)
+TIPO_CONSULTA = "consulta"
+TIPO_ANALISE = "analise"
+TIPOS_PERGUNTA = (TIPO_CONSULTA, TIPO_ANALISE)
+
+# Palavras que indicam análise (validação, comparação, explicação) e não só uma consulta aos dados
+_PADRAO_ANALISE = re.compile(
+    r"\b(?:valid\w*|diverg\w*|compar\w*|analis\w*|an[áa]lise|expli\w*|por\s*qu[eê]|resum\w*|correto|errad[oa])\b",
+    re.IGNORECASE
+)
+
+
+def _numero(digitos: Optional[str], ordinal: Optional[str]) -> int:
+    """Converte o número capturado (dígitos ou ordinal por extenso)"""
+    if digitos:
+        return int(digitos)
+    return ORDINAIS[ordinal.lower()]
+
+
+def _sem_outros_digitos(texto: str, trecho: re.Match) -> bool:
+    """Verifica se não há números fora do trecho reconhecido"""
+    return not re.search(r"\d", texto[:trecho.start()] + " " + texto[trecho.end():])
+
+
+def rotear_pergunta(pergunta: str) -> Optional[Tuple[str, dict]]:
+    """
+    Identifica perguntas que uma única ferramenta responde de forma determinística
+
+    Args:
+        pergunta: Pergunta do usuário
+
+    Returns:
+        Tupla (nome da ferramenta, argumentos) ou None se a pergunta
+        precisa do agente
+    """
+    texto = pergunta.strip()
+
+    # Chave de acesso: validar um item específico ou buscar a nota
+    chave = _PADRAO_CHAVE.search(texto)
+    if chave:
+        chave_acesso = re.sub(r"[ .\-]", "", chave.group(0))
+        resto = texto[:chave.start()] + " " + texto[chave.end():]
+
+        itens = list(_PADRAO_ITEM.finditer(resto))
+        if len(itens) == 1 and _sem_outros_digitos(resto, itens[0]):
+            item = itens[0]
+            numero_item = _numero(item.group(1) or item.group(2), item.group(3))
+            return 'validar_cfop_item_especifico', {
+                'chave_acesso': chave_acesso, 'numero_item': str(numero_item)
+            }
+
+        # Só a chave, sem outros números nem pedidos mais amplos: busca da nota
+        if not itens and not re.search(r"\d|\bcfop\b", resto, re.IGNORECASE) \
+                and not _PADRAO_PERGUNTA_AMPLA.search(resto):
+            return 'buscar_nota_por_chave', {'chave_acesso': chave_acesso}
+        return None
+
+    # Código CFOP sozinho na pergunta ("Explique o CFOP 5102")
+    cfop = _PADRAO_CFOP.search(texto)
+    if cfop:
+        if _sem_outros_digitos(texto, cfop) and not re.search(r"\b(?:notas?|itens?)\b", texto, re.IGNORECASE) \
+                and not _PADRAO_PERGUNTA_AMPLA.search(texto):
+            return 'buscar_cfop', {'codigo_cfop': re.sub(r"[ .]", "", cfop.group(1))}
+        return None
+
+    if _PADRAO_VALIDAR_TODAS.match(texto):
+        return 'validar_todas_notas', {}
+
+    if _PADRAO_CONTAR.match(texto):
+        return 'contar_notas', {}
+
+    listar = _PADRAO_LISTAR.match(texto)
+    if listar:
+        return 'listar_notas_cabecalho', {'limit': listar.group(1)}
+
+    if _PADRAO_PERGUNTA_AMPLA.search(texto):
+        return None
+
+    # Consultas por posição ("índice N" já é base 0; posições são base 1)
+    trecho = _PADRAO_INDICE.search(texto)
+    if trecho:
+        tipo, valor = trecho.group(1).lower(), int(trecho.group(2))
+    else:
+        trecho = _PADRAO_POSICAO.search(texto)
+        if not trecho:
+            return None
+        tipo, valor = trecho.group(3).lower(), _numero(trecho.group(1), trecho.group(2)) - 1
+
+    if not _sem_outros_digitos(texto, trecho):
+        return None
+
+    if tipo == 'item' or (tipo == 'registro' and re.search(r"\bite(?:m|ns)\b", texto, re.IGNORECASE)):
+        return 'buscar_item_por_indice', {'indice': str(valor)}
+    return 'buscar_nota_por_indice', {'indice': str(valor)}
+
+
+def classificar_pergunta(pergunta: str) -> str:
+    """
+    Classifica a pergunta que vai ao agente
+
+    Args:
+        pergunta: Pergunta do usuário
+
+    Returns:
+        TIPO_ANALISE se pede validação, comparação ou explicação;
+        TIPO_CONSULTA para buscas e listagens nos dados
+    """
+    return TIPO_ANALISE if _PADRAO_ANALISE.search(pergunta) else TIPO_CONSULTA
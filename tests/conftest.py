@@ -0,0 +1,62 @@
+"""
+Configuração e dados compartilhados pelos testes
+
+Execute: python -m pytest tests
+"""
+
+import os
+import tempfile
+
+# Antes de importar o agente: LLM local, sem memorização e cache/datasets fora do repositório
+os.environ.setdefault("CFOP_BACKEND_LLM", "roteiro")
+os.environ.setdefault("CFOP_MEMORIA_FERRAMENTAS_MAX", "0")
+os.environ.setdefault("CFOP_DIRETORIO_CACHE", tempfile.mkdtemp(prefix="cfop_cache_"))
+os.environ.setdefault("CFOP_DIRETORIO_DATASETS", tempfile.mkdtemp(prefix="cfop_datasets_"))
+
+import pandas as pd
+import pytest
+
+
+def _gravar_dataset(diretorio, cfops_por_nota: dict, prefixo: str = '35') -> tuple:
+    """
+    Grava os CSVs de cabeçalho, itens e CFOP de um dataset de teste
+
+    Notas de número ímpar são internas (SP -> SP) e as pares interestaduais
+    (SP -> RJ), todas de venda de mercadoria.
+
+    Args:
+        diretorio: Diretório onde os CSVs são gravados (criado se preciso)
+        cfops_por_nota: Número da nota -> CFOPs dos seus itens
+        prefixo: Início das chaves de acesso (separa datasets diferentes)
+
+    Returns:
+        Tupla ((cabeçalho, itens, CFOP), chaves de acesso na ordem das notas)
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    numeros = [str(n) for n in cfops_por_nota]
+    chaves = [f"{prefixo}{int(n):042d}" for n in numeros]
+    cabecalho = pd.DataFrame({
+        'CHAVE DE ACESSO': chaves,
+        'NÚMERO': numeros,
+        'NATUREZA DA OPERAÇÃO': 'VENDA DE MERCADORIA',
+        'UF EMITENTE': 'SP',
+        'UF DESTINATÁRIO': ['SP' if int(n) % 2 else 'RJ' for n in numeros],
+        'DESTINO DA OPERAÇÃO': ['1 - OPERAÇÃO INTERNA' if int(n) % 2 else '2 - OPERAÇÃO INTERESTADUAL'
+                                for n in numeros],
+    })
+    itens = pd.DataFrame(
+        [(chave, str(n), cfop, 10.0) for chave, (n, cfops) in zip(chaves, cfops_por_nota.items()) for cfop in cfops],
+        columns=['CHAVE DE ACESSO', 'NÚMERO', 'CFOP', 'VALOR TOTAL']
+    )
+    cfop = pd.DataFrame({'CFOP': ['5.102', '6.102'], 'DESCRIÇÃO': ['Venda', 'Venda interestadual']})
+
+    caminhos = tuple(os.path.join(diretorio, nome) for nome in ('cabecalho.csv', 'itens.csv', 'cfop.csv'))
+    for df, caminho in zip((cabecalho, itens, cfop), caminhos):
+        df.to_csv(caminho, index=False)
+    return caminhos, chaves
+
+
+@pytest.fixture
+def gravar_dataset():
+    """Fábrica de datasets de teste em CSV (ver `_gravar_dataset`)"""
+    return _gravar_dataset
@@ -0,0 +1,39 @@
+"""
+Memorização dos resultados das ferramentas
+
+Execute: python -m pytest tests
+"""
+
+from cache_respostas import memorizar_ferramenta
+
+
+def test_chave_inclui_versao_dos_dados():
+    versao = {'atual': 'v1'}
+    chamadas = []
+
+    def buscar(numero: str) -> str:
+        chamadas.append(numero)
+        return f"nota {numero} ({versao['atual']})"
+
+    memorizada = memorizar_ferramenta(buscar, versao=lambda: versao['atual'], maximo=8)
+    assert memorizada("1") == "nota 1 (v1)"
+    assert memorizada(numero="1") == "nota 1 (v1)"
+    assert len(chamadas) == 1
+
+    versao['atual'] = 'v2'
+    assert memorizada("1") == "nota 1 (v2)"
+    assert len(chamadas) == 2
+
+
+def test_erros_nao_sao_memorizados():
+    respostas = ["Erro ao buscar nota: conexão perdida", "❌ Erro temporário", "📋 NOTA FISCAL Nº 1"]
+
+    def buscar(numero: str) -> str:
+        return respostas.pop(0)
+
+    memorizada = memorizar_ferramenta(buscar, maximo=8)
+    assert memorizada("1").startswith("Erro")
+    assert memorizada("1").startswith("❌ Erro")
+    assert memorizada("1") == "📋 NOTA FISCAL Nº 1"
+    assert memorizada("1") == "📋 NOTA FISCAL Nº 1"
+    assert memorizada.estatisticas()['entradas'] == 1
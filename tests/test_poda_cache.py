@@ -0,0 +1,77 @@
+"""
+Poda do cache respeitando as travas dos outros workers
+
+Execute: python -m pytest tests
+"""
+
+import os
+
+import pytest
+
+import carregador_dados
+import indices
+from carregador_dados import EXTENSAO_CACHE, bloqueio_exclusivo
+
+
+def _gravar_entradas(diretorio, nomes, pasta: bool = False) -> list:
+    """Entradas do cache com mtime crescente (a primeira é a menos usada)"""
+    caminhos = []
+    for ordem, nome in enumerate(nomes):
+        caminho = os.path.join(diretorio, nome)
+        if pasta:
+            os.makedirs(caminho)
+        else:
+            with open(caminho, 'w') as arquivo:
+                arquivo.write(nome)
+        os.utime(caminho, (1_000_000 + ordem, 1_000_000 + ordem))
+        caminhos.append(caminho)
+    return caminhos
+
+
+@pytest.fixture
+def limite_um(monkeypatch):
+    monkeypatch.setattr(carregador_dados, "MAXIMO_ARQUIVOS_CACHE", 1)
+    monkeypatch.setattr(indices, "MAXIMO_ARQUIVOS_CACHE", 1)
+
+
+def test_poda_do_cache_pula_arquivo_travado(tmp_path, limite_um):
+    em_uso, antigo, recente = _gravar_entradas(
+        tmp_path, [f"{nome}{EXTENSAO_CACHE}" for nome in ('em_uso', 'antigo', 'recente')])
+
+    with bloqueio_exclusivo(em_uso + '.lock'):
+        carregador_dados._podar_cache(str(tmp_path))
+        assert os.path.exists(em_uso)
+
+    assert not os.path.exists(antigo)
+    assert not os.path.exists(antigo + '.lock')
+    assert os.path.exists(recente)
+
+    # Liberada a trava, a próxima poda remove o arquivo
+    carregador_dados._podar_cache(str(tmp_path))
+    assert not os.path.exists(em_uso)
+
+
+def test_poda_dos_indices_pula_diretorio_travado(tmp_path, limite_um):
+    em_uso, antigo, recente = _gravar_entradas(tmp_path, ['em_uso', 'antigo', 'recente'], pasta=True)
+
+    with bloqueio_exclusivo(em_uso + '.lock'):
+        indices._podar_indices(str(tmp_path))
+        assert os.path.isdir(em_uso)
+
+    assert not os.path.exists(antigo)
+    assert not os.path.exists(antigo + '.lock')
+    assert os.path.isdir(recente)
+
+
+def test_trava_recriada_apos_poda(tmp_path):
+    caminho = str(tmp_path / f"dados{EXTENSAO_CACHE}.lock")
+    with bloqueio_exclusivo(caminho):
+        pass
+
+    with carregador_dados.tentar_bloqueio_exclusivo(caminho) as bloqueado:
+        assert bloqueado
+        carregador_dados.remover_arquivo_lock(caminho)
+
+    # Quem chega depois da poda trava um arquivo de lock novo
+    with bloqueio_exclusivo(caminho):
+        assert os.path.exists(caminho)
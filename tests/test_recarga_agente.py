@@ -0,0 +1,72 @@
+"""
+Recarga dos dados do agente com ferramentas em execução
+
+Execute: python -m pytest tests
+"""
+
+import threading
+
+import pytest
+
+from agente_cfop import AgenteValidadorCFOP
+
+
+@pytest.fixture
+def datasets(tmp_path, gravar_dataset):
+    # Tamanhos diferentes: índices de um aplicados ao cabeçalho do outro apontam para linhas erradas
+    return (gravar_dataset(tmp_path / 'grande', {n: ['5102', '5102'] for n in range(1, 401)}, '35'),
+            gravar_dataset(tmp_path / 'pequeno', {n: ['5102', '5102'] for n in range(1, 41)}, '41'))
+
+
+def test_dados_fixados_durante_a_recarga(datasets):
+    (grande, chaves_grande), (pequeno, _) = datasets
+    agente = AgenteValidadorCFOP(*grande)
+
+    with agente.fixar_dados():
+        agente.recarregar(*pequeno)
+        # A chamada em andamento continua com a carga anterior inteira
+        assert len(agente.df_cabecalho) == 400
+        assert agente.indice_chaves is not None
+        assert chaves_grande[-1] in agente._ferramentas['buscar_nota_por_chave'].func(chaves_grande[-1])
+
+    assert len(agente.df_cabecalho) == 40
+    assert "não encontrada" in agente._ferramentas['buscar_nota_por_chave'].func(chaves_grande[-1])
+
+
+def test_ferramentas_durante_recargas(datasets):
+    (grande, chaves_grande), (pequeno, chaves_pequeno) = datasets
+    agente = AgenteValidadorCFOP(*grande)
+    ferramentas = agente._ferramentas
+    falhas = []
+    parar = threading.Event()
+
+    def consultar(deslocamento: int):
+        i = deslocamento
+        while not parar.is_set():
+            numero = str(i % 40 + 1)  # existe nos dois datasets
+            nota = ferramentas['buscar_nota_cabecalho'].func(numero)
+            if f"NÚMERO: {numero}\n" not in nota:
+                falhas.append(nota)
+
+            chave = (chaves_grande + chaves_pequeno)[i % 440]
+            resultado = ferramentas['buscar_nota_por_chave'].func(chave)
+            if chave not in resultado and "não encontrada" not in resultado:
+                falhas.append(resultado)
+
+            itens = ferramentas['validar_cfop_item_especifico'].func(chave, "2")
+            if "Erro" in itens:
+                falhas.append(itens)
+            i += 7
+
+    consultas = [threading.Thread(target=consultar, args=(n,)) for n in range(4)]
+    for thread in consultas:
+        thread.start()
+    try:
+        for i in range(20):
+            agente.recarregar(*(pequeno if i % 2 == 0 else grande))
+    finally:
+        parar.set()
+        for thread in consultas:
+            thread.join()
+
+    assert not falhas, falhas[0]
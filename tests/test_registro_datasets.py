@@ -0,0 +1,49 @@
+"""
+Uploads de um dataset com o agente anterior ainda respondendo
+
+Execute: python -m pytest tests
+"""
+
+import os
+import zipfile
+
+import pandas as pd
+
+import carregador_dados
+import registro_datasets
+from registro_datasets import RegistroDatasets
+
+
+def _zipar(caminhos, destino) -> str:
+    with zipfile.ZipFile(destino, 'w') as zf:
+        for caminho in caminhos:
+            zf.write(caminho, os.path.basename(caminho))
+    return str(destino)
+
+
+def test_csvs_extraidos_ficam_ate_a_troca(tmp_path, monkeypatch, gravar_dataset):
+    monkeypatch.setattr(registro_datasets, "LER_CSV_DO_ZIP", False)
+    monkeypatch.setattr(carregador_dados, "MODO_STREAMING_ITENS", "1")
+    registro = RegistroDatasets(str(tmp_path / 'datasets'))
+
+    (caminhos_v1, _) = gravar_dataset(tmp_path / 'v1', {n: ['5102', '5102'] for n in range(1, 31)})
+    (caminhos_v2, _) = gravar_dataset(tmp_path / 'v2', {n: ['5102'] for n in range(1, 11)})
+
+    dataset, _ = registro.preparar_upload('empresa', _zipar(caminhos_v1, tmp_path / 'v1.zip'))
+    assert registro.inicializar(dataset)
+    agente = dataset.agente
+    assert agente.modo_streaming_itens
+    diretorio_v1 = dataset.upload_atual
+
+    # Novo upload: o agente atual continua lendo os CSVs anteriores até a troca
+    dataset, arquivos = registro.preparar_upload('empresa', _zipar(caminhos_v2, tmp_path / 'v2.zip'))
+    assert dataset.upload_atual != diretorio_v1
+    assert all(arquivo.startswith(dataset.upload_atual + os.sep) for arquivo in arquivos)
+    assert os.path.isdir(diretorio_v1)
+    assert len(pd.concat(agente.validar_lote(None))) == 60
+    assert "Erro" not in agente._ferramentas['buscar_itens_nota'].func("30")
+
+    assert registro.inicializar(dataset)
+    assert len(pd.concat(dataset.agente.validar_lote(None))) == 10
+    assert not os.path.exists(diretorio_v1)
+    assert dataset.listar_uploads() == [dataset.upload_atual]
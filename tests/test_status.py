@@ -0,0 +1,28 @@
+"""
+Consulta de status da API sem efeitos colaterais
+
+Execute: python -m pytest tests
+"""
+
+import os
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_status_nao_carrega_o_dataset():
+    dataset = main.registro.obter("empresa_status", criar=True)
+    diretorio_csvs = os.path.join(dataset.diretorio, "csvs_1")
+    os.makedirs(diretorio_csvs)
+    with open(os.path.join(diretorio_csvs, "cabecalho.csv"), "w") as arquivo:
+        arquivo.write("NÚMERO\n1\n")
+
+    resposta = TestClient(main.app).get("/status", params={"dataset_id": dataset.id})
+
+    assert resposta.status_code == 200
+    assert resposta.json()["agente_inicializado"] is False
+    assert resposta.json()["csvs_disponiveis"] == ["cabecalho.csv"]
+    assert dataset.agente is None
+    assert dataset.inicializacao["estado"] == "ocioso"
+    assert dataset.versao_arquivos is None
@@ -0,0 +1,185 @@
+"""
+Motor vetorizado de validação de CFOP comparado às regras originais, linha a linha
+
+Execute: python -m pytest tests
+"""
+
+import pandas as pd
+import pytest
+
+import agente_cfop
+from agente_cfop import AgenteValidadorCFOP
+from validacao_cfop import ClassificadorNatureza, preparar_cabecalho, validar_itens
+
+
+def _primeiro_digito_original(natureza: str, uf_emit: str, uf_dest: str, destino_op: str) -> str:
+    """Regra de `AgenteValidadorCFOP._inferir_primeiro_digito` antes do motor vetorizado"""
+    natureza = natureza.upper()
+    is_entrada = any(palavra in natureza for palavra in ['ENTRADA', 'COMPRA', 'DEVOLUÇÃO', 'DEV'])
+
+    if '1 - OPERAÇÃO INTERNA' in destino_op or uf_emit == uf_dest:
+        return '1' if is_entrada else '5'
+    elif '2 - OPERAÇÃO INTERESTADUAL' in destino_op or uf_emit != uf_dest:
+        return '2' if is_entrada else '6'
+    elif '3 - OPERAÇÃO COM EXTERIOR' in destino_op:
+        return '3' if is_entrada else '7'
+    return '?'
+
+
+def _ultimos_digitos_original(natureza: str) -> str:
+    """Regra dos últimos dígitos de `validar_cfop_item_especifico` antes do motor vetorizado"""
+    natureza = natureza.upper()
+    if any(palavra in natureza for palavra in ['DEV', 'DEVOLUÇÃO']):
+        return '949' if 'REMESSA' in natureza else '202'
+    elif 'VENDA' in natureza or 'COMPRA' in natureza or 'AQUISIÇÃO' in natureza:
+        return '102'
+    elif 'REMESSA' in natureza:
+        if 'DEMONSTRAÇÃO' in natureza:
+            return '912'
+        elif 'CONSERTO' in natureza or 'REPARO' in natureza:
+            return '915'
+        elif 'COMODATO' in natureza:
+            return '908'
+        return '949'
+    return '949'
+
+
+# (NÚMERO, NATUREZA DA OPERAÇÃO, UF EMITENTE, UF DESTINATÁRIO, DESTINO DA OPERAÇÃO)
+NOTAS = [
+    ('1', 'VENDA DE MERCADORIA', 'SP', 'SP', '1 - OPERAÇÃO INTERNA'),
+    ('2', 'COMPRA PARA COMERCIALIZAÇÃO', 'SP', 'RJ', '2 - OPERAÇÃO INTERESTADUAL'),
+    # Rota diz interna, UFs diferentes: o destino da operação vence
+    ('3', 'Venda de produção', 'SP', 'MG', '1 - OPERAÇÃO INTERNA'),
+    # Exterior com UFs diferentes: como na regra original, a comparação de UFs vem antes
+    ('4', 'VENDA PARA O EXTERIOR', 'SP', 'EX', '3 - OPERAÇÃO COM EXTERIOR'),
+    ('5', 'ENTRADA DE MERCADORIA', 'PR', 'PR', '3 - OPERAÇÃO COM EXTERIOR'),
+    ('6', 'DEVOLUÇÃO DE VENDA', 'SP', 'SP', '1 - OPERAÇÃO INTERNA'),
+    ('7', 'DEV. REMESSA EM CONSIGNAÇÃO', 'SP', 'RJ', '2 - OPERAÇÃO INTERESTADUAL'),
+    # AQUISIÇÃO não é entrada para o primeiro dígito, mas é compra para os últimos
+    ('8', 'AQUISIÇÃO DE MERCADORIA', 'SP', 'SP', '1 - OPERAÇÃO INTERNA'),
+    ('9', 'REMESSA PARA DEMONSTRAÇÃO', 'SP', 'RJ', '2 - OPERAÇÃO INTERESTADUAL'),
+    ('10', 'REMESSA PARA CONSERTO', 'SP', 'SP', '1 - OPERAÇÃO INTERNA'),
+    ('11', 'REMESSA PARA REPARO', 'SP', 'SP', ''),
+    ('12', 'REMESSA EM COMODATO', 'SP', 'RJ', ''),
+    ('13', 'REMESSA DE BRINDES', 'SP', 'SP', '1 - OPERAÇÃO INTERNA'),
+    ('14', 'BONIFICAÇÃO', 'SP', 'RJ', '2 - OPERAÇÃO INTERESTADUAL'),
+    ('15', None, 'SP', None, None),
+    # Segundo registro da mesma nota: vale o primeiro
+    ('1', 'COMPRA PARA COMERCIALIZAÇÃO', 'SP', 'RJ', '2 - OPERAÇÃO INTERESTADUAL'),
+]
+
+# (NÚMERO, CFOP)
+ITENS = [
+    ('1', '5.102'), ('1', '6102'), ('2', '2.102'), ('3', '5.102'), ('4', '7.102'),
+    ('5', '1.949'), ('6', '1.202'), ('7', '2949'), ('8', ' 5.102 '), ('8', '1.102'),
+    ('9', '6.912'), ('10', '5.915'), ('11', '5,915'), ('12', '6.908'), ('13', '5.949'),
+    ('14', '6.949'), ('15', '5.949'), ('1', None), ('2', ''), ('99', '5.102'),
+]
+
+
+def _dataframes(categoricas: bool):
+    cabecalho = pd.DataFrame(NOTAS, columns=['NÚMERO', 'NATUREZA DA OPERAÇÃO', 'UF EMITENTE',
+                                             'UF DESTINATÁRIO', 'DESTINO DA OPERAÇÃO'])
+    itens = pd.DataFrame(ITENS, columns=['NÚMERO', 'CFOP'])
+    if categoricas:
+        cabecalho = cabecalho.astype({coluna: 'category' for coluna in cabecalho.columns[1:]})
+        itens = itens.astype({'CFOP': 'category'})
+    return cabecalho, itens
+
+
+@pytest.fixture(params=[False, True], ids=['objeto', 'categorica'])
+def resultado(request):
+    cabecalho, itens = _dataframes(categoricas=request.param)
+    return validar_itens(itens, preparar_cabecalho(cabecalho))
+
+
+def _texto(valor) -> str:
+    return '' if valor is None else valor
+
+
+def test_motor_segue_as_regras_originais(resultado):
+    primeiras = {}
+    for numero, natureza, uf_emit, uf_dest, destino in NOTAS:
+        primeiras.setdefault(numero, tuple(_texto(v) for v in (natureza, uf_emit, uf_dest, destino)))
+
+    for (numero, cfop), linha in zip(ITENS, resultado.itertuples()):
+        cfop_limpo = _texto(cfop).strip().replace('.', '').replace(',', '').replace(' ', '')
+        primeiro_registrado = cfop_limpo[0] if cfop_limpo else '?'
+        assert linha.primeiro_digito_registrado == primeiro_registrado
+
+        if numero not in primeiras:
+            assert not linha.possui_cabecalho
+            assert not linha.diverge_primeiro_digito and not linha.diverge_cfop
+            continue
+
+        natureza, uf_emit, uf_dest, destino = primeiras[numero]
+        primeiro = _primeiro_digito_original(natureza, uf_emit, uf_dest, destino)
+        inferido = f"{primeiro}.{_ultimos_digitos_original(natureza)}" if primeiro != '?' else 'INDETERMINADO'
+        assert linha.possui_cabecalho
+        assert linha.primeiro_digito_esperado == primeiro, numero
+        assert linha.cfop_inferido == inferido, numero
+        assert linha.diverge_primeiro_digito == (primeiro != primeiro_registrado)
+        assert linha.diverge_cfop == (cfop_limpo != inferido.replace('.', ''))
+
+
+def test_casos_de_cada_regra(resultado):
+    por_posicao = resultado.set_index('posicao_item')
+    esperados = {
+        0: '5.102',   # interna, saída
+        2: '2.102',   # interestadual, entrada (COMPRA)
+        4: '6.102',   # exterior com UFs diferentes
+        5: '1.949',   # ENTRADA, mesma UF
+        6: '1.202',   # DEVOLUÇÃO
+        7: '2.949',   # DEV + REMESSA
+        8: '5.102',   # AQUISIÇÃO
+        10: '6.912', 11: '5.915', 12: '5.915', 13: '6.908', 14: '5.949', 15: '6.949',
+        16: '6.949',  # natureza, UF destinatário e destino vazios (UFs diferentes)
+    }
+    for posicao, cfop in esperados.items():
+        assert por_posicao.loc[posicao, 'cfop_inferido'] == cfop, posicao
+
+    # CFOP vazio (NaN ou '') e nota sem cabeçalho
+    assert list(por_posicao.loc[[17, 18], 'primeiro_digito_registrado']) == ['?', '?']
+    assert por_posicao.loc[[17, 18], 'diverge_primeiro_digito'].all()
+    assert not por_posicao.loc[19, 'possui_cabecalho']
+    assert por_posicao.loc[19, 'cfop_inferido'] == ''
+
+
+def test_colunas_categoricas_e_de_objeto_iguais():
+    resultados = []
+    for categoricas in (False, True):
+        cabecalho, itens = _dataframes(categoricas)
+        resultados.append(validar_itens(itens, preparar_cabecalho(cabecalho)).astype(object))
+    pd.testing.assert_frame_equal(*resultados)
+
+
+def test_classificador_entrada_e_ultimos_digitos():
+    classificador = ClassificadorNatureza(maximo=4)
+    devolucao = classificador.classificar('dev. de venda')
+    assert devolucao.entrada and devolucao.entrada_item and devolucao.ultimos_digitos == '202'
+    aquisicao = classificador.classificar('AQUISIÇÃO DE INSUMOS')
+    assert not aquisicao.entrada and aquisicao.entrada_item and aquisicao.ultimos_digitos == '102'
+
+    serie = pd.Series(['VENDA', None, 'REMESSA EM COMODATO', 'VENDA'], dtype='category')
+    classificacoes = classificador.classificar_serie(serie)
+    assert list(classificacoes['ultimos_digitos']) == ['102', '949', '908', '102']
+    assert list(classificacoes.index) == list(serie.index)
+
+
+def test_validacao_paralela_igual_a_sequencial(tmp_path, monkeypatch, capsys, gravar_dataset):
+    notas = {n: ['5102', '6102'] if n % 3 else ['6102', '1202', ''] for n in range(1, 121)}
+    caminhos, _ = gravar_dataset(tmp_path / 'dados', notas)
+
+    monkeypatch.setattr(agente_cfop, "PROCESSOS_VALIDACAO", 1)
+    sequencial = AgenteValidadorCFOP(*caminhos)._ferramentas['validar_todas_notas'].func()
+
+    monkeypatch.setattr(agente_cfop, "PROCESSOS_VALIDACAO", 2)
+    monkeypatch.setattr(agente_cfop, "MINIMO_ITENS_PARALELO", 1)
+    agente = AgenteValidadorCFOP(*caminhos)
+    assert agente._validar_em_paralelo()
+    capsys.readouterr()
+    paralela = agente._ferramentas['validar_todas_notas'].func()
+    assert "Validação em 2 processos" in capsys.readouterr().out
+
+    assert "VALIDAÇÃO COMPLETA" in sequencial
+    assert paralela == sequencial
@@ -0,0 +1,45 @@
+"""
+Revalidação incremental das notas a cada upload
+
+Execute: python -m pytest tests
+"""
+
+from agente_cfop import AgenteValidadorCFOP
+from validacao_incremental import RepositorioValidacoes
+
+
+def _validar(caminhos, repositorio=None) -> str:
+    agente = AgenteValidadorCFOP(*caminhos, repositorio_validacoes=repositorio)
+    return agente._ferramentas['validar_todas_notas'].func()
+
+
+def test_reupload_revalida_so_notas_alteradas(tmp_path, capsys, gravar_dataset):
+    notas = {str(n): ['5102', '6102'] if n % 2 else ['6102'] for n in range(1, 51)}
+    repositorio = RepositorioValidacoes('empresa_a', diretorio=str(tmp_path / 'cache'))
+
+    primeiro = gravar_dataset(tmp_path / 'v1', notas)[0]
+    assert _validar(primeiro, repositorio) == _validar(primeiro)
+
+    # Segundo upload: uma nota alterada e uma nova
+    notas['7'] = ['6102', '6102']
+    notas['51'] = ['5102']
+    segundo = gravar_dataset(tmp_path / 'v2', notas)[0]
+    capsys.readouterr()
+    incremental = _validar(segundo, repositorio)
+    assert "49 notas reaproveitadas, 2 validadas" in capsys.readouterr().out
+    assert incremental == _validar(segundo)
+
+
+def test_datasets_tem_resultados_separados(tmp_path, gravar_dataset):
+    cache = str(tmp_path / 'cache')
+    repositorio_a = RepositorioValidacoes('empresa_a', diretorio=cache)
+    repositorio_b = RepositorioValidacoes('empresa_b', diretorio=cache)
+    assert repositorio_a.arquivo != repositorio_b.arquivo
+
+    dados_a = gravar_dataset(tmp_path / 'a', {str(n): ['5102'] for n in range(1, 21)})[0]
+    dados_b = gravar_dataset(tmp_path / 'b', {str(n): ['6102'] for n in range(1, 21)})[0]
+    _validar(dados_a, repositorio_a)
+    _validar(dados_b, repositorio_b)
+    # O upload de B não substitui os resultados gravados de A
+    assert _validar(dados_a, repositorio_a) == _validar(dados_a)
+    assert len(repositorio_a.carregar()) == 20
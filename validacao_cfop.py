@@ -0,0 +1,580 @@
+"""
+Motor vetorizado de validação de CFOP
+
+Aplica sobre o dataset inteiro as mesmas regras usadas pelo agente em
+`_inferir_primeiro_digito` (primeiro dígito) e `validar_cfop_item_especifico`
+(últimos dígitos), usando operações de coluna do pandas/NumPy em vez de
+percorrer os itens com iterrows().
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from typing import NamedTuple
+from indices import COLUNAS_CHAVE_ACESSO, normalizar_numeros_nota
+
+# Palavras que indicam operação de ENTRADA (regra de `_inferir_primeiro_digito`)
+PALAVRAS_ENTRADA = ['ENTRADA', 'COMPRA', 'DEVOLUÇÃO', 'DEV']
+
+# A validação de item específico também considera AQUISIÇÃO como entrada
+PALAVRAS_ENTRADA_ITEM = PALAVRAS_ENTRADA + ['AQUISIÇÃO']
+
+# Regras dos últimos dígitos de `validar_cfop_item_especifico`, na ordem de
+# avaliação: (grupos de palavras que precisam aparecer, dígitos, justificativa).
+# Cada grupo é satisfeito por qualquer uma das suas palavras.
+REGRAS_ULTIMOS_DIGITOS = [
+    ((('DEV', 'DEVOLUÇÃO'), ('REMESSA',)), '949', "Devolução de remessa"),
+    ((('DEV', 'DEVOLUÇÃO'),), '202', "Devolução de compra/venda"),
+    ((('VENDA', 'COMPRA', 'AQUISIÇÃO'),), '102', "Venda/Compra de mercadoria"),
+    ((('REMESSA',), ('DEMONSTRAÇÃO',)), '912', "Remessa para demonstração"),
+    ((('REMESSA',), ('CONSERTO', 'REPARO')), '915', "Remessa para conserto/reparo"),
+    ((('REMESSA',), ('COMODATO',)), '908', "Remessa em comodato"),
+    ((('REMESSA',),), '949', "Outra remessa"),
+]
+ULTIMOS_DIGITOS_PADRAO = ('949', "Outra operação não especificada")
+
+# Textos do campo DESTINO DA OPERAÇÃO
+DESTINO_INTERNA = '1 - OPERAÇÃO INTERNA'
+DESTINO_INTERESTADUAL = '2 - OPERAÇÃO INTERESTADUAL'
+DESTINO_EXTERIOR = '3 - OPERAÇÃO COM EXTERIOR'
+
+# Situação de cada item na validação em lote
+STATUS_CONFORME = 'conforme'
+STATUS_DIVERGE_PRIMEIRO_DIGITO = 'divergente_primeiro_digito'
+STATUS_DIVERGE_ULTIMOS_DIGITOS = 'divergente_ultimos_digitos'
+STATUS_SEM_CABECALHO = 'sem_cabecalho'
+STATUS_CHAVE_NAO_ENCONTRADA = 'chave_nao_encontrada'
+
+# Processos usados por validar_todas_notas ("1" = sem paralelismo, "0" = todos os núcleos)
+PROCESSOS_VALIDACAO = int(os.getenv("CFOP_PROCESSOS_VALIDACAO", "1")) or os.cpu_count() or 1
+
+# Textos de natureza classificados guardados em memória (os menos usados saem primeiro)
+MAXIMO_NATUREZAS_CLASSIFICADAS = int(os.getenv("CFOP_MAXIMO_NATUREZAS_CACHE", "10000"))
+
+# Abaixo desta quantidade de itens o custo de enviar as partições aos processos não compensa
+MINIMO_ITENS_PARALELO = int(os.getenv("CFOP_MINIMO_ITENS_PARALELO", "1000000"))
+
+# Início dos processos do pool: a validação é chamada de threads do servidor, e
+# um fork de processo com várias threads pode herdar travas (logging, alocadores
+# do pandas/pyarrow) presas por outra thread
+METODO_INICIO_PROCESSOS = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _texto(df: pd.DataFrame, coluna: str) -> pd.Series:
+    """
+    Coluna convertida para texto (vazia se não existir no DataFrame)
+
+    Colunas categóricas continuam categóricas: só as categorias viram texto
+    e as operações de texto (`.str`) rodam uma vez por categoria.
+    """
+    if coluna not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+
+    serie = df[coluna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories.astype(str)
+        if categorias.is_unique and '' not in categorias:
+            # Valores vazios viram a categoria '', como o fillna('') abaixo
+            codigos = serie.cat.codes.to_numpy()
+            if (codigos < 0).any():
+                codigos = np.where(codigos < 0, len(categorias), codigos)
+                categorias = categorias.append(pd.Index(['']))
+            return pd.Series(pd.Categorical.from_codes(codigos, categories=categorias),
+                             index=serie.index, name=serie.name)
+    return serie.astype(str).fillna('')
+
+
+def _valores(serie: pd.Series) -> np.ndarray:
+    """Valores de uma série como array de objetos (categóricas com categorias diferentes são comparáveis)"""
+    return serie.to_numpy(dtype=object)
+
+
+def _contem(serie: pd.Series, *palavras) -> np.ndarray:
+    """Máscara booleana: a série contém alguma das palavras"""
+    mascara = np.zeros(len(serie), dtype=bool)
+    for palavra in palavras:
+        mascara |= serie.str.contains(palavra, regex=False).fillna(False).to_numpy(dtype=bool)
+    return mascara
+
+
+def _limpar_cfop(serie: pd.Series) -> pd.Series:
+    """Remove pontos, vírgulas e espaços de uma série de CFOPs"""
+    return serie.str.strip().str.replace(r'[., ]', '', regex=True)
+
+
+# ============================================================================
+# CLASSIFICAÇÃO DA NATUREZA DA OPERAÇÃO
+# ============================================================================
+
+class ClassificacaoNatureza(NamedTuple):
+    entrada: bool          # regra do primeiro dígito (validação geral)
+    entrada_item: bool     # regra da validação de item específico (inclui AQUISIÇÃO)
+    ultimos_digitos: str
+    justificativa: str
+
+
+def _compilar_palavras(palavras) -> re.Pattern:
+    return re.compile('|'.join(re.escape(palavra) for palavra in palavras))
+
+
+class ClassificadorNatureza:
+    """
+    Classifica textos de NATUREZA DA OPERAÇÃO com as regras de palavras-chave
+
+    As regras são compiladas uma única vez e cada texto distinto é
+    classificado uma única vez: os datasets têm poucas centenas de naturezas
+    distintas para milhões de itens. As classificações ficam num cache LRU de
+    até `MAXIMO_NATUREZAS_CLASSIFICADAS` textos, compartilhado pelos datasets.
+    """
+
+    def __init__(self, maximo: int = MAXIMO_NATUREZAS_CLASSIFICADAS):
+        self._entrada = _compilar_palavras(PALAVRAS_ENTRADA)
+        self._entrada_item = _compilar_palavras(PALAVRAS_ENTRADA_ITEM)
+        self._regras = [
+            ([_compilar_palavras(grupo) for grupo in grupos], digitos, justificativa)
+            for grupos, digitos, justificativa in REGRAS_ULTIMOS_DIGITOS
+        ]
+        self._classificacoes = OrderedDict()
+        self._maximo = maximo
+        self._lock = threading.Lock()
+
+    def classificar(self, natureza) -> ClassificacaoNatureza:
+        """
+        Classifica um texto de natureza (maiúsculas/minúsculas indiferentes)
+
+        Args:
+            natureza: Texto da NATUREZA DA OPERAÇÃO
+
+        Returns:
+            ClassificacaoNatureza com entrada/saída e últimos dígitos do CFOP
+        """
+        natureza = str(natureza).upper()
+        with self._lock:
+            classificacao = self._classificacoes.get(natureza)
+            if classificacao is not None:
+                self._classificacoes.move_to_end(natureza)
+                return classificacao
+
+        classificacao = self._classificar_texto(natureza)
+        with self._lock:
+            self._classificacoes[natureza] = classificacao
+            while len(self._classificacoes) > self._maximo:
+                self._classificacoes.popitem(last=False)
+        return classificacao
+
+    def _classificar_texto(self, natureza: str) -> ClassificacaoNatureza:
+        ultimos_digitos, justificativa = ULTIMOS_DIGITOS_PADRAO
+        for grupos, digitos, motivo in self._regras:
+            if all(grupo.search(natureza) for grupo in grupos):
+                ultimos_digitos, justificativa = digitos, motivo
+                break
+
+        return ClassificacaoNatureza(
+            entrada=bool(self._entrada.search(natureza)),
+            entrada_item=bool(self._entrada_item.search(natureza)),
+            ultimos_digitos=ultimos_digitos,
+            justificativa=justificativa
+        )
+
+    def classificar_serie(self, natureza: pd.Series) -> pd.DataFrame:
+        """
+        Classifica uma coluna inteira pelos seus valores distintos
+
+        Cada valor distinto é classificado uma vez e o resultado volta para as
+        linhas pelos códigos da categoria (séries categóricas) ou da fatoração.
+
+        Args:
+            natureza: Série com textos de natureza
+
+        Returns:
+            DataFrame com as colunas de ClassificacaoNatureza, alinhado à série
+        """
+        if isinstance(natureza.dtype, pd.CategoricalDtype):
+            codigos, distintos = natureza.cat.codes.to_numpy(), list(natureza.cat.categories)
+            if (codigos < 0).any():
+                codigos = np.where(codigos < 0, len(distintos), codigos)
+                distintos.append(np.nan)
+        else:
+            codigos, distintos = pd.factorize(natureza, use_na_sentinel=False)
+        classificacoes = pd.DataFrame(
+            [self.classificar(valor) for valor in distintos],
+            columns=ClassificacaoNatureza._fields
+        )
+
+        resultado = classificacoes.take(codigos)
+        resultado.index = natureza.index
+        return resultado
+
+
+# Instância compartilhada (o cache de naturezas vale para todos os datasets)
+classificador_natureza = ClassificadorNatureza()
+
+
+def inferir_primeiro_digito(natureza: pd.Series, uf_emit: pd.Series,
+                            uf_dest: pd.Series, destino_op: pd.Series) -> np.ndarray:
+    """
+    Versão vetorizada de `AgenteValidadorCFOP._inferir_primeiro_digito`
+
+    Returns:
+        Array com o primeiro dígito esperado ('1'...'7' ou '?')
+    """
+    is_entrada = classificador_natureza.classificar_serie(natureza)['entrada'].to_numpy(dtype=bool)
+    mesma_uf = _valores(uf_emit) == _valores(uf_dest)
+
+    condicoes = [
+        _contem(destino_op, DESTINO_INTERNA) | mesma_uf,
+        _contem(destino_op, DESTINO_INTERESTADUAL) | ~mesma_uf,
+        _contem(destino_op, DESTINO_EXTERIOR),
+    ]
+    escolhas = [
+        np.where(is_entrada, '1', '5'),
+        np.where(is_entrada, '2', '6'),
+        np.where(is_entrada, '3', '7'),
+    ]
+    return np.select(condicoes, escolhas, default='?')
+
+
+def inferir_ultimos_digitos(natureza: pd.Series) -> np.ndarray:
+    """
+    Versão vetorizada da regra de últimos dígitos de `validar_cfop_item_especifico`
+
+    Returns:
+        Array com os 3 últimos dígitos esperados
+    """
+    return classificador_natureza.classificar_serie(natureza)['ultimos_digitos'].to_numpy(dtype=object)
+
+
+def preparar_cabecalho(df_cabecalho: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduz o cabeçalho a uma linha por NÚMERO com o CFOP esperado já inferido
+
+    Como nas buscas do agente, vale o primeiro registro de cada número de nota.
+
+    Args:
+        df_cabecalho: DataFrame de cabeçalho das notas
+
+    Returns:
+        DataFrame indexado pelo NÚMERO normalizado da nota
+    """
+    numeros = normalizar_numeros_nota(df_cabecalho['NÚMERO'])
+    primeira_ocorrencia = ~numeros.duplicated().to_numpy()
+    cabecalho = df_cabecalho[primeira_ocorrencia]
+
+    natureza = _texto(cabecalho, 'NATUREZA DA OPERAÇÃO')
+    uf_emit = _texto(cabecalho, 'UF EMITENTE')
+    uf_dest = _texto(cabecalho, 'UF DESTINATÁRIO')
+    destino_op = _texto(cabecalho, 'DESTINO DA OPERAÇÃO')
+
+    primeiro_digito = inferir_primeiro_digito(natureza, uf_emit, uf_dest, destino_op)
+    ultimos_digitos = inferir_ultimos_digitos(natureza)
+    cfop_inferido = np.where(
+        primeiro_digito == '?',
+        'INDETERMINADO',
+        np.char.add(np.char.add(primeiro_digito.astype(str), '.'), ultimos_digitos.astype(str))
+    )
+
+    return pd.DataFrame({
+        'natureza': natureza.to_numpy(),
+        'uf_emitente': uf_emit.to_numpy(),
+        'uf_destinatario': uf_dest.to_numpy(),
+        'primeiro_digito_esperado': primeiro_digito,
+        'cfop_inferido': cfop_inferido,
+    }, index=pd.Index(numeros[primeira_ocorrencia].to_numpy(), name='numero_nota'))
+
+
+def validar_itens(df_itens: pd.DataFrame, cabecalho: pd.DataFrame, deslocamento: int = 0,
+                  posicoes_itens: np.ndarray = None) -> pd.DataFrame:
+    """
+    Valida o CFOP de todos os itens contra o cabeçalho preparado
+
+    Itens e cabeçalho são unidos uma única vez pelo NÚMERO da nota (junção
+    por hash). Itens sem cabeçalho correspondente não geram divergência.
+
+    Args:
+        df_itens: DataFrame de itens (ou um bloco dele)
+        cabecalho: Resultado de `preparar_cabecalho`
+        deslocamento: Posição do primeiro item do bloco no arquivo de itens
+        posicoes_itens: Posição de cada item no arquivo, quando o bloco não é
+            contíguo (substitui `deslocamento`)
+
+    Returns:
+        DataFrame com uma linha por item e as colunas de resultado
+    """
+    numeros = normalizar_numeros_nota(df_itens['NÚMERO'])
+    posicoes = cabecalho.index.get_indexer(numeros)
+    possui_cabecalho = posicoes >= 0
+
+    cfop_registrado = _texto(df_itens, 'CFOP').str.strip()
+    cfop_limpo = _limpar_cfop(cfop_registrado)
+    primeiro_registrado = cfop_limpo.str[0].fillna('?').to_numpy()
+
+    def da_nota(coluna):
+        # Valor do cabeçalho de cada item ('' quando a nota não tem cabeçalho)
+        if len(cabecalho) == 0:
+            return np.full(len(df_itens), '', dtype=object)
+        valores = cabecalho[coluna].to_numpy()[np.where(possui_cabecalho, posicoes, 0)]
+        return np.where(possui_cabecalho, valores, '')
+
+    primeiro_esperado = da_nota('primeiro_digito_esperado')
+    cfop_inferido = da_nota('cfop_inferido')
+    cfop_inferido_limpo = _limpar_cfop(pd.Series(cfop_inferido, index=df_itens.index)).to_numpy()
+
+    diverge_primeiro = possui_cabecalho & (primeiro_esperado != primeiro_registrado)
+    diverge_cfop = possui_cabecalho & (cfop_limpo.to_numpy() != cfop_inferido_limpo)
+
+    if posicoes_itens is None:
+        posicoes_itens = np.arange(deslocamento, deslocamento + len(df_itens))
+    
+    return pd.DataFrame({
+        'posicao_item': posicoes_itens,
+        'numero_nota': numeros.to_numpy(),
+        'cfop_registrado': cfop_registrado.to_numpy(),
+        'cfop_inferido': cfop_inferido,
+        'primeiro_digito_esperado': primeiro_esperado,
+        'primeiro_digito_registrado': primeiro_registrado,
+        'possui_cabecalho': possui_cabecalho,
+        'diverge_primeiro_digito': diverge_primeiro,
+        'diverge_cfop': diverge_cfop,
+        'natureza': da_nota('natureza'),
+        'uf_emitente': da_nota('uf_emitente'),
+        'uf_destinatario': da_nota('uf_destinatario'),
+    }, index=df_itens.index)
+
+
+def resultados_por_item(df_itens: pd.DataFrame, resultado: pd.DataFrame) -> pd.DataFrame:
+    """
+    Resultado de `validar_itens` no formato da validação em lote
+
+    Uma linha por item com a identificação do item (chave, nota, número do
+    produto), os CFOPs registrado e inferido e a situação do item.
+
+    Args:
+        df_itens: Itens validados (mesmas linhas de `resultado`)
+        resultado: Resultado de `validar_itens`
+
+    Returns:
+        DataFrame pronto para serialização (uma linha por item)
+    """
+    coluna_chave = next((c for c in COLUNAS_CHAVE_ACESSO if c in df_itens.columns), None)
+    chaves = _texto(df_itens, coluna_chave).to_numpy() if coluna_chave else ''
+
+    status = np.select(
+        [
+            ~resultado['possui_cabecalho'].to_numpy(),
+            resultado['diverge_primeiro_digito'].to_numpy(),
+            resultado['diverge_cfop'].to_numpy(),
+        ],
+        [STATUS_SEM_CABECALHO, STATUS_DIVERGE_PRIMEIRO_DIGITO, STATUS_DIVERGE_ULTIMOS_DIGITOS],
+        default=STATUS_CONFORME
+    )
+
+    return pd.DataFrame({
+        'posicao_item': resultado['posicao_item'].to_numpy(),
+        'chave_acesso': chaves,
+        'numero_nota': resultado['numero_nota'].to_numpy(),
+        'numero_item': _texto(df_itens, 'NÚMERO PRODUTO').to_numpy(),
+        'cfop_registrado': resultado['cfop_registrado'].to_numpy(),
+        'cfop_inferido': resultado['cfop_inferido'].to_numpy(),
+        'primeiro_digito_esperado': resultado['primeiro_digito_esperado'].to_numpy(),
+        'status': status,
+        'natureza': resultado['natureza'].to_numpy(),
+        'uf_emitente': resultado['uf_emitente'].to_numpy(),
+        'uf_destinatario': resultado['uf_destinatario'].to_numpy(),
+    })
+
+
+class ResumoValidacao:
+    """Acumula contagens e exemplos de divergências de uma validação"""
+
+    def __init__(self, limite_exemplos: int = 10):
+        self.limite_exemplos = limite_exemplos
+        self.total_itens = 0
+        self.itens_sem_cabecalho = 0
+        self.divergencias_primeiro_digito = 0
+        self.divergencias_ultimos_digitos = 0
+        self.exemplos = []
+
+    def acumular(self, resultado: pd.DataFrame):
+        """Soma o resultado de `validar_itens` (dataset inteiro ou um bloco)"""
+        diverge_primeiro = resultado['diverge_primeiro_digito'].to_numpy()
+        diverge_ultimos = resultado['diverge_cfop'].to_numpy() & ~diverge_primeiro
+
+        self.total_itens += len(resultado)
+        self.itens_sem_cabecalho += int((~resultado['possui_cabecalho'].to_numpy()).sum())
+        self.divergencias_primeiro_digito += int(diverge_primeiro.sum())
+        self.divergencias_ultimos_digitos += int(diverge_ultimos.sum())
+
+        faltam = self.limite_exemplos - len(self.exemplos)
+        if faltam > 0:
+            for _, linha in resultado[diverge_primeiro].head(faltam).iterrows():
+                self.exemplos.append({
+                    'posicao': linha['posicao_item'],
+                    'nota': linha['numero_nota'],
+                    'cfop_atual': linha['cfop_registrado'],
+                    'esperado': f"{linha['primeiro_digito_esperado']}xxx",
+                    'cfop_inferido': linha['cfop_inferido'],
+                    'natureza': linha['natureza'],
+                    'uf_emit': linha['uf_emitente'],
+                    'uf_dest': linha['uf_destinatario']
+                })
+
+    def combinar(self, outro: 'ResumoValidacao'):
+        """
+        Soma o resumo de outra partição dos itens
+
+        Os exemplos são reordenados pela posição do item no arquivo, então o
+        resultado é o mesmo de validar todos os itens em sequência.
+        """
+        self.total_itens += outro.total_itens
+        self.itens_sem_cabecalho += outro.itens_sem_cabecalho
+        self.divergencias_primeiro_digito += outro.divergencias_primeiro_digito
+        self.divergencias_ultimos_digitos += outro.divergencias_ultimos_digitos
+
+        self.exemplos = sorted(self.exemplos + outro.exemplos, key=lambda d: d['posicao'])
+        del self.exemplos[self.limite_exemplos:]
+
+    def formatar(self) -> str:
+        """Gera o relatório em texto usado pela ferramenta validar_todas_notas"""
+        total_divergencias = self.divergencias_primeiro_digito
+
+        resultado = f"✅ VALIDAÇÃO COMPLETA\n\n"
+        resultado += f"Total de itens analisados: {self.total_itens}\n"
+        resultado += f"Divergências encontradas: {total_divergencias}\n"
+
+        if self.total_itens > 0:
+            taxa_conformidade = ((self.total_itens - total_divergencias) / self.total_itens * 100)
+            resultado += f"Taxa de conformidade: {taxa_conformidade:.1f}%\n"
+
+        resultado += f"Divergências nos últimos dígitos: {self.divergencias_ultimos_digitos}\n"
+        if self.itens_sem_cabecalho:
+            resultado += f"Itens sem cabeçalho correspondente: {self.itens_sem_cabecalho}\n"
+        resultado += "\n"
+
+        if total_divergencias:
+            resultado += "❌ DIVERGÊNCIAS ENCONTRADAS:\n\n"
+            for i, d in enumerate(self.exemplos, 1):
+                resultado += f"{i}. Nota {d['nota']}:\n"
+                resultado += f"   CFOP atual: {d['cfop_atual']}\n"
+                resultado += f"   CFOP esperado: {d['esperado']} (inferido: {d['cfop_inferido']})\n"
+                resultado += f"   Natureza: {d['natureza']}\n"
+                resultado += f"   Rota: {d['uf_emit']} → {d['uf_dest']}\n\n"
+
+            if total_divergencias > len(self.exemplos):
+                resultado += f"\n... e mais {total_divergencias - len(self.exemplos)} divergências.\n"
+        else:
+            resultado += "✅ Todos os CFOPs verificados estão corretos!\n"
+
+        return resultado
+
+
+# ============================================================================
+# VALIDAÇÃO EM VÁRIOS PROCESSOS
+# ============================================================================
+
+# Pool de processos da validação: criado na primeira validação paralela e
+# reaproveitado pelas seguintes (de qualquer dataset)
+_pool = None
+_processos_pool = 0
+_lock_pool = threading.Lock()
+
+
+def _obter_pool(processos: int) -> ProcessPoolExecutor:
+    """Pool compartilhado com `processos` processos (recriado se a quantidade mudar)"""
+    global _pool, _processos_pool
+    with _lock_pool:
+        if _pool is None or _processos_pool != processos:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            print(f"   ⚙️ Iniciando pool de validação: {processos} processos ({METODO_INICIO_PROCESSOS})")
+            _pool = ProcessPoolExecutor(max_workers=processos,
+                                        mp_context=multiprocessing.get_context(METODO_INICIO_PROCESSOS))
+            _processos_pool = processos
+        return _pool
+
+
+def _descartar_pool(pool: ProcessPoolExecutor):
+    """Descarta um pool quebrado (ex.: processo encerrado pelo sistema); a próxima validação cria outro"""
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _validar_particao(itens: pd.DataFrame, cabecalho: pd.DataFrame, posicoes: np.ndarray,
+                      limite_exemplos: int) -> ResumoValidacao:
+    resumo = ResumoValidacao(limite_exemplos)
+    resumo.acumular(validar_itens(itens, cabecalho, posicoes_itens=posicoes))
+    return resumo
+
+
+def particionar_por_nota(numeros: pd.Series, particoes: int):
+    """
+    Divide as linhas em partições sem separar os itens de uma mesma nota
+
+    As notas são distribuídas em rodízio (na ordem em que aparecem) e cada
+    partição mantém a ordem original das linhas.
+
+    Args:
+        numeros: Coluna NÚMERO dos itens
+        particoes: Quantidade de partições
+
+    Returns:
+        Lista com as posições das linhas de cada partição
+    """
+    codigos, _ = pd.factorize(normalizar_numeros_nota(numeros).to_numpy())
+    grupos = codigos % particoes
+    ordem = np.argsort(grupos, kind='stable')
+    fins = np.cumsum(np.bincount(grupos, minlength=particoes))
+    return np.split(ordem, fins[:-1])
+
+
+def validar_em_paralelo(particoes, cabecalho: pd.DataFrame, processos: int = PROCESSOS_VALIDACAO,
+                        limite_exemplos: int = 10) -> ResumoValidacao:
+    """
+    Valida partições de itens em um pool de processos e junta os resumos
+
+    No máximo `2 * processos` partições ficam em trânsito ao mesmo tempo, então
+    um gerador de blocos (modo streaming) não é lido inteiro para a memória.
+    O pool é compartilhado entre as chamadas: cada partição leva só as linhas
+    do cabeçalho das suas notas.
+
+    Args:
+        particoes: Iterável de (posições dos itens no arquivo, DataFrame de itens)
+        cabecalho: Resultado de `preparar_cabecalho`
+        processos: Quantidade de processos
+        limite_exemplos: Exemplos de divergência mantidos no resumo
+
+    Returns:
+        ResumoValidacao com o total de todas as partições
+    """
+    resumo = ResumoValidacao(limite_exemplos)
+    pendentes = set()
+    pool = _obter_pool(processos)
+
+    try:
+        for posicoes, itens in particoes:
+            if len(pendentes) >= 2 * processos:
+                concluidas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in concluidas:
+                    resumo.combinar(futuro.result())
+            notas = normalizar_numeros_nota(itens['NÚMERO']).unique()
+            cabecalho_particao = cabecalho[cabecalho.index.isin(notas)]
+            pendentes.add(pool.submit(_validar_particao, itens, cabecalho_particao, posicoes, limite_exemplos))
+
+        for futuro in pendentes:
+            resumo.combinar(futuro.result())
+    except BrokenProcessPool:
+        _descartar_pool(pool)
+        raise
+    finally:
+        for futuro in pendentes:
+            futuro.cancel()
+
+    return resumo
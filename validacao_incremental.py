@@ -0,0 +1,224 @@
+"""
+Revalidação incremental das notas
+
+Os resultados da validação de cada nota ficam gravados no diretório de cache,
+um arquivo por dataset, identificados pela chave de acesso e por um hash do
+conteúdo da nota (linha do cabeçalho + itens). A validação roda ao carregar
+cada upload: só as notas novas ou alteradas passam pelo motor de validação,
+as demais reaproveitam o resultado gravado, e o resumo fica pronto para
+`validar_todas_notas`.
+"""
+
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Tuple
+
+from carregador_dados import DIRETORIO_CACHE, PYARROW_DISPONIVEL
+from indices import COLUNAS_CHAVE_ACESSO, normalizar_numeros_nota
+import validacao_cfop
+from validacao_cfop import validar_itens, ResumoValidacao
+
+if PYARROW_DISPONIVEL:
+    import pyarrow.feather as feather
+
+# "1" valida as notas ao carregar cada upload, reaproveitando os resultados das
+# notas inalteradas. "0" deixa a validação para a primeira chamada de
+# `validar_todas_notas` (sempre completa)
+VALIDACAO_INCREMENTAL = os.getenv("CFOP_VALIDACAO_INCREMENTAL", "1") == "1"
+
+# Multiplicador usado para combinar o hash do cabeçalho com o dos itens
+_MISTURA_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+
+def versao_regras() -> str:
+    """Identifica o conjunto de regras: resultados gravados com outras regras não valem"""
+    regras = repr((
+        validacao_cfop.PALAVRAS_ENTRADA, validacao_cfop.PALAVRAS_ENTRADA_ITEM,
+        validacao_cfop.REGRAS_ULTIMOS_DIGITOS, validacao_cfop.ULTIMOS_DIGITOS_PADRAO,
+        validacao_cfop.DESTINO_INTERNA, validacao_cfop.DESTINO_INTERESTADUAL,
+        validacao_cfop.DESTINO_EXTERIOR
+    ))
+    return hashlib.sha256(regras.encode('utf-8')).hexdigest()[:12]
+
+
+def _hash_linhas(df: pd.DataFrame) -> np.ndarray:
+    """Hash de 64 bits de cada linha (independente do índice)"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+
+
+def calcular_hash_notas(df_cabecalho: pd.DataFrame, df_itens: pd.DataFrame, ordem_itens: np.ndarray,
+                        tabela_itens: Dict[str, Tuple[int, int]]) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    Calcula a identificação e o hash do conteúdo de cada nota
+
+    O hash combina a linha do cabeçalho com todos os itens da nota, na ordem
+    em que aparecem (mudar, incluir, remover ou reordenar itens muda o hash).
+
+    Args:
+        df_cabecalho: DataFrame de cabeçalho
+        df_itens: DataFrame de itens
+        ordem_itens, tabela_itens: Resultado de `construir_tabela_notas` para os itens
+
+    Returns:
+        Tupla (notas, ordem_na_nota, nota_do_grupo):
+        - `notas`: indexado pelo NÚMERO normalizado, com chave_acesso, hash_nota
+          e a faixa (inicio_itens, fim_itens) dos itens da nota em `ordem_itens`
+        - `ordem_na_nota`: para cada posição do arquivo de itens, a ordem do
+          item dentro da sua nota
+        - `nota_do_grupo`: para cada nota de `tabela_itens`, a linha
+          correspondente em `notas` (-1 para itens sem cabeçalho)
+    """
+    numeros = normalizar_numeros_nota(df_cabecalho['NÚMERO'])
+    primeira_ocorrencia = ~numeros.duplicated().to_numpy()
+    cabecalho = df_cabecalho[primeira_ocorrencia]
+    notas = numeros[primeira_ocorrencia].to_numpy()
+
+    coluna_chave = next((c for c in COLUNAS_CHAVE_ACESSO if c in cabecalho.columns), None)
+    if coluna_chave:
+        chaves = cabecalho[coluna_chave].astype(str).fillna('').str.replace(r"[ \-.']", '', regex=True)
+        chaves = chaves.where(chaves != '', pd.Series(notas, index=cabecalho.index)).to_numpy()
+    else:
+        chaves = notas
+
+    # Faixa de cada nota dos itens em `ordem_itens` e a nota do cabeçalho correspondente
+    faixas = np.array(list(tabela_itens.values()), dtype=np.int64).reshape(-1, 2)
+    tamanhos = faixas[:, 1] - faixas[:, 0]
+    nota_do_grupo = pd.Index(notas).get_indexer(list(tabela_itens.keys()))
+    com_cabecalho = nota_do_grupo >= 0
+
+    ordem_na_nota = np.empty(len(ordem_itens), dtype=np.int64)
+    ordem_na_nota[ordem_itens] = np.arange(len(ordem_itens)) - np.repeat(faixas[:, 0], tamanhos)
+
+    # Itens: hash de cada linha ponderado pela ordem dentro da nota e somado por nota
+    hash_itens = _hash_linhas(df_itens) * (ordem_na_nota.astype(np.uint64) + np.uint64(1))
+    hash_itens_nota = np.zeros(len(notas), dtype=np.uint64)
+    inicio_itens = np.zeros(len(notas), dtype=np.int64)
+    fim_itens = np.zeros(len(notas), dtype=np.int64)
+    if len(faixas):
+        soma_por_nota = np.add.reduceat(hash_itens[ordem_itens], faixas[:, 0])
+        hash_itens_nota[nota_do_grupo[com_cabecalho]] = soma_por_nota[com_cabecalho]
+        inicio_itens[nota_do_grupo[com_cabecalho]] = faixas[com_cabecalho, 0]
+        fim_itens[nota_do_grupo[com_cabecalho]] = faixas[com_cabecalho, 1]
+
+    return pd.DataFrame({
+        'chave_acesso': chaves,
+        'hash_nota': (_hash_linhas(cabecalho) * _MISTURA_HASH) ^ hash_itens_nota,
+        'inicio_itens': inicio_itens,
+        'fim_itens': fim_itens,
+    }, index=pd.Index(notas, name='numero_nota')), ordem_na_nota, nota_do_grupo
+
+
+class RepositorioValidacoes:
+    """Resultados por item das notas já validadas de um dataset, gravados em Arrow IPC"""
+
+    def __init__(self, dataset_id: str, diretorio: str = None):
+        diretorio = os.path.join(diretorio or DIRETORIO_CACHE, 'validacoes', dataset_id)
+        self.arquivo = os.path.join(diretorio, f"validacao_notas_{versao_regras()}.arrow")
+
+    def carregar(self) -> Optional[pd.DataFrame]:
+        """Resultados gravados na última validação (None se não houver)"""
+        if not PYARROW_DISPONIVEL or not os.path.exists(self.arquivo):
+            return None
+        try:
+            return feather.read_table(self.arquivo, memory_map=True).to_pandas()
+        except Exception as e:
+            print(f"   ⚠️ Resultados de validação gravados inválidos, validando tudo: {e}")
+            return None
+
+    def gravar(self, resultados: pd.DataFrame):
+        """Substitui os resultados gravados (arquivo temporário + rename)"""
+        if not PYARROW_DISPONIVEL:
+            return
+        os.makedirs(os.path.dirname(self.arquivo), exist_ok=True)
+        temporario = f"{self.arquivo}.{os.getpid()}.tmp"
+        try:
+            feather.write_feather(resultados.reset_index(drop=True), temporario, compression='uncompressed')
+            os.replace(temporario, self.arquivo)
+            print(f"   💾 Resultados por nota gravados: {len(resultados):,} itens")
+        except Exception as e:
+            print(f"   ⚠️ Não foi possível gravar os resultados por nota: {e}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+
+def _identificar_notas(chaves, hashes) -> pd.MultiIndex:
+    """Identificação de cada nota: chave de acesso + hash do conteúdo"""
+    return pd.MultiIndex.from_arrays([np.asarray(chaves, dtype=object), np.asarray(hashes, dtype=np.uint64)])
+
+
+def validar_incremental(df_cabecalho: pd.DataFrame, df_itens: pd.DataFrame, ordem_itens: np.ndarray,
+                        tabela_itens: Dict[str, Tuple[int, int]], cabecalho: pd.DataFrame,
+                        repositorio: RepositorioValidacoes) -> ResumoValidacao:
+    """
+    Valida todos os itens reaproveitando os resultados das notas inalteradas
+
+    Args:
+        df_cabecalho: DataFrame de cabeçalho
+        df_itens: DataFrame de itens (em memória)
+        ordem_itens, tabela_itens: Resultado de `construir_tabela_notas` para os itens
+        cabecalho: Resultado de `preparar_cabecalho`
+        repositorio: Onde os resultados por nota do dataset são gravados
+
+    Returns:
+        ResumoValidacao igual ao de uma validação completa
+    """
+    notas, ordem_na_nota, nota_do_grupo = calcular_hash_notas(df_cabecalho, df_itens, ordem_itens, tabela_itens)
+    hashes = notas['hash_nota'].to_numpy(dtype=np.uint64)
+
+    # Uma nota é reaproveitada se a chave de acesso e o hash do conteúdo forem os
+    # mesmos da gravação anterior; identificações repetidas no upload não são reaproveitadas
+    identificacao = _identificar_notas(notas['chave_acesso'], hashes)
+    unicas = ~identificacao.duplicated(keep=False)
+    anteriores = repositorio.carregar()
+    if anteriores is not None and len(anteriores):
+        identificacao_anteriores = _identificar_notas(anteriores['chave_acesso'], anteriores['hash_nota'])
+        inalteradas = identificacao.isin(identificacao_anteriores) & unicas
+    else:
+        inalteradas = np.zeros(len(notas), dtype=bool)
+
+    # Notas novas ou alteradas (e itens sem cabeçalho): passam pelo motor de validação
+    revalidar_grupo = (nota_do_grupo < 0) | ~inalteradas[np.maximum(nota_do_grupo, 0)]
+    tamanhos = np.diff(np.array(list(tabela_itens.values()), dtype=np.int64).reshape(-1, 2), axis=1).ravel()
+    posicoes = np.sort(ordem_itens[np.repeat(revalidar_grupo, tamanhos)])
+    novos = validar_itens(df_itens.iloc[posicoes], cabecalho, posicoes_itens=posicoes)
+
+    print(f"   ♻️ {int(inalteradas.sum()):,} notas reaproveitadas, "
+          f"{len(notas) - int(inalteradas.sum()):,} validadas ({len(novos):,} itens)")
+
+    # Notas inalteradas: resultados gravados, com as posições dos itens neste arquivo
+    if inalteradas.any():
+        nota_de_cada_item = identificacao[inalteradas].get_indexer(identificacao_anteriores)
+        reusados = anteriores[nota_de_cada_item >= 0]
+        nota_de_cada_item = nota_de_cada_item[nota_de_cada_item >= 0]
+        inicios = notas['inicio_itens'].to_numpy()[inalteradas][nota_de_cada_item]
+        indices_ordem = inicios + reusados['ordem_na_nota'].to_numpy(dtype=np.int64)
+        reusados = reusados.assign(posicao_item=ordem_itens[indices_ordem]).sort_values('posicao_item')
+    else:
+        reusados = None
+
+    resumo = ResumoValidacao()
+    resumo.acumular(novos)
+    if reusados is not None:
+        resumo_reusados = ResumoValidacao()
+        resumo_reusados.acumular(reusados)
+        resumo.combinar(resumo_reusados)
+
+    # Nada mudou desde a última validação: o arquivo gravado continua valendo
+    if inalteradas.all() and reusados is not None and len(reusados) == len(anteriores):
+        return resumo
+
+    # Grava o estado atual: só notas com cabeçalho e identificação única (as demais são sempre validadas)
+    novos = novos[novos['possui_cabecalho'].to_numpy()]
+    linha_da_nota = notas.index.get_indexer(novos['numero_nota'])
+    novos, linha_da_nota = novos[unicas[linha_da_nota]], linha_da_nota[unicas[linha_da_nota]]
+    novos = novos.assign(
+        chave_acesso=notas['chave_acesso'].to_numpy()[linha_da_nota],
+        hash_nota=hashes[linha_da_nota],
+        ordem_na_nota=ordem_na_nota[novos['posicao_item'].to_numpy()]
+    )
+    partes = [novos] if reusados is None else [reusados, novos]
+    repositorio.gravar(pd.concat(partes, ignore_index=True).drop(columns='posicao_item'))
+
+    return resumo